@@ -0,0 +1,6 @@
+"""
+Benchmarks that need neither OS data nor a GPU
+
+``synthetic`` generates road networks, households and POIs, ``run`` times the
+pipeline on them and ``import_time`` checks the cost of ``import ukroutes``.
+"""
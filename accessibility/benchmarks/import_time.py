@@ -0,0 +1,80 @@
+"""
+Check that ``import ukroutes`` stays cheap
+
+    python benchmarks/import_time.py --budget 0.1
+
+Each run imports the package in a fresh interpreter, started in an empty
+folder, and the best of ``--repeat`` runs is compared with the budget (seconds,
+not counting interpreter start up). The import must also leave the GPU stack
+unloaded and create no files, such as a log. Exits with status 1 if any check
+fails, so it can gate CI.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+GPU_MODULES = ("cudf", "cugraph", "cupy")
+# seconds ``import ukroutes`` may take; tests/test_import.py allows a margin
+BUDGET = 0.1
+
+PROBE = """
+import json, sys, time
+t1 = time.perf_counter()
+import {module}
+seconds = time.perf_counter() - t1
+gpu = sorted({{m.split(".")[0] for m in sys.modules}} & set({gpu!r}))
+print(json.dumps({{"seconds": seconds, "gpu": gpu}}))
+"""
+
+
+def time_import(module: str = "ukroutes") -> tuple[float, list[str], list[str]]:
+    """Seconds to import ``module``, GPU modules it loaded and files it created"""
+    with tempfile.TemporaryDirectory() as folder:
+        env = os.environ | {"PYTHONPATH": os.pathsep.join([str(ROOT), *sys.path])}
+        result = subprocess.run(
+            [sys.executable, "-c", PROBE.format(module=module, gpu=GPU_MODULES)],
+            cwd=folder,
+            env=env,
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        probe = json.loads(result.stdout)
+        return probe["seconds"], probe["gpu"], sorted(os.listdir(folder))
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--module", default="ukroutes")
+    parser.add_argument("--budget", type=float, default=BUDGET, help="seconds")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    runs = [time_import(args.module) for _ in range(args.repeat)]
+    best = min(seconds for seconds, _, _ in runs)
+    gpu = sorted({m for _, loaded, _ in runs for m in loaded})
+    files = sorted({f for _, _, created in runs for f in created})
+
+    print(f"import {args.module}: {best * 1000:.1f} ms (budget {args.budget * 1000:.0f} ms)")
+    failures = []
+    if best > args.budget:
+        failures.append("over budget")
+    if gpu:
+        failures.append(f"loaded {', '.join(gpu)}")
+    if files:
+        failures.append(f"created {', '.join(files)}")
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
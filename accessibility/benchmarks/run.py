@@ -0,0 +1,258 @@
+"""
+Benchmark the routing pipeline on a synthetic network
+
+    python -m benchmarks.run --kind planar --nodes 1e5 --households 5e4 --pois 200 \
+        --output benchmarks/results/planar_1e5.json
+
+Runs the preprocessing and routing stages in order on a generated network (see
+``benchmarks.synthetic``) and reports the wall time and peak resident memory
+after each stage, and the routing throughput, as JSON. Generation is seeded, so
+runs with the same settings can be compared across commits and machines.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import tempfile
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+
+import numpy as np
+import scipy
+
+from benchmarks import synthetic
+from ukroutes.metrics import peak_rss_mb
+
+
+def _git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=Path(__file__).parent,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Timer:
+    """Wall time and peak RSS at the end of each stage"""
+
+    def __init__(self):
+        self.stages: dict[str, dict[str, float]] = {}
+
+    @contextmanager
+    def stage(self, name: str):
+        t1 = time.perf_counter()
+        yield
+        self.stages[name] = {
+            "seconds": time.perf_counter() - t1,
+            # ru_maxrss only rises, so this is the peak up to the end of the stage
+            "peak_rss_mb": peak_rss_mb(),
+            "peak_rss_children_mb": peak_rss_mb(resource.RUSAGE_CHILDREN),
+        }
+
+    def seconds(self, name: str) -> float:
+        return self.stages[name]["seconds"]
+
+
+def run(
+    kind: str = "planar",
+    n_nodes: int = 10_000,
+    n_households: int | None = None,
+    n_pois: int | None = None,
+    backend: str = "cpu",
+    mode: str = "fit",
+    search: str = "bounded",
+    snap_k: int = 2,
+    topk: int = 3,
+    n_jobs: int | None = 1,
+    tile_size: float | None = None,
+    seed: int = 0,
+) -> dict:
+    """
+    Run every stage once and return the results
+
+    Parameters
+    ----------
+    kind : str
+        ``"grid"`` or ``"planar"`` network
+    n_nodes : int
+        Network size, from 10^3 to 10^7
+    n_households, n_pois : int, optional
+        Number of origins and destinations, by default half the nodes and one
+        POI per 1,000 nodes (at least 10)
+    mode : str
+        ``"fit"``, ``"nearest"`` or ``"partitioned"`` (``Routing.fit_partitioned``
+        with ``tile_size``, cpu only)
+
+    Returns
+    -------
+    dict:
+        Settings, environment, per-stage ``seconds`` and peak RSS, throughput
+        in POIs and households per second of routing and the routing summary
+        of ``RunMetrics``
+    """
+    from ukroutes.backends import get_backend
+    from ukroutes.graph import CSRGraph
+    from ukroutes.preprocessing import combine_subgraphs
+    from ukroutes.process_routing import add_to_graph, add_topk
+    from ukroutes.routing import Routing
+
+    n_households = n_households if n_households is not None else n_nodes // 2
+    n_pois = n_pois if n_pois is not None else max(10, n_nodes // 1_000)
+    timer = Timer()
+
+    with timer.stage("generate"):
+        nodes, edges = synthetic.network(kind, n_nodes, seed=seed)
+        households = synthetic.households(nodes, n_households, seed=seed + 1)
+        pois = synthetic.pois(nodes, n_pois, seed=seed + 2)
+    n_edges = len(edges)
+
+    with timer.stage("combine_subgraphs"):
+        nodes, edges = combine_subgraphs(nodes, edges)
+
+    with timer.stage("graph_store"), tempfile.TemporaryDirectory() as folder:
+        CSRGraph.from_frames(edges, nodes).save(Path(folder) / "csr")
+        CSRGraph.load(Path(folder) / "csr")
+
+    with timer.stage("add_to_graph_pois"):
+        pois, nodes, edges = add_to_graph(pois, nodes, edges, 1)
+    with timer.stage("add_to_graph_households"):
+        households, nodes, edges = add_to_graph(households, nodes, edges, snap_k)
+
+    top_nodes = None
+    with timer.stage("add_topk"):
+        if mode != "nearest":
+            pois, top_nodes = add_topk(pois, households, topk)
+
+    if backend == "cugraph":
+        import cudf
+
+        nodes, edges = cudf.DataFrame(nodes), cudf.DataFrame(edges)
+        pois, households = cudf.DataFrame(pois), cudf.DataFrame(households)
+    with timer.stage("backend"):
+        graph = get_backend(backend)(edges=edges, nodes=nodes, weights="time_weighted")
+
+    routing = Routing(
+        name="benchmark",
+        edges=edges,
+        nodes=nodes,
+        outputs=households,
+        inputs=pois,
+        weights="time_weighted",
+        backend=graph,
+        n_jobs=n_jobs,
+        secondary=("length",),
+        search=search,
+        top_nodes=top_nodes,
+    )
+    with timer.stage("route"):
+        if mode == "nearest":
+            routing.fit_nearest()
+        elif mode == "partitioned":
+            routing.fit_partitioned(tile_size=tile_size or 10_000)
+        else:
+            routing.fit()
+    reached = len(routing.distances)
+
+    route_seconds = timer.seconds("route")
+    return {
+        "settings": {
+            "kind": kind,
+            "nodes": n_nodes,
+            "edges": n_edges,
+            "households": n_households,
+            "pois": n_pois,
+            "pois_routed": len(pois),
+            "backend": backend,
+            "mode": mode,
+            "search": search,
+            "snap_k": snap_k,
+            "topk": topk,
+            "n_jobs": routing.n_jobs,
+            "tile_size": tile_size,
+            "seed": seed,
+        },
+        "environment": {
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "scipy": scipy.__version__,
+            "machine": platform.machine(),
+            "cpus": os.cpu_count(),
+        },
+        "stages": timer.stages,
+        "throughput": {
+            "pois_per_s": len(pois) / route_seconds,
+            "households_per_s": n_households / route_seconds,
+            "snapped_households_per_s": n_households
+            / timer.seconds("add_to_graph_households"),
+        },
+        "reached": reached,
+        # per-stage totals and the slowest POIs from Routing's own metrics
+        "routing": routing.metrics.summary(pois["id"].to_numpy()),
+        "peak_rss_mb": max(stage["peak_rss_mb"] for stage in timer.stages.values()),
+    }
+
+
+def _count(value: str) -> int:
+    # accepts 1e5 as well as 100000
+    return int(float(value))
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--kind", choices=["grid", "planar"], default="planar")
+    parser.add_argument("--nodes", type=_count, default=10_000)
+    parser.add_argument("--households", type=_count)
+    parser.add_argument("--pois", type=_count)
+    parser.add_argument("--backend", choices=["cpu", "cugraph"], default="cpu")
+    parser.add_argument(
+        "--mode", choices=["fit", "nearest", "partitioned"], default="fit"
+    )
+    parser.add_argument("--search", choices=["bounded", "buffer"], default="bounded")
+    parser.add_argument("--snap-k", type=int, default=2)
+    parser.add_argument("--topk", type=int, default=3)
+    parser.add_argument("--n-jobs", type=int, default=1)
+    parser.add_argument("--tile-size", type=float)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--output", type=Path, help="JSON file to write, printed if not given"
+    )
+    args = parser.parse_args(argv)
+
+    result = run(
+        kind=args.kind,
+        n_nodes=args.nodes,
+        n_households=args.households,
+        n_pois=args.pois,
+        backend=args.backend,
+        mode=args.mode,
+        search=args.search,
+        snap_k=args.snap_k,
+        topk=args.topk,
+        n_jobs=args.n_jobs,
+        tile_size=args.tile_size,
+        seed=args.seed,
+    )
+    text = json.dumps(result, indent=2)
+    if args.output:
+        args.output.parent.mkdir(parents=True, exist_ok=True)
+        args.output.write_text(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+"""
+Deterministic synthetic road networks, households and POIs
+
+Frames have the same columns as the outputs of ``process_os`` (nodes with
+``node_id``, ``easting`` and ``northing``; edges with ``start_node``,
+``end_node``, ``time_weighted`` and ``length``), in British National Grid metres,
+so every stage of the pipeline can be run on them. The same ``seed`` always
+gives the same network.
+"""
+
+from __future__ import annotations
+
+import numpy as np
+import pandas as pd
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import minimum_spanning_tree
+from scipy.spatial import Delaunay
+
+# speed (mph, as in preprocessing._speed_estimate) and share of links, roughly
+# that of OS Open Roads: motorways, A and B dual carriageways, single
+# carriageway A and B roads, unclassified roads, local roads and tracks
+SPEED_MIX = {67: 0.005, 57: 0.02, 45: 0.005, 25: 0.13, 24: 0.45, 10: 0.37, 5: 0.02}
+# mean degree of OS Open Roads nodes, which are junctions and dead ends
+MEAN_DEGREE = 2.6
+# south west corner of the synthetic area
+ORIGIN = (100_000.0, 100_000.0)
+
+
+def _edges(
+    rng: np.random.Generator,
+    easting: np.ndarray,
+    northing: np.ndarray,
+    start: np.ndarray,
+    end: np.ndarray,
+) -> pd.DataFrame:
+    # roads wind, so links are somewhat longer than the straight line
+    line = np.hypot(easting[end] - easting[start], northing[end] - northing[start])
+    length = line * (1 + rng.lognormal(mean=-2.5, sigma=0.8, size=len(line)))
+    speed = rng.choice(
+        list(SPEED_MIX), size=len(line), p=list(SPEED_MIX.values())
+    ) * 1.609344
+    return pd.DataFrame(
+        {
+            "start_node": start,
+            "end_node": end,
+            "time_weighted": (length / 1000) / speed * 60,
+            "length": length,
+        }
+    )
+
+
+def _nodes(easting: np.ndarray, northing: np.ndarray) -> pd.DataFrame:
+    return pd.DataFrame(
+        {"node_id": np.arange(len(easting)), "easting": easting, "northing": northing}
+    )
+
+
+def grid_network(
+    n_nodes: int, spacing: float = 150.0, keep: float = 0.65, seed: int = 0
+) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Jittered grid with a random share of its links removed
+
+    Cheap at any scale, up to 10^7 nodes. Keeping 65% of the links of a grid
+    gives a mean degree of about 2.6 with dead ends and small islands, as in the
+    real network.
+    """
+    rng = np.random.default_rng(seed)
+    side = int(np.ceil(np.sqrt(n_nodes)))
+    idx = np.arange(n_nodes)
+    row, col = np.divmod(idx, side)
+    easting = ORIGIN[0] + (col + rng.uniform(-0.3, 0.3, n_nodes)) * spacing
+    northing = ORIGIN[1] + (row + rng.uniform(-0.3, 0.3, n_nodes)) * spacing
+
+    right = idx[(col < side - 1) & (idx + 1 < n_nodes)]
+    up = idx[idx + side < n_nodes]
+    start = np.concatenate([right, up])
+    end = np.concatenate([right + 1, up + side])
+    kept = rng.random(len(start)) < keep
+    return _nodes(easting, northing), _edges(
+        rng, easting, northing, start[kept], end[kept]
+    )
+
+
+def planar_network(
+    n_nodes: int,
+    spacing: float = 150.0,
+    mean_degree: float = MEAN_DEGREE,
+    seed: int = 0,
+) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Random planar network from the Delaunay triangulation of random points
+
+    The minimum spanning tree of the triangulation makes one connected network
+    with many dead ends, then the shortest remaining triangle sides are added
+    until ``mean_degree`` is reached. Node density varies across the area, like
+    towns and countryside. Triangulation is the slow part, so prefer
+    ``grid_network`` beyond about 10^6 nodes.
+    """
+    rng = np.random.default_rng(seed)
+    side = np.sqrt(n_nodes) * spacing
+    # a few dense centres over a sparser background
+    n_centres = max(1, n_nodes // 50_000)
+    centres = rng.uniform(0, side, (n_centres, 2))
+    clustered = rng.random(n_nodes) < 0.6
+    points = rng.uniform(0, side, (n_nodes, 2))
+    points[clustered] = centres[
+        rng.integers(0, n_centres, clustered.sum())
+    ] + rng.normal(0, side / (4 * np.sqrt(n_centres)), (clustered.sum(), 2))
+    # points pushed out of the area go back to the background
+    outside = ((points < 0) | (points > side)).any(axis=1)
+    points[outside] = rng.uniform(0, side, (outside.sum(), 2))
+    easting, northing = ORIGIN[0] + points[:, 0], ORIGIN[1] + points[:, 1]
+
+    simplices = Delaunay(points).simplices.astype(np.int64)
+    pairs = np.concatenate(
+        [simplices[:, [0, 1]], simplices[:, [1, 2]], simplices[:, [0, 2]]]
+    )
+    pairs = np.unique(np.sort(pairs, axis=1), axis=0)
+    line = np.hypot(*(points[pairs[:, 0]] - points[pairs[:, 1]]).T)
+
+    # the spanning tree is made of triangle sides, found again by their key
+    tree = minimum_spanning_tree(
+        coo_matrix(
+            (line + 1e-9, (pairs[:, 0], pairs[:, 1])), shape=(n_nodes, n_nodes)
+        )
+    ).tocoo()
+    low = np.minimum(tree.row, tree.col).astype(np.int64)
+    high = np.maximum(tree.row, tree.col).astype(np.int64)
+    in_tree = np.zeros(len(pairs), dtype=bool)
+    keys = pairs[:, 0] * n_nodes + pairs[:, 1]
+    in_tree[np.searchsorted(keys, low * n_nodes + high)] = True
+
+    extra = int(max(mean_degree * n_nodes / 2 - in_tree.sum(), 0))
+    rest = np.flatnonzero(~in_tree)
+    chosen = np.concatenate(
+        [np.flatnonzero(in_tree), rest[np.argsort(line[rest])[:extra]]]
+    )
+    return _nodes(easting, northing), _edges(
+        rng, easting, northing, pairs[chosen, 0], pairs[chosen, 1]
+    )
+
+
+def network(
+    kind: str, n_nodes: int, seed: int = 0
+) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """Nodes and edges of a ``"grid"`` or ``"planar"`` network"""
+    if kind == "grid":
+        return grid_network(n_nodes, seed=seed)
+    if kind == "planar":
+        return planar_network(n_nodes, seed=seed)
+    raise ValueError(f"Unknown network kind {kind!r}, expected 'grid' or 'planar'")
+
+
+def households(
+    nodes: pd.DataFrame, n: int, spread: float = 30.0, seed: int = 1
+) -> pd.DataFrame:
+    """
+    Households set back from the road, several to a node as along a street
+
+    Nodes are drawn at random and each household placed ``spread`` metres
+    (standard deviation) from its node.
+    """
+    rng = np.random.default_rng(seed)
+    at = rng.integers(0, len(nodes), n)
+    return pd.DataFrame(
+        {
+            "TOID": [f"osgb{i:013d}" for i in range(n)],
+            "easting": nodes["easting"].to_numpy()[at] + rng.normal(0, spread, n),
+            "northing": nodes["northing"].to_numpy()[at] + rng.normal(0, spread, n),
+        }
+    )
+
+
+def pois(nodes: pd.DataFrame, n: int, seed: int = 2) -> pd.DataFrame:
+    """Destinations, such as green space access points, scattered over the network"""
+    rng = np.random.default_rng(seed)
+    at = rng.choice(len(nodes), n, replace=n > len(nodes))
+    return pd.DataFrame(
+        {
+            "id": np.arange(n),
+            "easting": nodes["easting"].to_numpy()[at] + rng.normal(0, 100, n),
+            "northing": nodes["northing"].to_numpy()[at] + rng.normal(0, 100, n),
+        }
+    )
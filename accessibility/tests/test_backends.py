@@ -0,0 +1,159 @@
+"""
+Routing backends and modes give the same distances
+
+In the ``network`` fixture every POI is made one of the nearest POIs of every
+household, so each output's minimum over the POIs routed is its distance to the
+nearest POI on the whole network, which SciPy computes directly in one
+multi-source search. The ``local`` fixture keeps the usual three nearest POIs,
+so searches stay small and partitioned routing has to get its halo right.
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+from scipy import sparse
+from scipy.sparse import csgraph
+
+from benchmarks import synthetic
+from ukroutes.process_routing import add_to_graph, add_topk
+from ukroutes.routing import Routing
+
+WEIGHTS = "time_weighted"
+
+
+def build_network(topk):
+    nodes, edges = synthetic.network("planar", 400, seed=0)
+    households = synthetic.households(nodes, 200, seed=1)
+    pois = synthetic.pois(nodes, 8, seed=2)
+    pois, nodes, edges = add_to_graph(pois, nodes, edges, 1)
+    households, nodes, edges = add_to_graph(households, nodes, edges, 2)
+    pois, top_nodes = add_topk(pois, households, topk or len(pois))
+    return nodes, edges, households, pois, top_nodes
+
+
+@pytest.fixture(scope="module")
+def network():
+    return build_network(None)
+
+
+@pytest.fixture(scope="module")
+def local():
+    return build_network(3)
+
+
+def route(network, mode="fit", backend="cpu", tile_size=None, **kwargs):
+    """Sorted pandas ``distances`` of one routing run"""
+    nodes, edges, households, pois, top_nodes = network
+    frames = edges, nodes, households, pois
+    if backend == "cugraph":
+        cudf = pytest.importorskip("cudf")
+        frames = [cudf.DataFrame(frame) for frame in frames]
+    edges, nodes, households, pois = frames
+    routing = Routing(
+        name="test",
+        edges=edges,
+        nodes=nodes,
+        outputs=households,
+        inputs=pois,
+        weights=WEIGHTS,
+        backend=backend,
+        top_nodes=top_nodes,
+        **kwargs,
+    )
+    if mode == "nearest":
+        routing.fit_nearest()
+    elif mode == "partitioned":
+        routing.fit_partitioned(tile_size=tile_size)
+    else:
+        routing.fit()
+    distances = routing.distances
+    if hasattr(distances, "to_pandas"):
+        distances = distances.to_pandas()
+    return distances.sort_values("vertex", ignore_index=True)
+
+
+def assert_same(result, expected, secondary=()):
+    np.testing.assert_array_equal(result["vertex"], expected["vertex"])
+    for column in ("distance", *secondary):
+        np.testing.assert_allclose(result[column], expected[column], rtol=1e-9)
+    np.testing.assert_array_equal(result["source"], expected["source"])
+
+
+def dijkstra_nearest(nodes, edges, sources):
+    """Distance from every node to its nearest source, and that source"""
+    n = int(nodes["node_id"].max()) + 1
+    # the lightest of any parallel edges, held once per pair
+    low = np.minimum(edges["start_node"], edges["end_node"])
+    high = np.maximum(edges["start_node"], edges["end_node"])
+    pairs = (
+        pd.DataFrame({"low": low, "high": high, "weight": edges[WEIGHTS]})
+        .groupby(["low", "high"], as_index=False)["weight"]
+        .min()
+    )
+    matrix = sparse.csr_matrix(
+        (pairs["weight"], (pairs["low"], pairs["high"])), shape=(n, n)
+    )
+    distance, _, source = csgraph.dijkstra(
+        matrix,
+        directed=False,
+        indices=np.unique(sources),
+        min_only=True,
+        return_predecessors=True,
+    )
+    return distance, source
+
+
+def check_distances(distances, network):
+    nodes, edges, households, pois, _ = network
+    expected, source = dijkstra_nearest(nodes, edges, pois["node_id"].to_numpy())
+
+    vertex = distances["vertex"].to_numpy()
+    np.testing.assert_array_equal(vertex, np.unique(households["node_id"]))
+    np.testing.assert_allclose(distances["distance"], expected[vertex], rtol=1e-9)
+    np.testing.assert_array_equal(distances["source"], source[vertex])
+
+
+@pytest.mark.parametrize("search", ["bounded", "buffer"])
+@pytest.mark.parametrize("n_jobs", [1, 2])
+def test_cpu_backend_matches_dijkstra(network, search, n_jobs):
+    # a buffer covering the whole network, so subgraphs lose no routes
+    distances = route(
+        network, backend="cpu", min_buffer=100_000, n_jobs=n_jobs, search=search
+    )
+    check_distances(distances, network)
+
+
+@pytest.mark.parametrize("search", ["bounded", "buffer"])
+def test_cugraph_backend_matches_dijkstra(network, search):
+    pytest.importorskip("cugraph")
+    distances = route(network, backend="cugraph", min_buffer=100_000, search=search)
+    check_distances(distances, network)
+
+
+@pytest.mark.parametrize("backend", ["cpu", "cugraph"])
+@pytest.mark.parametrize("secondary", [(), ("length",)])
+def test_fit_nearest_matches_fit(network, backend, secondary):
+    if backend == "cugraph":
+        pytest.importorskip("cugraph")
+    kwargs = {"backend": backend, "secondary": secondary, "n_jobs": 1}
+    expected = route(network, "fit", search="bounded", **kwargs)
+    result = route(network, "nearest", **kwargs)
+    assert_same(result, expected, secondary)
+
+
+@pytest.mark.parametrize(
+    "search, settings",
+    [
+        # subgraphs of a few hundred metres, so the halo is the buffer
+        ("buffer", {"min_buffer": 250}),
+        # a cutoff of a few minutes, so the halo is the distance it allows
+        ("bounded", {"cutoff": 3}),
+    ],
+)
+def test_fit_partitioned_matches_fit(local, search, settings):
+    kwargs = {"search": search, "secondary": ("length",), "n_jobs": 2, **settings}
+    expected = route(local, "fit", **kwargs)
+    result = route(local, "partitioned", tile_size=500, **kwargs)
+    # each tile is routed on only part of the network
+    assert len(np.unique(np.floor(local[3][["easting", "northing"]] / 500), axis=0)) > 1
+    assert_same(result, expected, ("length",))
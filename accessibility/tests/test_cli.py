@@ -0,0 +1,38 @@
+"""
+Routing from the memory mapped graph store matches routing from frames
+"""
+
+import numpy as np
+import pytest
+
+from benchmarks import synthetic
+from ukroutes.cli import route_tiers
+from ukroutes.graph import CSRGraph
+
+
+@pytest.mark.parametrize("mode", ["fit", "nearest"])
+@pytest.mark.parametrize("snap_tolerance", [None, 1.0])
+def test_route_tiers_from_graph_store(tmp_path, mode, snap_tolerance):
+    nodes, edges = synthetic.network("planar", 1_000, seed=0)
+    households = synthetic.households(nodes, 300, seed=1)
+    tiers = {
+        "near": synthetic.pois(nodes, 5, seed=2),
+        "far": synthetic.pois(nodes, 12, seed=3),
+    }
+    CSRGraph.from_frames(edges, nodes).save(tmp_path / "csr")
+    store = CSRGraph.load(tmp_path / "csr")
+
+    settings = {
+        "weights": ("time_weighted", "length"),
+        "secondary": ("length",),
+        "backend": "cpu",
+        "mode": mode,
+        "snap_tolerance": snap_tolerance,
+        "n_jobs": 1,
+    }
+    expected = route_tiers(tiers, households, nodes, edges, **settings)
+    result = route_tiers(tiers, households, store.nodes(), store, **settings)
+
+    assert list(result.columns) == list(expected.columns)
+    for column in expected.columns.drop("TOID"):
+        np.testing.assert_allclose(result[column], expected[column], rtol=1e-9)
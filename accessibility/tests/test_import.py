@@ -0,0 +1,43 @@
+"""
+Importing ukroutes is cheap and has no side effects
+
+Each import runs in a fresh interpreter in an empty folder (see
+``benchmarks/import_time.py``). The strict time budget is checked by that
+script; here the time only has to stay well within it, so a busy machine does
+not fail the suite, and the check is skipped if ``UKROUTES_SKIP_IMPORT_TIME``
+is set.
+"""
+
+import os
+
+import pytest
+
+from benchmarks.import_time import BUDGET, time_import
+
+# times the budget allowed before the test fails
+MARGIN = 10
+
+
+@pytest.mark.parametrize(
+    "module",
+    [
+        "ukroutes",
+        "ukroutes.routing",
+        "ukroutes.backends.cpu",
+        "ukroutes.cli",
+        "ukroutes.flood",
+    ],
+)
+def test_import_leaves_gpu_stack_unloaded(module):
+    _, gpu, files = time_import(module)
+    assert gpu == []
+    assert files == []
+
+
+@pytest.mark.skipif(
+    bool(os.environ.get("UKROUTES_SKIP_IMPORT_TIME")),
+    reason="UKROUTES_SKIP_IMPORT_TIME is set",
+)
+def test_import_ukroutes_time():
+    seconds = min(time_import("ukroutes")[0] for _ in range(3))
+    assert seconds <= MARGIN * BUDGET
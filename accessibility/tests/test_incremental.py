@@ -0,0 +1,81 @@
+"""
+Incremental rerouting after a POI change matches routing the new set afresh
+
+Runs on a grid with links removed, so some households are on islands no POI
+can reach.
+"""
+
+import numpy as np
+import pytest
+
+from benchmarks import synthetic
+from ukroutes.backends import get_backend
+from ukroutes.process_routing import add_to_graph
+from ukroutes.routing import Routing, diff_inputs
+
+WEIGHTS = "time_weighted"
+
+
+@pytest.fixture(scope="module")
+def grid():
+    nodes, edges = synthetic.network("grid", 900, seed=0)
+    households = synthetic.households(nodes, 300, seed=1)
+    pois = synthetic.pois(nodes, 30, seed=2)
+    pois, nodes, edges = add_to_graph(pois, nodes, edges, 1)
+    households, nodes, edges = add_to_graph(households, nodes, edges, 2)
+    backend = get_backend("cpu")(edges=edges, nodes=nodes, weights=WEIGHTS)
+    return backend, households, pois
+
+
+def nearest(backend, households, pois, input_id):
+    routing = Routing(
+        name="test",
+        edges=None,
+        nodes=None,
+        outputs=households,
+        inputs=pois,
+        weights=WEIGHTS,
+        backend=backend,
+        input_id=input_id,
+        secondary=("length",),
+    )
+    routing.fit_nearest()
+    return routing
+
+
+@pytest.mark.parametrize("input_id", ["node_id", "id"])
+@pytest.mark.parametrize(
+    "old_rows, new_rows",
+    [
+        (slice(0, 20), slice(0, 30)),  # added
+        (slice(0, 30), slice(10, 30)),  # removed
+        (slice(0, 20), slice(5, 30)),  # both
+    ],
+)
+def test_fit_incremental_matches_fit_nearest(grid, input_id, old_rows, new_rows):
+    backend, households, pois = grid
+    old, new = pois.iloc[old_rows], pois.iloc[new_rows]
+    previous = nearest(backend, households, old, input_id).distances
+    added, removed = diff_inputs(old, new, input_id)
+    assert len(added) + len(removed) > 0
+
+    routing = Routing(
+        name="test",
+        edges=None,
+        nodes=None,
+        outputs=households,
+        inputs=new,
+        weights=WEIGHTS,
+        backend=backend,
+        input_id=input_id,
+        secondary=("length",),
+    )
+    routing.fit_incremental(previous, added=added, removed=removed)
+    expected = nearest(backend, households, new, input_id).distances
+
+    result = routing.distances.sort_values("vertex")
+    expected = expected.sort_values("vertex")
+    np.testing.assert_array_equal(result["vertex"], expected["vertex"])
+    np.testing.assert_allclose(result["distance"], expected["distance"], rtol=1e-9)
+    np.testing.assert_allclose(result["length"], expected["length"], rtol=1e-9)
+    np.testing.assert_array_equal(result["source"], expected["source"])
@@ -1 +1,11 @@
-from .routing import Routing
+__all__ = ["Routing"]
+
+
+def __getattr__(name: str):
+    # Routing pulls in pandas and SciPy, so it is only imported on first use and
+    # ``import ukroutes`` stays cheap for tools that need none of it
+    if name == "Routing":
+        from ukroutes.routing import Routing
+
+        return Routing
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
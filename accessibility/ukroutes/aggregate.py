@@ -0,0 +1,124 @@
+from __future__ import annotations
+
+import numpy as np
+import pandas as pd
+
+
+def gather(vertex, values, node_ids) -> np.ndarray:
+    """
+    Values of ``node_ids`` from a routed ``vertex`` to value mapping
+
+    The routed vertices are scattered into one dense array indexed by node id,
+    so any number of households (or lookup rows) is a single gather, with
+    ``NaN`` for nodes that were not reached and for negative ``node_ids``.
+    """
+    vertex = np.asarray(vertex, dtype=np.int64)
+    node_ids = np.asarray(node_ids, dtype=np.int64)
+    size = max(vertex.max(initial=-1), node_ids.max(initial=-1)) + 1
+    dense = np.full(size, np.nan)
+    dense[vertex] = values
+    return np.where(node_ids >= 0, dense[node_ids], np.nan)
+
+
+def _quantile(
+    ordered: np.ndarray, start: np.ndarray, count: np.ndarray, q: float
+) -> np.ndarray:
+    # linear interpolation between order statistics, as np.quantile does
+    pos = start + q * np.maximum(count - 1, 0)
+    low = np.floor(pos).astype(np.int64)
+    high = np.ceil(pos).astype(np.int64)
+    if len(ordered) == 0:
+        return np.full(len(start), np.nan)
+    low = np.minimum(low, len(ordered) - 1)
+    high = np.minimum(high, len(ordered) - 1)
+    value = ordered[low] + (ordered[high] - ordered[low]) * (pos - np.floor(pos))
+    return np.where(count > 0, value, np.nan)
+
+
+def group_statistics(
+    values: np.ndarray,
+    codes: np.ndarray,
+    n_groups: int,
+    percentiles: tuple[float, ...] = (),
+    threshold: float | None = None,
+) -> dict[str, np.ndarray]:
+    """
+    Mean, median, percentiles and share within ``threshold`` of every group
+
+    One sort by group then value puts each group's values in order, with
+    missing (``NaN``) values last, so every statistic is read from the sorted
+    array by offset without a Python loop over groups. Missing values are left
+    out of the mean, median and percentiles, and count as beyond the
+    ``threshold`` in the share within it.
+    """
+    values = np.asarray(values, dtype=float)
+    order = np.lexsort((values, codes))
+    ordered = values[order]
+    present = ~np.isnan(values)
+
+    size = np.bincount(codes, minlength=n_groups)
+    count = np.bincount(codes[present], minlength=n_groups)
+    start = np.concatenate([[0], np.cumsum(size)[:-1]])
+    total = np.bincount(codes[present], weights=values[present], minlength=n_groups)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        stats = {
+            "mean": total / count,
+            "median": _quantile(ordered, start, count, 0.5),
+        }
+        for p in percentiles:
+            stats[f"p{p:g}"] = _quantile(ordered, start, count, p / 100)
+        if threshold is not None:
+            within = np.bincount(
+                codes, weights=present & (values <= threshold), minlength=n_groups
+            )
+            stats[f"within_{threshold:g}"] = within / size
+    return stats
+
+
+def area_statistics(
+    values: dict[str, np.ndarray],
+    areas,
+    area_id: str = "area",
+    percentiles: tuple[float, ...] = (10, 25, 75, 90),
+    thresholds: dict[str, float] | None = None,
+) -> pd.DataFrame:
+    """
+    Summary statistics of routed distances for each small area
+
+    Parameters
+    ----------
+    values : dict[str, np.ndarray]
+        Distances by column name, one value per row of ``areas``. Repeat a
+        household once per address to weight it by its addresses.
+    areas : array-like
+        Area code of each row, e.g. the LSOA of each household
+    area_id : str
+        Name of the area code column in the output
+    percentiles : tuple[float, ...]
+        Percentiles (0 to 100) reported besides the mean and median
+    thresholds : dict[str, float], optional
+        Distance by column name for the share of rows within it
+
+    Returns
+    -------
+    pd.DataFrame:
+        One row per area with its number of rows (``households``) and a
+        ``{column}_{statistic}`` column per statistic, e.g.
+        ``all_time_weighted_median`` or ``all_time_weighted_within_15``
+    """
+    thresholds = thresholds or {}
+    codes, names = pd.factorize(np.asarray(areas), sort=True)
+    # rows without an area are left out
+    keep = codes >= 0
+    codes = codes[keep]
+    out = {area_id: names, "households": np.bincount(codes, minlength=len(names))}
+    for column, value in values.items():
+        stats = group_statistics(
+            np.asarray(value)[keep],
+            codes,
+            len(names),
+            percentiles,
+            thresholds.get(column),
+        )
+        out |= {f"{column}_{name}": stat for name, stat in stats.items()}
+    return pd.DataFrame(out)
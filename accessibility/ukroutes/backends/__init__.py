@@ -0,0 +1,25 @@
+import importlib
+
+# backends are imported on demand so the GPU stack is only loaded when selected
+BACKENDS = {
+    "cugraph": "ukroutes.backends.gpu:CuGraphBackend",
+    "cpu": "ukroutes.backends.cpu:CPUBackend",
+}
+
+
+def get_backend(name: str):
+    """
+    Return the routing backend class registered under ``name``
+
+    Parameters
+    ----------
+    name : str
+        One of ``BACKENDS``: ``"cugraph"`` (GPU, RAPIDS) or ``"cpu"`` (NumPy/SciPy)
+    """
+    try:
+        module, cls = BACKENDS[name].split(":")
+    except KeyError:
+        raise ValueError(
+            f"Unknown routing backend {name!r}, expected one of {list(BACKENDS)}"
+        ) from None
+    return getattr(importlib.import_module(module), cls)
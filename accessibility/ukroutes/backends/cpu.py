@@ -0,0 +1,299 @@
+from __future__ import annotations
+
+from typing import NamedTuple
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from scipy.sparse import csgraph
+
+from ukroutes.graph import (
+    CSRGraph,
+    GridIndex,
+    csr_from_coo,
+    gather_rows,
+    row_tree_totals,
+    tree_totals,
+    weight_per_metre,
+)
+
+
+class SubGraph(NamedTuple):
+    matrix: sparse.csr_matrix
+    vertices: np.ndarray  # local index -> node id
+    buffer: float
+    rows: np.ndarray  # node id of each extracted entry
+    pos: np.ndarray  # position of each extracted entry in the full matrix
+    entries: np.ndarray  # full matrix position of each subgraph matrix entry
+
+
+class CPUBackend:
+    """
+    CPU routing with NumPy/SciPy
+
+    The road network is held as a single CSR matrix built once from the edge
+    list, subgraphs are slices of its rows and shortest paths use SciPy's
+    Dijkstra. The graph is read-only after construction, so POIs can be routed
+    in forked worker processes that share it copy-on-write.
+    """
+
+    name = "cpu"
+    xdf = pd
+    xp = np
+    processes = True
+
+    def __init__(
+        self,
+        edges=None,
+        nodes=None,
+        weights: str = "time_weighted",
+        graph: CSRGraph | None = None,
+    ):
+        self.weights: str = weights
+        # a graph opened with CSRGraph.load is used as is, memory mapped; every
+        # edge attribute is kept so any can be summed along routes
+        self.graph: CSRGraph = (
+            graph
+            if graph is not None
+            else CSRGraph.from_frames(
+                edges,
+                nodes,
+                weights=tuple(
+                    col
+                    for col in edges.columns
+                    if col not in ("start_node", "end_node")
+                ),
+            )
+        )
+        self.matrix: sparse.csr_matrix = self.graph.matrix(weights)
+        self.n_nodes: int = self.graph.n_nodes
+        self.easting: np.ndarray = self.graph.easting
+        self.northing: np.ndarray = self.graph.northing
+        self.index: GridIndex = GridIndex(
+            np.arange(self.graph.n_nodes), self.graph.easting, self.graph.northing
+        )
+
+        # for bounded searches: component labels so targets that can never be
+        # reached are skipped, and the lowest weight per metre of straight line,
+        # which turns the distance to a target into a lower bound on its weight
+        _, self.components = csgraph.connected_components(self.matrix, directed=False)
+        self.per_metre: float = weight_per_metre(
+            np.repeat(np.arange(self.n_nodes), np.diff(self.matrix.indptr)),
+            self.matrix.indices,
+            self.matrix.data,
+            self.graph.easting,
+            self.graph.northing,
+        )
+        positive = self.matrix.data[self.matrix.data > 0]
+        self.min_weight: float = float(positive.min()) if len(positive) else 1.0
+
+    def sub_graph(
+        self,
+        easting: float,
+        northing: float,
+        buffer: float,
+        previous: SubGraph | None = None,
+    ) -> SubGraph:
+        """
+        All edges with at least one end within ``buffer`` of the point
+
+        The rows of the CSR matrix are the node to edge index, so only the nodes
+        found by the grid index are touched. When growing a ``previous`` subgraph
+        only the ring of nodes beyond its buffer is added.
+        """
+        inner = 0.0 if previous is None else previous.buffer
+        nodes = self.index.query(easting, northing, buffer, inner=inner)
+        pos = gather_rows(self.matrix.indptr, nodes)
+        rows = np.repeat(nodes, np.diff(self.matrix.indptr)[nodes])
+        if previous is not None:
+            pos = np.concatenate([previous.pos, pos])
+            rows = np.concatenate([previous.rows, rows])
+        cols = self.matrix.indices[pos].astype(np.int64)
+
+        vertices = np.unique(np.concatenate([rows, cols]))
+        indptr, indices, order = csr_from_coo(
+            np.searchsorted(vertices, rows),
+            np.searchsorted(vertices, cols),
+            len(vertices),
+        )
+        matrix = sparse.csr_matrix(
+            (self.matrix.data[pos[order]], indices, indptr),
+            shape=(len(vertices), len(vertices)),
+        )
+        return SubGraph(matrix, vertices, buffer, rows, pos, pos[order])
+
+    def size(self, sub_graph: SubGraph) -> tuple[int, int]:
+        """Number of nodes and of (undirected) edges in the subgraph"""
+        matrix = sub_graph.matrix
+        # edges between two extracted rows are held in both directions
+        extracted = np.diff(matrix.indptr) > 0
+        return len(sub_graph.vertices), int(
+            matrix.nnz - extracted[matrix.indices].sum() // 2
+        )
+
+    def _local_ids(self, sub_graph: SubGraph, vertices) -> np.ndarray:
+        vertices = np.asarray(vertices, dtype=np.int64)
+        idx = np.searchsorted(sub_graph.vertices, vertices)
+        idx[idx >= len(sub_graph.vertices)] = 0
+        return np.where(sub_graph.vertices[idx] == vertices, idx, -1)
+
+    def in_main_component(self, sub_graph: SubGraph, vertices: list[int]) -> bool:
+        """Whether all ``vertices`` are in the largest connected component"""
+        if len(sub_graph.vertices) == 0:
+            return False
+        _, labels = csgraph.connected_components(sub_graph.matrix, directed=False)
+        largest = np.bincount(labels).argmax()
+        local = self._local_ids(sub_graph, vertices)
+        return bool((local >= 0).all() and (labels[local] == largest).all())
+
+    def _totals(
+        self,
+        matrix: sparse.csr_matrix,
+        entries: np.ndarray,
+        predecessors: np.ndarray,
+        secondary: tuple[str, ...],
+    ) -> dict[str, np.ndarray]:
+        if not secondary:
+            return {}
+        rows = np.repeat(np.arange(matrix.shape[0]), np.diff(matrix.indptr))
+        return tree_totals(
+            predecessors,
+            rows,
+            matrix.indices,
+            matrix.data,
+            {name: self.graph.weights[name][entries] for name in secondary},
+        )
+
+    def sssp(
+        self,
+        sub_graph: SubGraph,
+        source: int,
+        cutoff: float | None,
+        secondary: tuple[str, ...] = (),
+    ) -> tuple[np.ndarray, np.ndarray, dict[str, np.ndarray]]:
+        """
+        Node ids reached from ``source``, their distances and the ``secondary``
+        edge attributes summed along each shortest path
+        """
+        (local,) = self._local_ids(sub_graph, [source])
+        if local < 0:
+            return (
+                np.empty(0, dtype=np.int64),
+                np.empty(0),
+                {name: np.empty(0) for name in secondary},
+            )
+        dist, predecessors = csgraph.dijkstra(
+            sub_graph.matrix,
+            directed=False,
+            indices=local,
+            limit=np.inf if cutoff is None else cutoff,
+            return_predecessors=True,
+        )
+        reached = np.flatnonzero(np.isfinite(dist))
+        totals = self._totals(
+            sub_graph.matrix, sub_graph.entries, predecessors, secondary
+        )
+        return (
+            sub_graph.vertices[reached],
+            dist[reached],
+            {name: total[reached] for name, total in totals.items()},
+        )
+
+    def nearest(
+        self,
+        sources: np.ndarray,
+        cutoff: float | None,
+        secondary: tuple[str, ...] = (),
+    ) -> tuple[np.ndarray, np.ndarray, np.ndarray, dict[str, np.ndarray]]:
+        """Multi-source search from all ``sources``, recording which one reached each node"""
+        sources = np.unique(np.asarray(sources, dtype=np.int64))
+        # every edge is stored both ways, so a directed search covers both directions
+        dist, predecessors, source = csgraph.dijkstra(
+            self.matrix,
+            directed=True,
+            indices=sources,
+            limit=np.inf if cutoff is None else cutoff,
+            min_only=True,
+            return_predecessors=True,
+        )
+        reached = np.flatnonzero(np.isfinite(dist))
+        return reached, dist[reached], source[reached], self._row_totals(
+            predecessors, reached, secondary
+        )
+
+    def _row_totals(
+        self, predecessors: np.ndarray, reached: np.ndarray, secondary: tuple[str, ...]
+    ) -> dict[str, np.ndarray]:
+        if not secondary:
+            return {}
+        return row_tree_totals(
+            self.matrix.indptr,
+            self.matrix.indices,
+            self.matrix.data,
+            predecessors,
+            reached,
+            {name: self.graph.weights[name] for name in secondary},
+        )
+
+    def _initial_limit(self, source: int, targets: np.ndarray) -> float:
+        """Lower bound on the distance to the furthest target"""
+        easting, northing = self.easting, self.northing
+        line = np.hypot(
+            easting[targets] - easting[source], northing[targets] - northing[source]
+        )
+        line = line[np.isfinite(line)]
+        bound = self.per_metre * line.max() if len(line) else 0.0
+        return bound if bound > 0 else self.min_weight
+
+    def bounded_sssp(
+        self,
+        source: int,
+        targets,
+        cutoff: float | None,
+        secondary: tuple[str, ...] = (),
+    ) -> tuple[np.ndarray, np.ndarray, dict[str, np.ndarray], int]:
+        """
+        Shortest paths from ``source`` on the full graph until ``targets`` are reached
+
+        SciPy's Dijkstra settles nodes in order of distance and stops at
+        ``limit``, so no subgraph is needed: the search starts with a limit
+        that cannot be beyond the furthest target and doubles it until every
+        target in the same component as ``source`` is settled, or ``cutoff`` is
+        hit. Distances are exact on the full network.
+
+        Returns
+        -------
+        tuple:
+            Node ids reached, their distances, the ``secondary`` totals and the
+            number of times the limit was raised
+        """
+        cutoff = np.inf if cutoff is None else cutoff
+        targets = np.asarray(targets, dtype=np.int64)
+        if not 0 <= source < self.n_nodes:
+            return np.empty(0, dtype=np.int64), np.empty(0), {
+                name: np.empty(0) for name in secondary
+            }, 0
+        targets = targets[(targets >= 0) & (targets < self.n_nodes)]
+        targets = targets[self.components[targets] == self.components[source]]
+
+        limit = min(self._initial_limit(source, targets), cutoff)
+        escalations = 0
+        while True:
+            dist, predecessors = csgraph.dijkstra(
+                self.matrix,
+                directed=True,
+                indices=source,
+                limit=limit,
+                return_predecessors=True,
+            )
+            if limit >= cutoff or np.isfinite(dist[targets]).all():
+                break
+            limit = min(limit * 2, cutoff)
+            escalations += 1
+        reached = np.flatnonzero(np.isfinite(dist))
+        return (
+            reached,
+            dist[reached],
+            self._row_totals(predecessors, reached, secondary),
+            escalations,
+        )
@@ -0,0 +1,331 @@
+from __future__ import annotations
+
+import warnings
+from typing import NamedTuple
+
+import cudf
+import cugraph
+import cupy as cp
+import numpy as np
+
+from ukroutes.graph import (
+    GridIndex,
+    gather_rows,
+    incidence,
+    path_totals,
+    weight_per_metre,
+)
+
+
+class SubGraph(NamedTuple):
+    graph: cugraph.Graph
+    buffer: float
+    edge_ids: np.ndarray  # rows of road_edges in the subgraph
+    edges: cudf.DataFrame
+
+
+class CuGraphBackend:
+    """GPU routing with RAPIDS cudf/cugraph"""
+
+    name = "cugraph"
+    xdf = cudf
+    xp = cp
+    # the GPU is shared by the whole process, so POIs are routed serially
+    processes = False
+
+    def __init__(
+        self,
+        edges: cudf.DataFrame,
+        nodes: cudf.DataFrame,
+        weights: str = "time_weighted",
+    ):
+        self.road_edges: cudf.DataFrame = edges
+        self.road_nodes: cudf.DataFrame = nodes
+        self.weights: str = weights
+
+        with warnings.catch_warnings():
+            warnings.simplefilter(action="ignore", category=FutureWarning)
+            self.graph = cugraph.Graph()
+            self.graph.from_cudf_edgelist(
+                self.road_edges,
+                source="start_node",
+                destination="end_node",
+                edge_attr=self.weights,
+                renumber=False,
+            )
+
+        # host side indexes so subgraph extraction never scans the whole network
+        start = self.road_edges["start_node"].to_numpy()
+        end = self.road_edges["end_node"].to_numpy()
+        node_ids = self.road_nodes["node_id"].to_numpy()
+        self.n_nodes: int = int(max(start.max(), end.max(), node_ids.max())) + 1
+        self.edge_indptr, self.edge_ids = incidence(start, end, self.n_nodes)
+        self.index: GridIndex = GridIndex(
+            node_ids,
+            self.road_nodes["easting"].to_numpy(),
+            self.road_nodes["northing"].to_numpy(),
+        )
+
+        # for bounded searches: component labels so targets that can never be
+        # reached are skipped, and the lowest weight per metre of straight line,
+        # which turns the distance to a target into a lower bound on its weight
+        with warnings.catch_warnings():
+            warnings.simplefilter(action="ignore", category=FutureWarning)
+            components = cugraph.connected_components(self.graph)
+        self.components = np.full(self.n_nodes, -1, dtype=np.int64)
+        self.components[components["vertex"].to_numpy()] = components[
+            "labels"
+        ].to_numpy()
+        self.easting = np.full(self.n_nodes, np.nan)
+        self.northing = np.full(self.n_nodes, np.nan)
+        self.easting[node_ids] = self.road_nodes["easting"].to_numpy()
+        self.northing[node_ids] = self.road_nodes["northing"].to_numpy()
+        weight = self.road_edges[self.weights].to_numpy()
+        self.per_metre: float = weight_per_metre(
+            start, end, weight, self.easting, self.northing
+        )
+        positive = weight[weight > 0]
+        self.min_weight: float = float(positive.min()) if len(positive) else 1.0
+        self._lightest: dict[tuple[str, ...], cudf.DataFrame] = {}
+
+    def sub_graph(
+        self,
+        easting: float,
+        northing: float,
+        buffer: float,
+        previous: SubGraph | None = None,
+    ) -> SubGraph:
+        """
+        All edges with at least one end within ``buffer`` of the point
+
+        Nodes come from the grid index and their edges from the node to edge
+        index, so only the extracted rows are gathered from ``road_edges``.
+        When growing a ``previous`` subgraph only the ring beyond its buffer is
+        looked up.
+        """
+        inner = 0.0 if previous is None else previous.buffer
+        nodes = self.index.query(easting, northing, buffer, inner=inner)
+        edge_ids = self.edge_ids[gather_rows(self.edge_indptr, nodes)]
+        if previous is not None:
+            edge_ids = np.concatenate([previous.edge_ids, edge_ids])
+        edge_ids = np.unique(edge_ids)
+        edges_subset = self.road_edges.take(edge_ids)
+
+        with warnings.catch_warnings():
+            warnings.simplefilter(action="ignore", category=FutureWarning)
+            graph = cugraph.Graph()
+            graph.from_cudf_edgelist(
+                edges_subset,
+                source="start_node",
+                destination="end_node",
+                edge_attr=self.weights,
+            )
+        return SubGraph(graph, buffer, edge_ids, edges_subset)
+
+    def size(self, sub_graph: SubGraph) -> tuple[int, int]:
+        """Number of nodes and of edges in the subgraph"""
+        return int(sub_graph.graph.number_of_vertices()), len(sub_graph.edge_ids)
+
+    def in_main_component(self, sub_graph: SubGraph, vertices: list[int]) -> bool:
+        """Whether all ``vertices`` are in the largest connected component"""
+        with warnings.catch_warnings():
+            warnings.simplefilter(action="ignore", category=FutureWarning)
+            components = cugraph.connected_components(sub_graph.graph)
+        largest_component_label = components["labels"].mode()[0]
+        largest_component_nodes = components[
+            components["labels"] == largest_component_label
+        ]["vertex"]
+        return bool(cudf.Series(vertices).isin(largest_component_nodes).all())
+
+    def _lightest_edges(
+        self, edges: cudf.DataFrame, secondary: tuple[str, ...]
+    ) -> cudf.DataFrame:
+        """Lightest edge for each ordered node pair, the one a search relaxes"""
+        cols = ["start_node", "end_node", self.weights, *secondary]
+        both = cudf.concat(
+            [
+                edges[cols],
+                edges[cols].rename(
+                    columns={"start_node": "end_node", "end_node": "start_node"}
+                ),
+            ]
+        )
+        return both.sort_values(self.weights).drop_duplicates(["start_node", "end_node"])
+
+    def _totals(
+        self, both: cudf.DataFrame, spaths: cudf.DataFrame, secondary: tuple[str, ...]
+    ) -> dict[str, cp.ndarray]:
+        """Secondary edge attributes summed along the sssp tree, in ``spaths`` order"""
+        tree = spaths[["vertex", "predecessor"]].reset_index(drop=True)
+        tree["pos"] = cp.arange(len(tree))
+        parents = tree[["vertex", "pos"]].rename(
+            columns={"vertex": "predecessor", "pos": "parent"}
+        )
+        tree = (
+            tree.merge(parents, on="predecessor", how="left")
+            .merge(
+                both,
+                left_on=["predecessor", "vertex"],
+                right_on=["start_node", "end_node"],
+                how="left",
+            )
+            .sort_values("pos")
+        )
+        parent = tree["parent"].fillna(tree["pos"]).astype("int64").values
+        return {
+            name: path_totals(parent, tree[name].fillna(0).values) for name in secondary
+        }
+
+    def sssp(
+        self,
+        sub_graph: SubGraph,
+        source: int,
+        cutoff: float | None,
+        secondary: tuple[str, ...] = (),
+    ) -> tuple[cp.ndarray, cp.ndarray, dict[str, cp.ndarray]]:
+        """
+        Node ids reached from ``source``, their distances and the ``secondary``
+        edge attributes summed along each shortest path
+        """
+        with warnings.catch_warnings():
+            warnings.simplefilter(action="ignore", category=FutureWarning)
+            spaths = cugraph.filter_unreachable(
+                cugraph.sssp(sub_graph.graph, source=source, cutoff=cutoff)
+            )
+        totals = (
+            self._totals(
+                self._lightest_edges(sub_graph.edges, secondary), spaths, secondary
+            )
+            if secondary
+            else {}
+        )
+        return spaths["vertex"].values, spaths["distance"].values, totals
+
+    def _full_totals(
+        self, spaths: cudf.DataFrame, secondary: tuple[str, ...]
+    ) -> dict[str, cp.ndarray]:
+        if not secondary:
+            return {}
+        # the full edge table is only reduced once per set of attributes
+        if secondary not in self._lightest:
+            self._lightest[secondary] = self._lightest_edges(self.road_edges, secondary)
+        return self._totals(self._lightest[secondary], spaths, secondary)
+
+    def bounded_sssp(
+        self,
+        source: int,
+        targets,
+        cutoff: float | None,
+        secondary: tuple[str, ...] = (),
+    ) -> tuple[cp.ndarray, cp.ndarray, dict[str, cp.ndarray], int]:
+        """
+        Shortest paths from ``source`` on the full graph until ``targets`` are reached
+
+        The sssp ``cutoff`` is used as a search limit that starts at a lower
+        bound on the distance to the furthest target and doubles until every
+        target in the same component as ``source`` is reached, or ``cutoff`` is
+        hit, so no subgraph is built. Distances are exact on the full network.
+
+        Returns
+        -------
+        tuple:
+            Node ids reached, their distances, the ``secondary`` totals and the
+            number of times the limit was raised
+        """
+        cutoff = np.inf if cutoff is None else cutoff
+        targets = np.asarray(targets, dtype=np.int64)
+        targets = targets[(targets >= 0) & (targets < self.n_nodes)]
+        if 0 <= source < self.n_nodes:
+            targets = targets[self.components[targets] == self.components[source]]
+            line = np.hypot(
+                self.easting[targets] - self.easting[source],
+                self.northing[targets] - self.northing[source],
+            )
+            line = line[np.isfinite(line)]
+        else:
+            targets, line = targets[:0], np.empty(0)
+        bound = self.per_metre * line.max() if len(line) else 0.0
+        limit = min(bound if bound > 0 else self.min_weight, cutoff)
+
+        escalations = 0
+        while True:
+            with warnings.catch_warnings():
+                warnings.simplefilter(action="ignore", category=FutureWarning)
+                spaths = cugraph.filter_unreachable(
+                    cugraph.sssp(self.graph, source=source, cutoff=limit)
+                )
+            if (
+                limit >= cutoff
+                or cudf.Series(targets).isin(spaths["vertex"]).all()
+            ):
+                break
+            limit = min(limit * 2, cutoff)
+            escalations += 1
+        return (
+            spaths["vertex"].values,
+            spaths["distance"].values,
+            self._full_totals(spaths, secondary),
+            escalations,
+        )
+
+    def nearest(
+        self,
+        sources,
+        cutoff: float | None,
+        secondary: tuple[str, ...] = (),
+    ) -> tuple[cp.ndarray, cp.ndarray, cp.ndarray, dict[str, cp.ndarray]]:
+        """Multi-source search from all ``sources``, recording which one reached each node"""
+        dtype = self.road_edges["start_node"].dtype
+        sources = cudf.Series(sources).unique().astype(dtype)
+        # a virtual root joined to every source by a zero weight edge turns the
+        # multi-source search into a single sssp from the root
+        root = (
+            max(
+                int(self.road_edges["start_node"].max()),
+                int(self.road_edges["end_node"].max()),
+                int(sources.max()),
+            )
+            + 1
+        )
+        virtual_edges = cudf.DataFrame(
+            {
+                "start_node": cudf.Series(cp.full(len(sources), root), dtype=dtype),
+                "end_node": sources,
+                self.weights: cp.zeros(len(sources)),
+            }
+        )
+        edges = self.road_edges[["start_node", "end_node", self.weights]]
+        with warnings.catch_warnings():
+            warnings.simplefilter(action="ignore", category=FutureWarning)
+            graph = cugraph.Graph()
+            graph.from_cudf_edgelist(
+                cudf.concat([edges, virtual_edges]),
+                source="start_node",
+                destination="end_node",
+                edge_attr=self.weights,
+                renumber=False,
+            )
+            spaths = cugraph.filter_unreachable(
+                cugraph.sssp(graph, source=root, cutoff=cutoff)
+            )
+        totals = self._full_totals(spaths, secondary)
+
+        # follow predecessors up to the source each vertex hangs from
+        parent = cp.arange(root + 1)
+        parent[spaths["vertex"].values] = spaths["predecessor"].values
+        parent[sources.values] = sources.values
+        parent[root] = root
+        while True:
+            grandparent = parent[parent]
+            if (grandparent == parent).all():
+                break
+            parent = grandparent
+
+        real = (spaths["vertex"] != root).values
+        vertex = spaths["vertex"].values[real]
+        return (
+            vertex,
+            spaths["distance"].values[real],
+            parent[vertex],
+            {name: total[real] for name, total in totals.items()},
+        )
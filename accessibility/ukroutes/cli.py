@@ -0,0 +1,479 @@
+"""
+Route households to several destination sets in one run
+
+    python -m ukroutes.cli --tier all=data/processed/osgsl/osgsl_all.parquet \
+        --tier doorstop=data/processed/osgsl/osgsl_doorstop.parquet \
+        --weights time_weighted length --backend cpu
+
+The road network is loaded and the households snapped to it once, then every
+destination set (tier) is routed for every weight in the same process. The
+result is one wide table with a ``{tier}_{weight}`` column per combination, plus
+``{tier}_{weight}_{secondary}`` for attributes summed along the same routes, e.g.
+``--weights time_weighted --secondary length`` gives the time and the distance of
+the quickest route from one pass.
+
+With ``--areas lookup.parquet`` the distances are summarised per small area
+(e.g. LSOA) straight from the routing results instead, writing one row per area
+and no per-household table. Otherwise ``--partition-by lad22cd`` writes the table
+as Parquet partitioned by local authority, and ``--uprn-lookup`` adds a copy with
+a row per UPRN (see ``ukroutes.output``).
+"""
+
+from __future__ import annotations
+
+import argparse
+import time
+from pathlib import Path
+
+import pandas as pd
+
+from ukroutes.aggregate import area_statistics, gather
+from ukroutes.backends import get_backend
+from ukroutes.common.logger import logger, setup_logging
+from ukroutes.common.utils import Paths
+from ukroutes.graph import CSRGraph
+from ukroutes.output import fan_out, write_results
+from ukroutes.process_routing import add_to_graph, add_topk
+from ukroutes.routing import Routing
+
+GREENSPACE_TIERS = {
+    tier: Paths.PROCESSED / "osgsl" / f"osgsl_{tier}.parquet"
+    for tier in [
+        "all",
+        "doorstop",
+        "local",
+        "neighbourhood",
+        "wider",
+        "district",
+        "subregional",
+    ]
+}
+
+
+def _to_pandas(df) -> pd.DataFrame:
+    return df.to_pandas() if hasattr(df, "to_pandas") else df
+
+
+def load_graph(backend: str = "cugraph"):
+    """
+    Processed OS road nodes and edges for ``backend``
+
+    Read from the graph store when ``process_os`` has written one, falling back
+    to the parquet files. For the ``cpu`` backend the store is returned as the
+    memory mapped ``CSRGraph`` in place of the edges, so the network is never
+    expanded into an edge list; ``route_tiers`` adds the connectors to it
+    directly. The GPU backend needs frames, so cugraph gets the store's edges.
+    """
+    store = (Paths.OS_GRAPH_STORE / "manifest.json").exists()
+    if backend == "cpu" and store:
+        graph = CSRGraph.load(Paths.OS_GRAPH_STORE)
+        return graph.nodes(), graph
+    if backend == "cugraph":
+        import cudf as xdf
+    else:
+        xdf = pd
+    if store:
+        nodes, edges = CSRGraph.load(Paths.OS_GRAPH_STORE).to_frames()
+    else:
+        nodes = pd.read_parquet(Paths.OS_GRAPH / "nodes.parquet")
+        edges = pd.read_parquet(Paths.OS_GRAPH / "edges.parquet")
+    return xdf.DataFrame(nodes), xdf.DataFrame(edges)
+
+
+def route_tiers(
+    tiers: dict[str, pd.DataFrame],
+    households: pd.DataFrame,
+    nodes,
+    edges,
+    weights: tuple[str, ...] = ("time_weighted", "length"),
+    secondary: tuple[str, ...] = (),
+    household_id: str = "TOID",
+    backend: str = "cugraph",
+    mode: str = "fit",
+    search: str = "bounded",
+    snap_k: int = 2,
+    snap_tolerance: float | None = None,
+    topk: int = 3,
+    min_buffer: int = 5_000,
+    max_buffer: int = 500_000,
+    cutoffs: dict[str, float] | None = None,
+    n_jobs: int | None = None,
+    tile_size: float | None = None,
+    areas: pd.DataFrame | None = None,
+    area_id: str = "lsoa21cd",
+    percentiles: tuple[float, ...] = (10, 25, 75, 90),
+    thresholds: dict[str, float] | None = None,
+    reports: Path | None = None,
+) -> pd.DataFrame:
+    """
+    Route households to every destination set for every weight
+
+    Parameters
+    ----------
+    tiers : dict[str, pd.DataFrame]
+        Destination sets by name, each with ``easting`` and ``northing``
+    households : pd.DataFrame
+        Origins with ``household_id``, ``easting`` and ``northing``
+    nodes, edges : DataFrame
+        Road network from ``load_graph``. For the ``cpu`` backend ``edges`` may
+        be a ``CSRGraph``, e.g. the memory mapped graph store, which the
+        household and destination connectors are merged into once and every
+        weight then routes on, rather than building a graph from frames per
+        weight. The merged graph is an in-memory copy.
+    weights : tuple[str, ...]
+        Edge weights to route on, one output column each per tier
+    secondary : tuple[str, ...]
+        Edge attributes summed along the shortest path of each weight, e.g.
+        ``("length",)`` with ``weights=("time_weighted",)``
+    mode : str
+        ``"fit"`` for the per-POI buffered search or ``"nearest"`` for a single
+        multi-source pass per tier
+    search : str
+        How ``fit`` limits each search, ``"bounded"`` or ``"buffer"`` (see
+        ``Routing``)
+    snap_k : int
+        Road nodes each household is linked to
+    snap_tolerance : float, optional
+        Share one connector between households snapping to the same road nodes
+        at offsets within this many metres (see ``add_to_graph``), adding each
+        household's own offset back to its distances. Exact for ``snap_k=1`` or
+        a tolerance of 0; lossy for ``snap_k>=2`` with a tolerance above 0.
+    topk : int
+        Nearest destinations (by straight line) each household is matched to by
+        ``add_topk``, which each destination's search must then reach (``fit``
+        only)
+    cutoffs : dict[str, float], optional
+        Maximum distance per weight, e.g. ``{"time_weighted": 60}``
+    tile_size : float, optional
+        Route ``fit`` in tiles of this many metres with
+        ``Routing.fit_partitioned`` (``cpu`` backend only)
+    areas : pd.DataFrame, optional
+        Lookup from ``household_id`` to ``area_id``, with a row per address to
+        weight households by their addresses. Given this, per-area statistics
+        are returned instead of the per-household table (see
+        ``area_statistics``)
+    percentiles : tuple[float, ...]
+        Percentiles reported per area besides the mean and median
+    thresholds : dict[str, float], optional
+        Per area share of households within this distance, by weight or
+        secondary attribute, e.g. ``{"time_weighted": 15}``
+    reports : Path, optional
+        Folder for a run report per tier and weight, ``{tier}_{weight}.parquet``
+        with the timings and subgraph sizes of every destination (``fit`` only)
+
+    Returns
+    -------
+    pd.DataFrame:
+        One row per household with a ``{tier}_{weight}`` column per combination
+        and a ``{tier}_{weight}_{secondary}`` column per secondary attribute, or
+        with ``areas`` one row per area with statistics of those columns
+    """
+    cutoffs = cutoffs or {}
+    thresholds = thresholds or {}
+
+    # every tier is linked to the network by a single edge, so its nodes are dead
+    # ends that cannot shortcut routes for the other tiers
+    base = edges if isinstance(edges, CSRGraph) else None
+    if base is not None:
+        # collect only the connector edges, to merge into the graph below
+        edges = pd.DataFrame(
+            {name: pd.Series(dtype="int64") for name in ("start_node", "end_node")}
+            | {name: pd.Series(dtype=float) for name in base.weights}
+        )
+    tiers = dict(tiers)
+    for tier, destinations in tiers.items():
+        tiers[tier], nodes, edges = add_to_graph(destinations.copy(), nodes, edges, 1)
+    households, nodes, edges = add_to_graph(
+        households.copy(),
+        nodes,
+        edges,
+        snap_k,
+        dedup=snap_tolerance is not None,
+        tolerance=snap_tolerance or 0.0,
+    )
+
+    # the rows results are gathered for: households, or lookup rows with the node
+    # (and offsets) of their household
+    rows = households
+    if areas is not None:
+        rows = areas[[household_id, area_id]].merge(
+            households[
+                [household_id, "node_id"]
+                + [c for c in households.columns if c.startswith("offset_")]
+            ],
+            on=household_id,
+            how="left",
+        )
+    node_ids = rows["node_id"].fillna(-1).to_numpy(dtype="int64")
+    if base is not None:
+        t1 = time.time()
+        base = base.with_edges(edges, nodes)
+        nodes = edges = None
+        logger.debug(f"Connectors added to graph in {time.time() - t1:.1f} seconds.")
+    columns, metric = {}, {}
+    for weight in weights:
+        t1 = time.time()
+        graph = (
+            get_backend(backend)(weights=weight, graph=base)
+            if base is not None
+            else get_backend(backend)(edges=edges, nodes=nodes, weights=weight)
+        )
+        logger.debug(f"Graph for {weight} built in {time.time() - t1:.1f} seconds.")
+        for tier, destinations in tiers.items():
+            top_nodes = None
+            if mode == "fit":
+                destinations, top_nodes = add_topk(destinations, households, topk)
+            routing = Routing(
+                name=f"{tier}_{weight}",
+                edges=edges,
+                nodes=nodes,
+                outputs=households,
+                inputs=destinations,
+                weights=weight,
+                min_buffer=min_buffer,
+                max_buffer=max_buffer,
+                cutoff=cutoffs.get(weight),
+                backend=graph,
+                n_jobs=n_jobs,
+                secondary=tuple(name for name in secondary if name != weight),
+                search=search,
+                top_nodes=top_nodes,
+                report=(
+                    Path(reports) / f"{tier}_{weight}.parquet" if reports else None
+                ),
+            )
+            if mode == "nearest":
+                routing.fit_nearest()
+            elif tile_size:
+                routing.fit_partitioned(tile_size=tile_size)
+            else:
+                routing.fit()
+            distances = _to_pandas(routing.distances)
+            for name in (weight, *routing.secondary):
+                column = f"{tier}_{weight}" + ("" if name == weight else f"_{name}")
+                value = "distance" if name == weight else name
+                columns[column] = gather(
+                    distances["vertex"], distances[value], node_ids
+                ) + _offset(rows, name)
+                metric[column] = name
+
+    if areas is None:
+        return households[[household_id]].assign(**columns)
+    return area_statistics(
+        columns,
+        rows[area_id],
+        area_id=area_id,
+        percentiles=percentiles,
+        thresholds={
+            column: thresholds[name]
+            for column, name in metric.items()
+            if name in thresholds
+        },
+    )
+
+
+def _offset(rows: pd.DataFrame, name: str):
+    """Distance from each household to its shared connector node, if deduplicated"""
+    column = f"offset_{name}"
+    return rows[column].to_numpy() if column in rows.columns else 0.0
+
+
+def _named_path(value: str) -> tuple[str, Path]:
+    name, _, path = value.partition("=")
+    if not path:
+        raise argparse.ArgumentTypeError(f"expected NAME=PATH, got {value!r}")
+    return name, Path(path)
+
+
+def _named_float(value: str) -> tuple[str, float]:
+    name, _, number = value.partition("=")
+    try:
+        return name, float(number)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected WEIGHT=VALUE, got {value!r}")
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument(
+        "--tier",
+        type=_named_path,
+        action="append",
+        metavar="NAME=PATH",
+        help="destination parquet to route to, repeatable (default: all greenspace tiers)",
+    )
+    parser.add_argument(
+        "--households",
+        type=Path,
+        default=Paths.PROCESSED / "toids_cm_osgb.parquet",
+    )
+    parser.add_argument("--household-id", default="TOID")
+    parser.add_argument(
+        "--weights", nargs="+", default=["time_weighted", "length"]
+    )
+    parser.add_argument(
+        "--secondary",
+        nargs="+",
+        default=[],
+        help="edge attributes summed along each weight's routes, e.g. length",
+    )
+    parser.add_argument(
+        "--cutoff",
+        type=_named_float,
+        action="append",
+        default=[],
+        metavar="WEIGHT=VALUE",
+        help="maximum distance for a weight, e.g. time_weighted=60",
+    )
+    parser.add_argument("--backend", choices=["cugraph", "cpu"], default="cugraph")
+    parser.add_argument("--mode", choices=["fit", "nearest"], default="fit")
+    parser.add_argument("--search", choices=["bounded", "buffer"], default="bounded")
+    parser.add_argument("--snap-k", type=int, default=2)
+    parser.add_argument(
+        "--snap-tolerance",
+        type=float,
+        help="share connectors between households snapping to the same road nodes "
+        "at offsets within this many metres; exact with --snap-k 1 or a tolerance "
+        "of 0, lossy with --snap-k 2 or more and a tolerance above 0, where "
+        "shortcuts through merged connectors are lost",
+    )
+    parser.add_argument(
+        "--topk",
+        type=int,
+        default=3,
+        help="nearest destinations matched to each household (fit only)",
+    )
+    parser.add_argument("--min-buffer", type=int, default=5_000)
+    parser.add_argument("--max-buffer", type=int, default=500_000)
+    parser.add_argument("--n-jobs", type=int)
+    parser.add_argument(
+        "--tile-size",
+        type=float,
+        help="route in tiles of this many metres across --n-jobs workers (cpu only)",
+    )
+    parser.add_argument(
+        "--areas",
+        type=Path,
+        help="household to area lookup parquet, to write per-area statistics instead",
+    )
+    parser.add_argument("--area-id", default="lsoa21cd")
+    parser.add_argument(
+        "--percentiles", nargs="+", type=float, default=[10, 25, 75, 90]
+    )
+    parser.add_argument(
+        "--threshold",
+        type=_named_float,
+        action="append",
+        default=[],
+        metavar="NAME=VALUE",
+        help="per area share within a distance, e.g. time_weighted=15",
+    )
+    parser.add_argument(
+        "--partition-by",
+        help="write households as parquet partitioned by this column, e.g. lad22cd",
+    )
+    parser.add_argument(
+        "--partition-lookup",
+        type=Path,
+        help="household to --partition-by lookup parquet, if not in --households",
+    )
+    parser.add_argument(
+        "--uprn-lookup",
+        type=Path,
+        help="TOID to UPRN lookup parquet, to also write results per UPRN",
+    )
+    parser.add_argument(
+        "--uprn-output",
+        type=Path,
+        default=Paths.OUT_DATA / "uprn_greenspace",
+    )
+    parser.add_argument(
+        "--reports",
+        type=Path,
+        help="folder for per-destination routing timings, one parquet per tier",
+    )
+    parser.add_argument(
+        "--output",
+        type=Path,
+        help="parquet, csv if the suffix is .csv, or a folder with --partition-by "
+        "(default: data/out/distances_greenspace.parquet, or "
+        "areas_greenspace.parquet with --areas)",
+    )
+    args = parser.parse_args(argv)
+    setup_logging()
+    output = args.output or Paths.OUT_DATA / (
+        "areas_greenspace.parquet" if args.areas else "distances_greenspace.parquet"
+    )
+
+    tiers = {
+        name: pd.read_parquet(path)
+        for name, path in (args.tier or GREENSPACE_TIERS.items())
+    }
+    households = pd.read_parquet(args.households)
+    nodes, edges = load_graph(args.backend)
+
+    out = route_tiers(
+        tiers,
+        households,
+        nodes,
+        edges,
+        weights=args.weights,
+        secondary=args.secondary,
+        household_id=args.household_id,
+        backend=args.backend,
+        mode=args.mode,
+        search=args.search,
+        snap_k=args.snap_k,
+        snap_tolerance=args.snap_tolerance,
+        topk=args.topk,
+        min_buffer=args.min_buffer,
+        max_buffer=args.max_buffer,
+        cutoffs=dict(args.cutoff),
+        n_jobs=args.n_jobs,
+        tile_size=args.tile_size,
+        areas=(
+            pd.read_parquet(args.areas, columns=[args.household_id, args.area_id])
+            if args.areas
+            else None
+        ),
+        area_id=args.area_id,
+        percentiles=tuple(args.percentiles),
+        thresholds=dict(args.threshold),
+        reports=args.reports,
+    )
+    if args.partition_by and not args.areas:
+        # the partition column goes with both the household and the UPRN tables
+        lookup = (
+            pd.read_parquet(args.partition_lookup)
+            if args.partition_lookup
+            else households
+        )
+        out = out.merge(
+            lookup[[args.household_id, args.partition_by]].drop_duplicates(
+                args.household_id
+            ),
+            on=args.household_id,
+            how="left",
+        )
+        output = output.with_suffix("")
+        write_results(
+            out, output, partition_by=args.partition_by, household_id=args.household_id
+        )
+    elif output.suffix == ".csv":
+        out.to_csv(output, index=False)
+    else:
+        out.to_parquet(output, index=False)
+    logger.info(f"Distances for {len(tiers)} tiers saved to {output}")
+
+    if args.uprn_lookup and not args.areas:
+        fan_out(
+            out,
+            args.uprn_lookup,
+            args.uprn_output,
+            household_id=args.household_id,
+            partition_by=args.partition_by,
+        )
+
+
+if __name__ == "__main__":
+    main()
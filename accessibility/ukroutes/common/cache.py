@@ -0,0 +1,142 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import shutil
+import time
+from collections.abc import Callable, Iterable
+from pathlib import Path
+
+from ukroutes.common.logger import logger
+
+
+def _sha256(file: Path) -> str:
+    sha = hashlib.sha256()
+    with open(file, "rb") as f:
+        while block := f.read(1 << 20):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+class StageCache:
+    """
+    Outputs of pipeline stages stored under a hash of their inputs
+
+    A stage declares the files it reads, its parameters and the earlier stages
+    it uses. Its key hashes the content of those files, the parameters and the
+    outputs of the earlier stages, and its outputs are written to
+    ``root / name / key``. Rerunning with unchanged inputs reuses that folder.
+    As keys follow the outputs of earlier stages rather than their keys, a
+    stage that is rerun but gives the same result leaves later stages cached.
+    """
+
+    def __init__(self, root: Path, force: Iterable[str] = ()):
+        self.root: Path = Path(root)
+        self.force: set[str] = set(force)
+        self.timings: dict[str, float] = {}
+        self._memo_file: Path = self.root / "digests.json"
+        self._memo: dict = (
+            json.loads(self._memo_file.read_text()) if self._memo_file.exists() else {}
+        )
+
+    def digest(self, file: Path) -> str:
+        """
+        SHA-256 of a file's content
+
+        Remembered against the file's size and modification time, so large raw
+        inputs such as the OS Open Roads GeoPackage are only read again when
+        they change.
+        """
+        stat = Path(file).stat()
+        stamp = [stat.st_size, stat.st_mtime_ns]
+        entry = self._memo.get(str(file))
+        if entry is None or entry["stamp"] != stamp:
+            entry = {"stamp": stamp, "sha256": _sha256(file)}
+            self._memo[str(file)] = entry
+            self.root.mkdir(parents=True, exist_ok=True)
+            self._memo_file.write_text(json.dumps(self._memo, indent=2))
+        return entry["sha256"]
+
+    @staticmethod
+    def output_digest(folder: Path) -> str:
+        """Hash of the outputs of a completed stage, from its manifest"""
+        manifest = json.loads((folder / "manifest.json").read_text())
+        return hashlib.sha256(
+            json.dumps(manifest["outputs"], sort_keys=True).encode()
+        ).hexdigest()
+
+    def key(
+        self,
+        name: str,
+        files: Iterable[Path] = (),
+        params: dict | None = None,
+        upstream: Iterable[Path] = (),
+    ) -> str:
+        sha = hashlib.sha256(name.encode())
+        for file in files:
+            sha.update(self.digest(file).encode())
+        sha.update(json.dumps(params or {}, sort_keys=True, default=str).encode())
+        for folder in upstream:
+            sha.update(self.output_digest(folder).encode())
+        return sha.hexdigest()[:16]
+
+    def run(
+        self,
+        name: str,
+        fn: Callable[[Path], object],
+        files: Iterable[Path] = (),
+        params: dict | None = None,
+        upstream: Iterable[Path] = (),
+    ) -> Path:
+        """
+        Output folder of stage ``name``, running it if not already cached
+
+        Parameters
+        ----------
+        fn : Callable[[Path], object]
+            Writes the stage outputs into the folder it is given
+        files : Iterable[Path]
+            Files the stage reads, hashed by content
+        params : dict, optional
+            Settings that change the outputs, must be JSON serialisable
+        upstream : Iterable[Path]
+            Output folders of the stages this one reads, as returned by ``run``
+
+        Returns
+        -------
+        Path:
+            Folder holding the stage outputs and a ``manifest.json``
+        """
+        key = self.key(name, files, params, upstream)
+        folder = self.root / name / key
+        if (folder / "manifest.json").exists() and name not in self.force:
+            logger.info(f"Stage {name} cached ({key})")
+            self.timings[name] = 0.0
+            return folder
+
+        t1 = time.time()
+        tmp = folder.with_name(f"{key}.tmp")
+        shutil.rmtree(tmp, ignore_errors=True)
+        tmp.mkdir(parents=True)
+        fn(tmp)
+        outputs = {
+            str(file.relative_to(tmp)): _sha256(file)
+            for file in sorted(tmp.rglob("*"))
+            if file.is_file()
+        }
+        (tmp / "manifest.json").write_text(
+            json.dumps(
+                {"stage": name, "key": key, "params": params, "outputs": outputs},
+                indent=2,
+                default=str,
+            )
+        )
+        # the manifest marks a complete stage, so it only appears once all
+        # outputs are in place
+        shutil.rmtree(folder, ignore_errors=True)
+        os.replace(tmp, folder)
+        tdiff = time.time() - t1
+        self.timings[name] = tdiff
+        logger.info(f"Stage {name} done in {tdiff:.1f} seconds ({key})")
+        return folder
@@ -1,29 +1,54 @@
 import logging
+from pathlib import Path
 
-from rich.logging import RichHandler
-
-logger = logging.getLogger(__name__)
-
-# the handler determines where the logs go: stdout/file
-shell_handler = RichHandler()
-file_handler = logging.FileHandler("debug.log")
-
+logger = logging.getLogger("ukroutes")
 logger.setLevel(logging.DEBUG)
-shell_handler.setLevel(logging.DEBUG)
-file_handler.setLevel(logging.DEBUG)
+# importing the package leaves logging untouched: nothing is shown or written
+# until an application calls setup_logging
+logger.addHandler(logging.NullHandler())
 
 # the formatter determines what our logs will look like
-fmt_shell = "%(message)s"
-fmt_file = (
+FMT_SHELL = "%(message)s"
+FMT_FILE = (
     "%(levelname)s %(asctime)s [%(filename)s:%(funcName)s:%(lineno)d] %(message)s"
 )
 
-shell_formatter = logging.Formatter(fmt_shell)
-file_formatter = logging.Formatter(fmt_file)
-
-# here we hook everything together
-shell_handler.setFormatter(shell_formatter)
-file_handler.setFormatter(file_formatter)
 
-logger.addHandler(shell_handler)
-logger.addHandler(file_handler)
+def setup_logging(
+    level: int = logging.DEBUG, log_file: str | Path | None = "debug.log"
+) -> logging.Logger:
+    """
+    Send ``ukroutes`` logs to the terminal and, optionally, to ``log_file``
+
+    Called by the command line entry points and scripts. Calling it again
+    replaces the handlers of an earlier call.
+
+    Parameters
+    ----------
+    level : int
+        Lowest level shown and written
+    log_file : str | Path, optional
+        File the logs are also written to, relative to the working directory,
+        or ``None`` for the terminal only
+    """
+    from rich.logging import RichHandler
+
+    for handler in list(logger.handlers):
+        if not isinstance(handler, logging.NullHandler):
+            logger.removeHandler(handler)
+            handler.close()
+
+    # the handler determines where the logs go: stdout/file
+    shell_handler = RichHandler()
+    shell_handler.setFormatter(logging.Formatter(FMT_SHELL))
+    handlers = [shell_handler]
+    if log_file is not None:
+        file_handler = logging.FileHandler(log_file)
+        file_handler.setFormatter(logging.Formatter(FMT_FILE))
+        handlers.append(file_handler)
+
+    # here we hook everything together
+    for handler in handlers:
+        handler.setLevel(level)
+        logger.addHandler(handler)
+    return logger
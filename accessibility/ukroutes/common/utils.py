@@ -1,3 +1,4 @@
+from collections.abc import Iterable
 from pathlib import Path
 
 
@@ -7,8 +8,44 @@ class Paths:
     OUT_DATA = DATA / "out"
     OPROAD = RAW / "oproad" / "oproad_gb.gpkg"
     FERRY = RAW / "oproad" / "strtgi_essh_gb" / "ferry_line.shp"
+    FERRIES = RAW / "oproad" / "ferries.geojson"
 
     PROCESSED = DATA / "processed"
     OS_GRAPH = PROCESSED / "oproads"
+    OS_LINKS = OS_GRAPH / "road_link.parquet"
+    OS_NODES = OS_GRAPH / "road_node.parquet"
+    OS_GRAPH_STORE = OS_GRAPH / "csr"
+    OS_CACHE = OS_GRAPH / "cache"
+
+    UPRN_LOOKUP = RAW / "os_uprns" / "uprn_toid_cm_lkup.parquet"
+    OPEN_UPRN = RAW / "os_uprns" / "osopenuprn_202405.csv"
+
+    BLUE_SQUARE = RAW / "flood" / "Blue_Square_Grid.shp"
+    ROFRS = RAW / "flood" / "rofrs.gpkg"
+    FLOOD_STORE = PROCESSED / "flood"
+
+    TOIDS = RAW / "os_toids" / "toids_cm_osgb.parquet"
+    SENTINEL2 = RAW / "sentinel2" / "sentinel2_2024.tif"
+    SENTINEL2_STORE = PROCESSED / "sentinel2"
+
+
+def file_stamps(paths: Iterable[Path]) -> list[dict]:
+    """
+    Path, size and modification time of each file
+
+    Stored with anything built from the files, so it can tell when they have
+    changed without reading them.
+    """
+    stamps = []
+    for path in paths:
+        stat = Path(path).stat()
+        stamps.append(
+            {
+                "file": str(Path(path).resolve()),
+                "size": stat.st_size,
+                "mtime": stat.st_mtime,
+            }
+        )
+    return stamps
 
 
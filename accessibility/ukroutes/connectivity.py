@@ -0,0 +1,116 @@
+from __future__ import annotations
+
+import time
+from typing import NamedTuple
+
+import numpy as np
+from scipy.spatial import KDTree
+
+from ukroutes.common.logger import logger
+
+
+class JoinReport(NamedTuple):
+    islands: int  # components linked to the main one
+    nodes: int  # nodes in those components
+    unjoined: int  # components without coordinates, left as they were
+    seconds: float
+
+
+def components(start: np.ndarray, end: np.ndarray, n_nodes: int) -> np.ndarray:
+    """
+    Connected component label of every node, from an edge list
+
+    A vectorised union-find: each round hooks the root of every edge's larger
+    end onto the smaller root, then compresses paths by pointer jumping until
+    every node points at its root. Rounds repeat until both ends of every edge
+    share a root, so the label of a component is its smallest node id. Nodes
+    without edges are their own component.
+    """
+    start = np.asarray(start, dtype=np.int64)
+    end = np.asarray(end, dtype=np.int64)
+    parent = np.arange(n_nodes)
+    while True:
+        root_start, root_end = parent[start], parent[end]
+        split = root_start != root_end
+        if not split.any():
+            return parent
+        low = np.minimum(root_start[split], root_end[split])
+        high = np.maximum(root_start[split], root_end[split])
+        # roots only ever point at smaller ids, so no cycles can form
+        np.minimum.at(parent, high, low)
+        while True:
+            grandparent = parent[parent]
+            if (grandparent == parent).all():
+                break
+            parent = grandparent
+
+
+def largest_component(start: np.ndarray, end: np.ndarray, n_nodes: int) -> np.ndarray:
+    """Flag of the nodes in the component with the most edge ends"""
+    labels = components(start, end, n_nodes)
+    ends = labels[np.concatenate([start, end]).astype(np.int64)]
+    return labels == np.bincount(ends, minlength=n_nodes).argmax()
+
+
+def join_components(
+    start: np.ndarray,
+    end: np.ndarray,
+    easting: np.ndarray,
+    northing: np.ndarray,
+) -> tuple[np.ndarray, np.ndarray, np.ndarray, JoinReport]:
+    """
+    Connectors linking every island of a network to its main component
+
+    Each island gets exactly one connector, between its node closest to the
+    main component and that nearest main node, found with one ``KDTree`` query
+    over the island nodes. Only nodes on an edge are considered.
+
+    Parameters
+    ----------
+    start, end : np.ndarray
+        Edge list of integer node ids
+    easting, northing : np.ndarray
+        Node coordinates indexed by node id, ``NaN`` where unknown
+
+    Returns
+    -------
+    tuple:
+        Start (island) node, end (main) node and straight line length of each
+        connector, and a ``JoinReport``
+    """
+    t1 = time.time()
+    start = np.asarray(start, dtype=np.int64)
+    end = np.asarray(end, dtype=np.int64)
+    n_nodes = len(easting)
+    labels = components(start, end, n_nodes)
+
+    on_edge = np.unique(np.concatenate([start, end]))
+    main = np.bincount(labels[on_edge]).argmax()
+    island_labels = np.unique(labels[on_edge])
+    located = np.isfinite(easting[on_edge]) & np.isfinite(northing[on_edge])
+    in_main = labels[on_edge] == main
+    main_nodes = on_edge[in_main & located]
+    island_nodes = on_edge[~in_main & located]
+
+    xy = np.column_stack([easting, northing])
+    distances, nearest = KDTree(xy[main_nodes]).query(xy[island_nodes])
+
+    # closest node of each island, by island then distance
+    island = labels[island_nodes]
+    order = np.lexsort((distances, island))
+    first = np.ones(len(order), dtype=bool)
+    first[1:] = island[order][1:] != island[order][:-1]
+    pick = order[first]
+
+    report = JoinReport(
+        islands=len(pick),
+        nodes=int((~in_main).sum()),
+        unjoined=len(island_labels) - 1 - len(pick),
+        seconds=time.time() - t1,
+    )
+    logger.info(
+        f"Joined {report.islands} islands ({report.nodes} nodes) to the main "
+        f"network in {report.seconds:.1f} seconds"
+        + (f", {report.unjoined} without coordinates left out." if report.unjoined else ".")
+    )
+    return island_nodes[pick], main_nodes[nearest[pick]], distances[pick], report
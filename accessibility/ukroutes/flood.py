@@ -0,0 +1,544 @@
+"""
+Flood risk indicators for every UPRN
+
+    python -m ukroutes.flood --uprns data/raw/os_uprns/osopenuprn_202405.csv \
+        --surface data/raw/flood/Blue_Square_Grid.shp \
+        --rivers-sea data/raw/flood/rofrs/*.json --output uprn_flood_risk.csv
+
+The Python version of ``flood risk/flood_risk_indicator_uprn.R``, with the same
+binary columns. Both flood layers are grids on the British National Grid (1 km
+Blue Square cells for surface water, 50 m Risk of Flooding from Rivers and Sea
+cells), so rather than joining every UPRN to the polygons, each layer is
+rasterized once into a compact array of risk classes per cell (see
+``GridLayer``) and every UPRN is classified by integer grid arithmetic. Only
+polygons that are not on the grid, e.g. reprojected or clipped ones, are
+queried with an STRtree. Layers are cached in ``--store``, and the UPRN CSV is
+streamed a block at a time, so memory is set by the layers, not the UPRNs.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import time
+from collections.abc import Iterable
+from pathlib import Path
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pacsv
+import pyarrow.parquet as pq
+import shapely
+
+from ukroutes.common.logger import logger, setup_logging
+from ukroutes.common.utils import Paths, file_stamps
+
+# bump when the layout of a saved layer changes
+FLOOD_STORE_VERSION = 1
+# output columns of the R indicator, by Blue Square layer and RoFRS prob_4band
+SURFACE_COLUMNS = {"surface": "surface_flood_risk"}
+RIVERS_SEA_COLUMNS = {
+    "High": "rivers_sea_flood_risk_high",
+    "Medium": "rivers_sea_flood_medium",
+    "Low": "rivers_sea_flood_risk_low",
+    "Very Low": "rivers_sea_flood_very_low",
+}
+# vertices within this many metres of a grid line count as on it
+TOLERANCE = 1e-3
+
+
+def _bits_dtype(n_classes: int) -> np.dtype:
+    for dtype in (np.uint8, np.uint16, np.uint32, np.uint64):
+        if n_classes <= np.iinfo(dtype).bits:
+            return np.dtype(dtype)
+    raise ValueError(f"At most 64 risk classes are supported, not {n_classes}")
+
+
+def _expand_cells(
+    x0: np.ndarray, y0: np.ndarray, width: np.ndarray, height: np.ndarray
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Every cell of each block of cells, with the block it came from"""
+    count = width * height
+    block = np.repeat(np.arange(len(count)), count)
+    k = np.arange(count.sum()) - np.repeat(np.cumsum(count) - count, count)
+    return block, x0[block] + k % width[block], y0[block] + k // width[block]
+
+
+class GridLayer:
+    """
+    Flood risk polygons as risk classes per cell of a regular grid
+
+    Polygons whose vertices all lie on the grid lines, e.g. Blue Square cells
+    or dissolved RoFRS cells, are rasterized into ``bits``, one bit per class
+    set for every cell whose centre is in a polygon of that class, which for
+    such polygons is exactly the cells they cover. Any other polygons are kept
+    as they are in ``irregular`` and queried with an STRtree.
+
+    A point is at risk of a class if it intersects a polygon of it, as in the
+    R version: it is looked up in the cell it falls in, and in the neighbouring
+    cells too when it lies on a grid line, so points on a polygon's edge count.
+    """
+
+    def __init__(
+        self,
+        bits: np.ndarray,
+        origin: tuple[float, float],
+        cell: float,
+        columns: dict[str, str],
+        irregular: np.ndarray | None = None,
+        irregular_codes: np.ndarray | None = None,
+    ):
+        self.bits: np.ndarray = bits  # (rows, cols) from the south west corner
+        self.origin: tuple[float, float] = origin
+        self.cell: float = cell
+        self.columns: dict[str, str] = columns  # class label -> output column
+        self.irregular: np.ndarray = (
+            irregular if irregular is not None else np.empty(0, dtype=object)
+        )
+        self.irregular_codes: np.ndarray = (
+            irregular_codes
+            if irregular_codes is not None
+            else np.empty(0, dtype=np.int64)
+        )
+        self._tree: shapely.STRtree | None = None
+        self._near: tuple[np.ndarray, np.ndarray] | None = None
+
+    @classmethod
+    def from_polygons(
+        cls,
+        geometry,
+        columns: dict[str, str],
+        classes=None,
+        cell: float = 50.0,
+        origin: tuple[float, float] = (0.0, 0.0),
+        batch_cells: int = 10_000_000,
+    ) -> GridLayer:
+        """
+        Rasterize polygons on the grid of ``cell`` metre squares from ``origin``
+
+        Parameters
+        ----------
+        geometry : array-like
+            Polygons in British National Grid metres
+        columns : dict[str, str]
+            Output column by class label, in output order. Polygons of other
+            classes are left out.
+        classes : array-like, optional
+            Class label of each polygon, e.g. RoFRS ``prob_4band``. Without it
+            every polygon is of the single class in ``columns``.
+        batch_cells : int
+            Cells tested against their polygon at a time, which bounds memory;
+            polygons covering more cells are rasterized in tiles of this size
+        """
+        geometry = np.asarray(geometry, dtype=object)
+        labels = list(columns)
+        if classes is None:
+            if len(labels) != 1:
+                raise ValueError("Polygons without classes need a single column")
+            codes = np.zeros(len(geometry), dtype=np.int64)
+        else:
+            codes = pd.Categorical(np.asarray(classes), categories=labels).codes
+            codes = codes.astype(np.int64)
+        keep = (codes >= 0) & ~shapely.is_missing(geometry) & ~shapely.is_empty(
+            geometry
+        )
+        if (~keep).any():
+            logger.debug(f"{(~keep).sum()} empty or unlisted flood polygons skipped.")
+        geometry, codes = geometry[keep], codes[keep]
+
+        # on the grid if every vertex is on grid lines and every edge along one,
+        # so each cell is either wholly inside or wholly outside
+        parts, part_of = shapely.get_parts(geometry, return_index=True)
+        rings, ring_of = shapely.get_rings(parts, return_index=True)
+        coords, vertex_of = shapely.get_coordinates(rings, return_index=True)
+        steps = (coords - np.asarray(origin)) / cell
+        off_grid = (np.abs(steps - np.round(steps)) * cell > TOLERANCE).any(axis=1)
+        step = np.abs(np.diff(coords, axis=0)) > TOLERANCE
+        off_grid[1:] |= (vertex_of[1:] == vertex_of[:-1]) & step.all(axis=1)
+        aligned = (
+            np.bincount(
+                part_of[ring_of[vertex_of]], weights=off_grid, minlength=len(geometry)
+            )
+            == 0
+        )
+
+        bounds = shapely.bounds(geometry[aligned])
+        first = np.round((bounds[:, :2] - np.asarray(origin)) / cell).astype(np.int64)
+        last = np.round((bounds[:, 2:] - np.asarray(origin)) / cell).astype(np.int64)
+        offset = first.min(axis=0) if len(first) else np.zeros(2, dtype=np.int64)
+        shape = (last.max(axis=0) - offset) if len(last) else np.zeros(2, np.int64)
+        bits = np.zeros((shape[1], shape[0]), dtype=_bits_dtype(len(labels)))
+        first -= offset
+        size = last - offset - first
+        # rectangles cover their whole bounding box, other shapes are tested
+        # cell by cell at the cell centres
+        rectangle = np.isclose(
+            shapely.area(geometry[aligned]), np.prod(size, axis=1) * cell**2
+        )
+        flag = np.left_shift(1, codes[aligned]).astype(bits.dtype)
+        polygons = np.flatnonzero(aligned)
+        shapely.prepare(geometry[polygons[~rectangle]])
+
+        # large polygons, e.g. dissolved flood zones, are split into tiles of at
+        # most batch_cells cells, so no batch holds more than that
+        width = np.minimum(size[:, 0], batch_cells).clip(min=1)
+        height = np.maximum(batch_cells // width, 1)
+        tile, tx, ty = _expand_cells(
+            np.zeros(len(size), dtype=np.int64),
+            np.zeros(len(size), dtype=np.int64),
+            -(-size[:, 0] // width),
+            -(-size[:, 1] // height),
+        )
+        tile_first = first[tile] + np.c_[tx * width[tile], ty * height[tile]]
+        tile_size = np.minimum(
+            np.c_[width[tile], height[tile]], first[tile] + size[tile] - tile_first
+        )
+        count = np.prod(tile_size, axis=1)
+        ends = np.cumsum(count)
+        start = 0
+        while start < len(tile):
+            stop = max(
+                int(
+                    np.searchsorted(
+                        ends, ends[start] - count[start] + batch_cells, side="right"
+                    )
+                ),
+                start + 1,
+            )
+            block, col, row = _expand_cells(
+                tile_first[start:stop, 0],
+                tile_first[start:stop, 1],
+                tile_size[start:stop, 0],
+                tile_size[start:stop, 1],
+            )
+            block = tile[block + start]
+            inside = rectangle[block]
+            test = ~inside
+            inside[test] = shapely.contains_xy(
+                geometry[polygons[block[test]]],
+                origin[0] + (offset[0] + col[test] + 0.5) * cell,
+                origin[1] + (offset[1] + row[test] + 0.5) * cell,
+            )
+            np.bitwise_or.at(bits, (row[inside], col[inside]), flag[block[inside]])
+            start = stop
+
+        logger.debug(
+            f"{aligned.sum()} flood polygons rasterized to {bits.shape[1]}x"
+            f"{bits.shape[0]} cells of {cell:g} m, {(~aligned).sum()} kept as polygons."
+        )
+        return cls(
+            bits,
+            (origin[0] + offset[0] * cell, origin[1] + offset[1] * cell),
+            cell,
+            columns,
+            geometry[~aligned],
+            codes[~aligned],
+        )
+
+    def classify(self, easting, northing) -> np.ndarray:
+        """
+        Risk classes of each point, as bits
+
+        Returns
+        -------
+        np.ndarray:
+            Bit ``i`` is set for points intersecting a polygon of the ``i``-th
+            class of ``columns``
+        """
+        easting = np.asarray(easting, dtype=np.float64)
+        northing = np.asarray(northing, dtype=np.float64)
+        out = np.zeros(len(easting), dtype=self.bits.dtype)
+        fx = (easting - self.origin[0]) / self.cell
+        fy = (northing - self.origin[1]) / self.cell
+        valid = np.isfinite(fx) & np.isfinite(fy)
+        col = np.floor(np.where(valid, fx, -1)).astype(np.int64)
+        row = np.floor(np.where(valid, fy, -1)).astype(np.int64)
+        # points on a grid line touch the cells on both sides
+        on_col, on_row = valid & (fx == col), valid & (fy == row)
+        rows, cols = self.bits.shape
+        for dx, dy in ((0, 0), (1, 0), (0, 1), (1, 1)):
+            c, r = col - dx, row - dy
+            touch = valid & (on_col | (dx == 0)) & (on_row | (dy == 0))
+            touch &= (c >= 0) & (c < cols) & (r >= 0) & (r < rows)
+            out[touch] |= self.bits[r[touch], c[touch]]
+
+        if len(self.irregular):
+            near = np.flatnonzero(valid & self._near_irregular(col, row))
+            point, polygon = self._tree.query(
+                shapely.points(easting[near], northing[near]), predicate="intersects"
+            )
+            flag = np.left_shift(1, self.irregular_codes[polygon]).astype(out.dtype)
+            np.bitwise_or.at(out, near[point], flag)
+        return out
+
+    def _near_irregular(self, col: np.ndarray, row: np.ndarray) -> np.ndarray:
+        """
+        Whether each cell is touched by the bounding box of an irregular
+        polygon, so only the points in those go to the STRtree
+        """
+        if self._tree is None:
+            self._tree = shapely.STRtree(self.irregular)
+            bounds = shapely.bounds(self.irregular)
+            first = np.floor(
+                (bounds[:, :2] - np.asarray(self.origin)) / self.cell
+            ).astype(np.int64)
+            last = np.floor(
+                (bounds[:, 2:] - np.asarray(self.origin)) / self.cell
+            ).astype(np.int64)
+            low = first.min(axis=0)
+            size = last - first + 1
+            mask = np.zeros(tuple((last.max(axis=0) - low + 1)[::-1]), dtype=bool)
+            _, x, y = _expand_cells(
+                first[:, 0] - low[0], first[:, 1] - low[1], size[:, 0], size[:, 1]
+            )
+            mask[y, x] = True
+            self._near = (mask, low)
+        mask, low = self._near
+        col, row = col - low[0], row - low[1]
+        inside = (col >= 0) & (col < mask.shape[1]) & (row >= 0) & (row < mask.shape[0])
+        near = np.zeros(len(col), dtype=bool)
+        near[inside] = mask[row[inside], col[inside]]
+        return near
+
+    def indicators(self, easting, northing) -> dict[str, np.ndarray]:
+        """0/1 column per class, named as in ``columns``"""
+        bits = self.classify(easting, northing)
+        return {
+            column: ((bits >> code) & 1).astype(np.int8)
+            for code, column in enumerate(self.columns.values())
+        }
+
+    def save(self, path: Path, sources: dict | None = None) -> None:
+        """
+        Write the layer to a folder
+
+        ``bits`` is a plain ``.npy`` file, so ``load`` can memory map it, and
+        the irregular polygons are WKB in Parquet. ``manifest.json`` holds the
+        grid and ``sources``, which ``load`` can check the layer against.
+        """
+        path = Path(path)
+        path.mkdir(parents=True, exist_ok=True)
+        np.save(path / "bits.npy", np.ascontiguousarray(self.bits))
+        pd.DataFrame(
+            {
+                "geometry": shapely.to_wkb(self.irregular),
+                "code": self.irregular_codes,
+            }
+        ).to_parquet(path / "irregular.parquet", index=False)
+        manifest = {
+            "version": FLOOD_STORE_VERSION,
+            "origin": list(self.origin),
+            "cell": self.cell,
+            "columns": self.columns,
+            "sources": sources or {},
+        }
+        with open(path / "manifest.json", "w") as f:
+            json.dump(manifest, f, indent=2)
+
+    @classmethod
+    def load(
+        cls, path: Path, sources: dict | None = None, mmap_mode: str | None = "r"
+    ) -> GridLayer | None:
+        """
+        Open a layer written by ``save``
+
+        Returns ``None`` if there is none, it is of another version or, when
+        ``sources`` are given, it was built from different ones.
+        """
+        path = Path(path)
+        if not (path / "manifest.json").exists():
+            return None
+        with open(path / "manifest.json") as f:
+            manifest = json.load(f)
+        if manifest["version"] != FLOOD_STORE_VERSION or (
+            sources is not None and manifest["sources"] != sources
+        ):
+            return None
+        irregular = pd.read_parquet(path / "irregular.parquet")
+        return cls(
+            np.load(path / "bits.npy", mmap_mode=mmap_mode),
+            tuple(manifest["origin"]),
+            manifest["cell"],
+            manifest["columns"],
+            shapely.from_wkb(irregular["geometry"].to_numpy()),
+            irregular["code"].to_numpy(),
+        )
+
+
+def read_layer(
+    paths: Iterable[Path],
+    columns: dict[str, str],
+    cell: float,
+    class_column: str | None = None,
+    store: Path | None = None,
+) -> GridLayer:
+    """
+    Flood polygons from one or more files as a ``GridLayer``
+
+    Files are read with their class column only and reprojected to the British
+    National Grid if needed, e.g. the RoFRS region downloads. With ``store``
+    the layer is saved there and reused while the files are unchanged.
+    """
+    paths = [Path(p) for p in paths]
+    sources = {
+        "files": file_stamps(paths),
+        "cell": cell,
+        "class_column": class_column,
+        "columns": columns,
+    }
+    if store is not None and (layer := GridLayer.load(store, sources)) is not None:
+        logger.info(f"Flood layer loaded from {store}.")
+        return layer
+
+    t1 = time.time()
+    frames = []
+    for path in paths:
+        frame = gpd.read_file(path, columns=[class_column] if class_column else [])
+        if frame.crs is not None and frame.crs.to_epsg() != 27700:
+            frame = frame.to_crs("EPSG:27700")
+        frames.append(frame)
+    polygons = pd.concat(frames, ignore_index=True)
+    layer = GridLayer.from_polygons(
+        polygons.geometry.values,
+        columns,
+        classes=polygons[class_column].to_numpy() if class_column else None,
+        cell=cell,
+    )
+    logger.info(
+        f"{len(polygons)} flood polygons indexed in {time.time() - t1:.1f} seconds."
+    )
+    if store is not None:
+        layer.save(store, sources)
+    return layer
+
+
+def flood_indicators(
+    uprns: Path,
+    layers: Iterable[GridLayer],
+    output: Path,
+    id_column: str = "UPRN",
+    easting: str = "GRIDGB1E",
+    northing: str = "GRIDGB1N",
+    block_size: int = 64 * 2**20,
+) -> Path:
+    """
+    Classify every point of a CSV against the flood layers
+
+    The CSV is read ``block_size`` bytes at a time, each block classified and
+    appended to ``output`` (CSV, or Parquet for a ``.parquet`` path), so any
+    number of points fits in memory.
+
+    Parameters
+    ----------
+    uprns : Path
+        CSV with ``id_column``, ``easting`` and ``northing``, e.g. OS Open UPRN
+    layers : Iterable[GridLayer]
+        Layers whose ``columns`` make the output columns, in order
+
+    Returns
+    -------
+    Path:
+        ``output``
+    """
+    t1 = time.time()
+    layers = list(layers)
+    output = Path(output)
+    output.parent.mkdir(parents=True, exist_ok=True)
+    reader = pacsv.open_csv(
+        uprns,
+        read_options=pacsv.ReadOptions(block_size=block_size),
+        convert_options=pacsv.ConvertOptions(
+            include_columns=[id_column, easting, northing],
+            column_types={easting: pa.float64(), northing: pa.float64()},
+        ),
+    )
+    writer = None
+    rows = 0
+    try:
+        for batch in reader:
+            x = batch.column(easting).to_numpy(zero_copy_only=False)
+            y = batch.column(northing).to_numpy(zero_copy_only=False)
+            columns = {id_column: batch.column(id_column)}
+            for layer in layers:
+                columns |= layer.indicators(x, y)
+            table = pa.table(columns)
+            if writer is None:
+                writer = (
+                    pq.ParquetWriter(output, table.schema, compression="zstd")
+                    if output.suffix == ".parquet"
+                    else pacsv.CSVWriter(output, table.schema)
+                )
+            writer.write_table(table)
+            rows += len(table)
+    finally:
+        if writer is not None:
+            writer.close()
+    logger.info(
+        f"{rows} points classified in {time.time() - t1:.1f} seconds, "
+        f"saved to {output}."
+    )
+    return output
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--uprns", type=Path, default=Paths.OPEN_UPRN)
+    parser.add_argument(
+        "--surface",
+        type=Path,
+        nargs="+",
+        default=[Paths.BLUE_SQUARE],
+        help="Blue Square Grid surface water flood risk polygons",
+    )
+    parser.add_argument(
+        "--rivers-sea",
+        type=Path,
+        nargs="+",
+        default=[Paths.ROFRS],
+        help="Risk of Flooding from Rivers and Sea polygons, one or more files",
+    )
+    parser.add_argument("--surface-cell", type=float, default=1_000)
+    parser.add_argument("--rivers-sea-cell", type=float, default=50)
+    parser.add_argument("--class-column", default="prob_4band")
+    parser.add_argument("--store", type=Path, default=Paths.FLOOD_STORE)
+    parser.add_argument("--id-column", default="UPRN")
+    parser.add_argument("--easting", default="GRIDGB1E")
+    parser.add_argument("--northing", default="GRIDGB1N")
+    parser.add_argument(
+        "--output",
+        type=Path,
+        default=Paths.OUT_DATA / "uprn_flood_risk.csv",
+        help="csv, or parquet if the suffix is .parquet",
+    )
+    args = parser.parse_args(argv)
+    setup_logging()
+
+    layers = [
+        read_layer(
+            args.surface,
+            SURFACE_COLUMNS,
+            args.surface_cell,
+            store=args.store / "surface",
+        ),
+        read_layer(
+            args.rivers_sea,
+            RIVERS_SEA_COLUMNS,
+            args.rivers_sea_cell,
+            class_column=args.class_column,
+            store=args.store / "rivers_sea",
+        ),
+    ]
+    flood_indicators(
+        args.uprns,
+        layers,
+        args.output,
+        id_column=args.id_column,
+        easting=args.easting,
+        northing=args.northing,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,670 @@
+from __future__ import annotations
+
+import hashlib
+import json
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+# bump when the layout of the on-disk graph store changes
+GRAPH_STORE_VERSION = 1
+
+# British National Grid extent in metres (min easting, min northing, max, max)
+BNG_BOUNDS = (0.0, 0.0, 700_000.0, 1_300_000.0)
+
+
+def gather_rows(indptr: np.ndarray, rows: np.ndarray) -> np.ndarray:
+    """
+    Positions of every CSR entry belonging to ``rows``
+
+    Vectorised equivalent of concatenating ``arange(indptr[r], indptr[r + 1])``
+    for each row, so the cost is proportional to the number of entries returned.
+    """
+    rows = np.asarray(rows, dtype=np.int64)
+    starts = indptr[rows].astype(np.int64)
+    counts = indptr[rows + 1] - starts
+    total = int(counts.sum())
+    if total == 0:
+        return np.empty(0, dtype=np.int64)
+    offsets = np.repeat(starts - np.cumsum(counts) + counts, counts)
+    return offsets + np.arange(total, dtype=np.int64)
+
+
+def path_totals(parent, values):
+    """
+    Sum ``values`` along every path of a shortest path tree
+
+    ``parent[v]`` is the tree parent of ``v``, with roots pointing to themselves,
+    and ``values[v]`` the value of the edge joining them (zero for roots). Uses
+    pointer jumping, so it is vectorised and takes a number of steps logarithmic
+    in the tree depth. Works on NumPy or CuPy arrays.
+    """
+    ancestor = parent.copy()
+    total = values.copy()
+    while True:
+        grandparent = ancestor[ancestor]
+        if (grandparent == ancestor).all():
+            return total
+        total = total + total[ancestor]
+        ancestor = grandparent
+
+
+def tree_totals(
+    predecessors: np.ndarray,
+    rows: np.ndarray,
+    cols: np.ndarray,
+    primary: np.ndarray,
+    values: dict[str, np.ndarray],
+) -> dict[str, np.ndarray]:
+    """
+    Secondary edge attributes summed along a SciPy shortest path tree
+
+    Parameters
+    ----------
+    predecessors : np.ndarray
+        Predecessor array from ``scipy.sparse.csgraph``, negative for roots and
+        unreached nodes
+    rows, cols, primary : np.ndarray
+        Entries of the searched matrix and the weight it was searched on. The
+        tree edge between two nodes is the one with the lowest ``primary``
+        weight, in either direction, as that is the one the search relaxed.
+    values : dict[str, np.ndarray]
+        Secondary attributes of each entry
+
+    Returns
+    -------
+    dict[str, np.ndarray]:
+        Total of each attribute from the root to every node
+    """
+    n = len(predecessors)
+    nodes = np.arange(n)
+    child = np.flatnonzero(predecessors >= 0)
+    parent = nodes.copy()
+    parent[child] = predecessors[child]
+
+    # search both directions, sorted so the first match of a pair is its lightest
+    both_rows = np.concatenate([rows, cols]).astype(np.int64)
+    both_cols = np.concatenate([cols, rows]).astype(np.int64)
+    order = np.lexsort((np.concatenate([primary, primary]), both_cols, both_rows))
+    keys = both_rows[order] * n + both_cols[order]
+    entry = order[np.searchsorted(keys, parent[child].astype(np.int64) * n + child)]
+
+    totals = {}
+    for name, value in values.items():
+        edge = np.zeros(n)
+        edge[child] = np.concatenate([value, value])[entry]
+        totals[name] = path_totals(parent, edge)
+    return totals
+
+
+def row_tree_totals(
+    indptr: np.ndarray,
+    indices: np.ndarray,
+    primary: np.ndarray,
+    predecessors: np.ndarray,
+    reached: np.ndarray,
+    values: dict[str, np.ndarray],
+) -> dict[str, np.ndarray]:
+    """
+    Secondary edge attributes summed along a directed search of a CSR matrix
+
+    Like ``tree_totals`` but only the rows of the parents of ``reached`` nodes
+    are read, so the cost follows the size of the searched area rather than the
+    whole matrix. Suits a directed search of a matrix storing every edge both
+    ways, where the tree edge into ``v`` is the lightest entry of row
+    ``predecessors[v]`` in column ``v``.
+
+    Returns
+    -------
+    dict[str, np.ndarray]:
+        Total of each attribute from the root to each of ``reached``
+    """
+    reached = np.asarray(reached, dtype=np.int64)
+    local = np.arange(len(reached))
+    child = local[predecessors[reached] >= 0]
+    parent_ids = predecessors[reached[child]].astype(np.int64)
+
+    pos = gather_rows(indptr, parent_ids)
+    owner = np.repeat(child, indptr[parent_ids + 1] - indptr[parent_ids])
+    match = indices[pos] == reached[owner]
+    pos, owner = pos[match], owner[match]
+    # lightest matching entry first for each child
+    order = np.lexsort((primary[pos], owner))
+    pos, owner = pos[order], owner[order]
+    first = np.ones(len(owner), dtype=bool)
+    first[1:] = owner[1:] != owner[:-1]
+    pos, owner = pos[first], owner[first]
+
+    parent = local.copy()
+    parent[child] = np.searchsorted(reached, parent_ids)
+    totals = {}
+    for name, value in values.items():
+        edge = np.zeros(len(reached))
+        edge[owner] = value[pos]
+        totals[name] = path_totals(parent, edge)
+    return totals
+
+
+def weight_per_metre(
+    start: np.ndarray,
+    end: np.ndarray,
+    weight: np.ndarray,
+    easting: np.ndarray,
+    northing: np.ndarray,
+) -> float:
+    """
+    Lowest edge weight per metre of straight line between its end nodes
+
+    By the triangle inequality no path is lighter than this rate times the
+    straight line distance between its ends, which gives a lower bound on the
+    network distance to a point. ``easting`` and ``northing`` are indexed by node
+    id, edges with a missing or zero length end are ignored.
+    """
+    start = np.asarray(start, dtype=np.int64)
+    end = np.asarray(end, dtype=np.int64)
+    line = np.hypot(easting[start] - easting[end], northing[start] - northing[end])
+    valid = np.isfinite(line) & (line > 0)
+    if not valid.any():
+        return 0.0
+    return float((np.asarray(weight)[valid] / line[valid]).min())
+
+
+def csr_from_coo(
+    rows: np.ndarray, cols: np.ndarray, n_rows: int
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    CSR offsets, column indices and entry order for coordinate lists
+
+    Unlike ``scipy.sparse`` conversion, repeated ``(row, col)`` pairs are kept as
+    separate entries rather than summed, so parallel edges survive. Index arrays
+    are int32 as required by ``scipy.sparse.csgraph``.
+
+    Returns
+    -------
+    tuple[np.ndarray, np.ndarray, np.ndarray]:
+        ``indptr``, ``indices`` and the permutation to apply to entry data
+    """
+    order = np.argsort(rows, kind="stable")
+    indptr = np.zeros(n_rows + 1, dtype=np.int32)
+    np.cumsum(np.bincount(rows, minlength=n_rows), out=indptr[1:])
+    return indptr, np.asarray(cols, dtype=np.int32)[order], order
+
+
+class CSRGraph:
+    """
+    Undirected road graph stored in compressed sparse row form
+
+    Every edge is stored in both directions so ``indptr[v]:indptr[v + 1]`` holds
+    all edges incident to ``v``, with one array per weight column. Parallel edges
+    are kept, and SciPy's shortest path routines relax each of them, so the
+    arrays are used as a matrix without copying. Node ids are the row indices.
+    """
+
+    def __init__(
+        self,
+        indptr: np.ndarray,
+        indices: np.ndarray,
+        weights: dict[str, np.ndarray],
+        easting: np.ndarray | None = None,
+        northing: np.ndarray | None = None,
+    ):
+        self.indptr: np.ndarray = indptr
+        self.indices: np.ndarray = indices
+        self.weights: dict[str, np.ndarray] = weights
+        self.easting: np.ndarray | None = easting
+        self.northing: np.ndarray | None = northing
+
+    @property
+    def n_nodes(self) -> int:
+        return len(self.indptr) - 1
+
+    @property
+    def n_edges(self) -> int:
+        return len(self.indices)
+
+    @classmethod
+    def from_edges(
+        cls,
+        start: np.ndarray,
+        end: np.ndarray,
+        weights: dict[str, np.ndarray],
+        n_nodes: int | None = None,
+    ) -> CSRGraph:
+        start = np.asarray(start, dtype=np.int64)
+        end = np.asarray(end, dtype=np.int64)
+        if n_nodes is None:
+            n_nodes = int(max(start.max(initial=-1), end.max(initial=-1))) + 1
+
+        indptr, indices, order = csr_from_coo(
+            np.concatenate([start, end]), np.concatenate([end, start]), n_nodes
+        )
+        return cls(
+            indptr=indptr,
+            indices=indices,
+            weights={
+                name: np.concatenate([w, w]).astype(np.float64)[order]
+                for name, w in ((k, np.asarray(v)) for k, v in weights.items())
+            },
+        )
+
+    @classmethod
+    def from_frames(
+        cls,
+        edges,
+        nodes=None,
+        weights: tuple[str, ...] = ("time_weighted", "length"),
+    ) -> CSRGraph:
+        """
+        Build from ``start_node``/``end_node`` edge frames (pandas or cudf)
+
+        Parameters
+        ----------
+        edges : DataFrame
+            Edge list with ``start_node``, ``end_node`` and weight columns
+        nodes : DataFrame, optional
+            Nodes with ``node_id``, ``easting`` and ``northing`` columns
+        weights : tuple[str, ...]
+            Edge columns to carry as weights
+
+        Returns
+        -------
+        CSRGraph:
+            Graph with one row per node id
+        """
+        start = edges["start_node"].to_numpy()
+        end = edges["end_node"].to_numpy()
+        n_nodes = int(max(start.max(initial=-1), end.max(initial=-1))) + 1
+        if nodes is not None:
+            node_ids = nodes["node_id"].to_numpy().astype(np.int64)
+            n_nodes = max(n_nodes, int(node_ids.max(initial=-1)) + 1)
+
+        graph = cls.from_edges(
+            start,
+            end,
+            {w: edges[w].to_numpy() for w in weights if w in edges.columns},
+            n_nodes=n_nodes,
+        )
+        if nodes is not None:
+            graph.easting = np.full(n_nodes, np.nan)
+            graph.northing = np.full(n_nodes, np.nan)
+            graph.easting[node_ids] = nodes["easting"].to_numpy()
+            graph.northing[node_ids] = nodes["northing"].to_numpy()
+        return graph
+
+    def nodes(self) -> pd.DataFrame:
+        """Nodes with coordinates, in the layout of ``nodes.parquet``"""
+        node_ids = np.flatnonzero(np.isfinite(self.easting))
+        return pd.DataFrame(
+            {
+                "node_id": node_ids,
+                "easting": self.easting[node_ids],
+                "northing": self.northing[node_ids],
+            }
+        )
+
+    def to_frames(self) -> tuple[pd.DataFrame, pd.DataFrame]:
+        """
+        Nodes and edges in the layout of ``nodes.parquet`` and ``edges.parquet``
+
+        Each undirected edge is returned once, self loops are dropped.
+        """
+        rows = np.repeat(np.arange(self.n_nodes, dtype=np.int64), np.diff(self.indptr))
+        keep = rows < self.indices
+        edges = pd.DataFrame(
+            {
+                "start_node": rows[keep],
+                "end_node": self.indices[keep].astype(np.int64),
+                **{name: w[keep] for name, w in self.weights.items()},
+            }
+        )
+        return self.nodes(), edges
+
+    def with_edges(self, edges: pd.DataFrame, nodes: pd.DataFrame) -> CSRGraph:
+        """
+        A copy of the graph with extra edges and nodes, e.g. connectors
+
+        The extra entries are inserted at the end of their rows in one pass over
+        the arrays, so the graph, which may be memory mapped, is neither sorted
+        nor expanded into an edge list again. The result is held in memory.
+
+        Parameters
+        ----------
+        edges : pd.DataFrame
+            Extra edges with ``start_node``, ``end_node`` and every weight of
+            the graph
+        nodes : pd.DataFrame
+            Nodes with ``node_id``, ``easting`` and ``northing``, at least all
+            new ones
+        """
+        missing = set(self.weights) - set(edges.columns)
+        if missing:
+            raise ValueError(f"Extra edges have no {sorted(missing)} columns")
+        start = edges["start_node"].to_numpy().astype(np.int64)
+        end = edges["end_node"].to_numpy().astype(np.int64)
+        node_ids = nodes["node_id"].to_numpy().astype(np.int64)
+        n_nodes = max(
+            self.n_nodes,
+            int(max(start.max(initial=-1), end.max(initial=-1))) + 1,
+            int(node_ids.max(initial=-1)) + 1,
+        )
+
+        rows = np.concatenate([start, end])
+        cols = np.concatenate([end, start])
+        order = np.argsort(rows, kind="stable")
+        rows, cols = rows[order], cols[order]
+        indptr = np.full(n_nodes + 1, self.indptr[-1], dtype=np.int64)
+        indptr[: self.n_nodes + 1] = self.indptr
+        # entries of a row go after its existing ones, in edge order
+        at = indptr[rows + 1]
+        added = np.zeros(n_nodes + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows, minlength=n_nodes), out=added[1:])
+
+        easting = np.full(n_nodes, np.nan)
+        northing = np.full(n_nodes, np.nan)
+        if self.easting is not None:
+            easting[: self.n_nodes] = self.easting
+            northing[: self.n_nodes] = self.northing
+        easting[node_ids] = nodes["easting"].to_numpy()
+        northing[node_ids] = nodes["northing"].to_numpy()
+        return CSRGraph(
+            (indptr + added).astype(np.int32),
+            np.insert(self.indices, at, cols.astype(self.indices.dtype)),
+            {
+                name: np.insert(
+                    weight,
+                    at,
+                    np.concatenate([edges[name], edges[name]]).astype(weight.dtype)[
+                        order
+                    ],
+                )
+                for name, weight in self.weights.items()
+            },
+            easting,
+            northing,
+        )
+
+    def matrix(self, weight: str) -> sparse.csr_matrix:
+        """Adjacency matrix of ``weight`` sharing this graph's arrays"""
+        return sparse.csr_matrix(
+            (self.weights[weight], self.indices, self.indptr),
+            shape=(self.n_nodes, self.n_nodes),
+        )
+
+    def subgraph(self, nodes: np.ndarray) -> tuple[CSRGraph, np.ndarray]:
+        """
+        Every edge touching ``nodes``, renumbered from zero
+
+        Edges leaving ``nodes`` are kept in both directions, so a search from
+        inside sees the same neighbourhood as on the full graph. Node order is
+        preserved, local id ``i`` being original id ``ids[i]``.
+
+        Returns
+        -------
+        tuple[CSRGraph, np.ndarray]:
+            The subgraph and the original id of each of its nodes
+        """
+        nodes = np.unique(np.asarray(nodes, dtype=np.int64))
+        pos = gather_rows(self.indptr, nodes)
+        rows = np.repeat(nodes, self.indptr[nodes + 1] - self.indptr[nodes])
+        cols = self.indices[pos].astype(np.int64)
+        outside = ~np.isin(cols, nodes)
+        rows, cols = (
+            np.concatenate([rows, cols[outside]]),
+            np.concatenate([cols, rows[outside]]),
+        )
+        pos = np.concatenate([pos, pos[outside]])
+
+        ids = np.unique(np.concatenate([nodes, cols]))
+        indptr, indices, order = csr_from_coo(
+            np.searchsorted(ids, rows), np.searchsorted(ids, cols), len(ids)
+        )
+        graph = CSRGraph(
+            indptr,
+            indices,
+            {name: weight[pos[order]] for name, weight in self.weights.items()},
+            None if self.easting is None else self.easting[ids],
+            None if self.northing is None else self.northing[ids],
+        )
+        return graph, ids
+
+    def save(self, path: Path, node_ids: pd.DataFrame | None = None) -> None:
+        """
+        Write the graph as a versioned store of ``.npy`` arrays
+
+        Each array is a plain ``.npy`` file, whose data is 64 byte aligned, so
+        ``load`` can memory map it without parsing and worker processes share
+        one page cached copy. ``manifest.json`` records the format version,
+        sizes, dtypes and a SHA-256 per file, plus an overall checksum.
+
+        Parameters
+        ----------
+        path : Path
+            Folder for the store, created if needed
+        node_ids : pd.DataFrame, optional
+            Mapping of integer ``node_id`` to the original OS identifiers
+        """
+        path = Path(path)
+        path.mkdir(parents=True, exist_ok=True)
+        arrays = {
+            "indptr": self.indptr,
+            "indices": self.indices,
+            "easting": self.easting,
+            "northing": self.northing,
+            **{f"weight_{name}": w for name, w in self.weights.items()},
+        }
+        manifest = {
+            "version": GRAPH_STORE_VERSION,
+            "n_nodes": self.n_nodes,
+            "n_edges": self.n_edges,
+            "weights": list(self.weights),
+            "files": {},
+        }
+        for name, array in arrays.items():
+            if array is None:
+                continue
+            np.save(path / f"{name}.npy", np.ascontiguousarray(array))
+            manifest["files"][name] = {
+                "file": f"{name}.npy",
+                "dtype": str(array.dtype),
+                "shape": list(array.shape),
+                "sha256": _sha256(path / f"{name}.npy"),
+            }
+        if node_ids is not None:
+            node_ids.to_parquet(path / "node_ids.parquet", index=False)
+            manifest["files"]["node_ids"] = {
+                "file": "node_ids.parquet",
+                "sha256": _sha256(path / "node_ids.parquet"),
+            }
+        manifest["checksum"] = hashlib.sha256(
+            "".join(f["sha256"] for f in manifest["files"].values()).encode()
+        ).hexdigest()
+        with open(path / "manifest.json", "w") as f:
+            json.dump(manifest, f, indent=2)
+
+    @classmethod
+    def load(
+        cls, path: Path, mmap_mode: str | None = "r", verify: bool = False
+    ) -> CSRGraph:
+        """
+        Open a store written by ``save``
+
+        Parameters
+        ----------
+        path : Path
+            Store folder
+        mmap_mode : str, optional
+            Passed to ``np.load``, ``"r"`` maps the arrays read-only
+        verify : bool
+            Check every file against its manifest checksum, which reads it fully
+        """
+        path = Path(path)
+        with open(path / "manifest.json") as f:
+            manifest = json.load(f)
+        if manifest["version"] != GRAPH_STORE_VERSION:
+            raise ValueError(
+                f"Graph store {path} is version {manifest['version']}, "
+                f"expected {GRAPH_STORE_VERSION}; rerun process_os."
+            )
+        files = manifest["files"]
+        if verify:
+            for name, entry in files.items():
+                if _sha256(path / entry["file"]) != entry["sha256"]:
+                    raise ValueError(f"Checksum mismatch for {name} in {path}")
+
+        def array(name):
+            if name not in files:
+                return None
+            return np.load(path / files[name]["file"], mmap_mode=mmap_mode)
+
+        return cls(
+            indptr=array("indptr"),
+            indices=array("indices"),
+            weights={w: array(f"weight_{w}") for w in manifest["weights"]},
+            easting=array("easting"),
+            northing=array("northing"),
+        )
+
+    @staticmethod
+    def load_node_ids(path: Path) -> pd.DataFrame:
+        """Mapping of integer ``node_id`` to OS identifiers saved with a store"""
+        return pd.read_parquet(Path(path) / "node_ids.parquet")
+
+
+def _sha256(file: Path) -> str:
+    sha = hashlib.sha256()
+    with open(file, "rb") as f:
+        for block in iter(lambda: f.read(1 << 24), b""):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def incidence(
+    start: np.ndarray, end: np.ndarray, n_nodes: int
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Node to edge adjacency index for an edge list
+
+    Returns
+    -------
+    tuple[np.ndarray, np.ndarray]:
+        CSR offsets and edge positions, so ``edge_ids[indptr[v]:indptr[v + 1]]``
+        are the rows of the edge list touching node ``v``
+    """
+    start = np.asarray(start, dtype=np.int64)
+    end = np.asarray(end, dtype=np.int64)
+    nodes = np.concatenate([start, end])
+    order = np.argsort(nodes, kind="stable")
+    indptr = np.zeros(n_nodes + 1, dtype=np.int64)
+    np.cumsum(np.bincount(nodes, minlength=n_nodes), out=indptr[1:])
+    return indptr, order % len(start)
+
+
+class GridIndex:
+    """
+    Uniform grid over node coordinates for radius queries
+
+    Nodes are bucketed into square cells of ``cell_size`` metres and stored
+    contiguously by cell, so a query only touches the cells overlapping its
+    circle and costs time in proportion to the number of nodes returned.
+    """
+
+    def __init__(
+        self,
+        node_ids: np.ndarray,
+        easting: np.ndarray,
+        northing: np.ndarray,
+        cell_size: float = 1_000.0,
+    ):
+        keep = np.isfinite(easting) & np.isfinite(northing)
+        node_ids, easting, northing = node_ids[keep], easting[keep], northing[keep]
+
+        self.cell_size: float = cell_size
+        self.x0: float = float(easting.min()) if len(easting) else 0.0
+        self.y0: float = float(northing.min()) if len(northing) else 0.0
+        cx = ((easting - self.x0) // cell_size).astype(np.int64)
+        cy = ((northing - self.y0) // cell_size).astype(np.int64)
+        self.nx: int = int(cx.max(initial=0)) + 1
+        self.ny: int = int(cy.max(initial=0)) + 1
+
+        cell = cx * self.ny + cy
+        order = np.argsort(cell, kind="stable")
+        self.node_ids: np.ndarray = np.asarray(node_ids, dtype=np.int64)[order]
+        self.easting: np.ndarray = easting[order]
+        self.northing: np.ndarray = northing[order]
+        self.offsets = np.zeros(self.nx * self.ny + 1, dtype=np.int64)
+        np.cumsum(
+            np.bincount(cell, minlength=self.nx * self.ny), out=self.offsets[1:]
+        )
+
+    def query(
+        self, easting: float, northing: float, radius: float, inner: float = 0.0
+    ) -> np.ndarray:
+        """
+        Node ids further than ``inner`` and no further than ``radius`` from a point
+
+        Passing the previous radius as ``inner`` returns only the ring added when
+        a search area grows, skipping cells that lie wholly inside it.
+        """
+        lo_x = max(int((easting - radius - self.x0) // self.cell_size), 0)
+        hi_x = min(int((easting + radius - self.x0) // self.cell_size), self.nx - 1)
+        lo_y = max(int((northing - radius - self.y0) // self.cell_size), 0)
+        hi_y = min(int((northing + radius - self.y0) // self.cell_size), self.ny - 1)
+        if lo_x > hi_x or lo_y > hi_y:
+            return np.empty(0, dtype=np.int64)
+
+        cx, cy = np.meshgrid(
+            np.arange(lo_x, hi_x + 1), np.arange(lo_y, hi_y + 1), indexing="ij"
+        )
+        cx, cy = cx.ravel(), cy.ravel()
+        if inner > 0:
+            left = self.x0 + cx * self.cell_size - easting
+            bottom = self.y0 + cy * self.cell_size - northing
+            far_x = np.maximum(np.abs(left), np.abs(left + self.cell_size))
+            far_y = np.maximum(np.abs(bottom), np.abs(bottom + self.cell_size))
+            outside = far_x**2 + far_y**2 > inner**2
+            cx, cy = cx[outside], cy[outside]
+
+        pos = gather_rows(self.offsets, cx * self.ny + cy)
+        d2 = (self.easting[pos] - easting) ** 2 + (self.northing[pos] - northing) ** 2
+        return self.node_ids[pos[(d2 <= radius**2) & (d2 > inner**2)]]
+
+    def query_box(
+        self, xmin: float, ymin: float, xmax: float, ymax: float
+    ) -> np.ndarray:
+        """Node ids within a rectangle, edges included"""
+        lo_x = max(int((xmin - self.x0) // self.cell_size), 0)
+        hi_x = min(int((xmax - self.x0) // self.cell_size), self.nx - 1)
+        lo_y = max(int((ymin - self.y0) // self.cell_size), 0)
+        hi_y = min(int((ymax - self.y0) // self.cell_size), self.ny - 1)
+        if lo_x > hi_x or lo_y > hi_y:
+            return np.empty(0, dtype=np.int64)
+
+        cx, cy = np.meshgrid(
+            np.arange(lo_x, hi_x + 1), np.arange(lo_y, hi_y + 1), indexing="ij"
+        )
+        pos = gather_rows(self.offsets, (cx * self.ny + cy).ravel())
+        x, y = self.easting[pos], self.northing[pos]
+        return self.node_ids[pos[(x >= xmin) & (x <= xmax) & (y >= ymin) & (y <= ymax)]]
+
+
+def tiles(
+    easting: np.ndarray,
+    northing: np.ndarray,
+    tile_size: float,
+    bounds: tuple[float, float, float, float] = BNG_BOUNDS,
+) -> np.ndarray:
+    """
+    Square tile of a fixed grid over ``bounds`` holding each point
+
+    The grid only depends on ``bounds`` and ``tile_size``, so the same points are
+    always split the same way. Tiles are numbered row by row from the south west
+    and points outside ``bounds`` go to the nearest edge tile.
+    """
+    xmin, ymin, xmax, ymax = bounds
+    nx = max(int(np.ceil((xmax - xmin) / tile_size)), 1)
+    ny = max(int(np.ceil((ymax - ymin) / tile_size)), 1)
+    cx = ((np.asarray(easting) - xmin) // tile_size).clip(0, nx - 1).astype(np.int64)
+    cy = ((np.asarray(northing) - ymin) // tile_size).clip(0, ny - 1).astype(np.int64)
+    return cy * nx + cx
@@ -0,0 +1,142 @@
+from __future__ import annotations
+
+import json
+import resource
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from ukroutes.common.logger import logger
+
+# seconds spent in each part of routing one POI
+STAGES = ("subgraph", "components", "sssp", "merge")
+COUNTS = {
+    "escalations": np.int32,  # times the buffer (or bounded limit) was raised
+    "nodes": np.int64,  # nodes in the final subgraph, or settled by a bounded search
+    "edges": np.int64,  # edges in the final subgraph, -1 for bounded searches
+    "reached": np.int64,  # output nodes given a distance
+}
+
+
+def peak_rss_mb(who: int = resource.RUSAGE_SELF) -> float:
+    """High-water mark of this process's (or its children's) resident memory"""
+    # kilobytes on Linux, bytes on macOS
+    scale = 1 if sys.platform == "darwin" else 1024
+    return resource.getrusage(who).ru_maxrss * scale / 2**20
+
+
+class RunMetrics:
+    """
+    Per-POI timings and sizes of a routing run
+
+    One preallocated array per measure, indexed by the row of ``inputs``, so
+    recording costs a few ``perf_counter`` calls and array writes per POI.
+    Workers fill their own copy and send back the rows they routed with
+    ``take``, which ``put`` merges into the parent's arrays.
+
+    Measures are the seconds spent extracting the subgraph, checking its
+    components, in the shortest path search and merging the results
+    (``STAGES``), the counts in ``COUNTS``, the final ``radius`` (buffer in
+    metres, or for bounded searches the furthest distance settled in units of
+    ``weights``) and the process's peak RSS after the POI.
+    """
+
+    def __init__(self, n: int):
+        self.n: int = n
+        self.arrays: dict[str, np.ndarray] = {
+            **{f"{stage}_s": np.zeros(n) for stage in STAGES},
+            **{name: np.zeros(n, dtype=dtype) for name, dtype in COUNTS.items()},
+            "radius": np.full(n, np.nan),
+            "peak_rss_mb": np.full(n, np.nan),
+            "done": np.zeros(n, dtype=bool),
+        }
+
+    def add(self, row: int, name: str, value) -> None:
+        self.arrays[name][row] += value
+
+    def set(self, row: int, **values) -> None:
+        for name, value in values.items():
+            self.arrays[name][row] = value
+
+    def finish(self, row: int) -> None:
+        self.arrays["done"][row] = True
+        self.arrays["peak_rss_mb"][row] = peak_rss_mb()
+
+    def take(self, rows: np.ndarray) -> dict[str, np.ndarray]:
+        return {name: array[rows] for name, array in self.arrays.items()}
+
+    def put(self, rows: np.ndarray, values: dict[str, np.ndarray]) -> None:
+        for name, array in values.items():
+            self.arrays[name][rows] = array
+
+    def frame(self, ids=None) -> pd.DataFrame:
+        """
+        One row per routed POI
+
+        Parameters
+        ----------
+        ids : array-like, optional
+            Identifier of each row of ``inputs``, reported as ``poi``
+        """
+        done = self.arrays["done"]
+        df = pd.DataFrame(
+            {
+                "row": np.flatnonzero(done),
+                **({"poi": np.asarray(ids)[done]} if ids is not None else {}),
+                **{name: array[done] for name, array in self.arrays.items()},
+            }
+        ).drop(columns="done")
+        df["total_s"] = df[[f"{stage}_s" for stage in STAGES]].sum(axis=1)
+        return df
+
+    def summary(self, ids=None, slowest: int = 5) -> dict:
+        """Totals by stage, buffer escalations, peak memory and the slowest POIs"""
+        df = self.frame(ids)
+        return {
+            "pois": len(df),
+            "seconds": {
+                stage: float(df[f"{stage}_s"].sum()) for stage in (*STAGES, "total")
+            },
+            "escalations": int(df["escalations"].sum()),
+            "pois_escalated": int((df["escalations"] > 0).sum()),
+            "max_radius": float(df["radius"].max()) if len(df) else None,
+            "peak_rss_mb": float(df["peak_rss_mb"].max()) if len(df) else None,
+            "slowest": df.nlargest(slowest, "total_s").to_dict(orient="records"),
+        }
+
+    def log_summary(self, name: str, ids=None, slowest: int = 5) -> None:
+        summary = self.summary(ids, slowest)
+        seconds = summary["seconds"]
+        logger.info(
+            f"{name}: {summary['pois']} POIs in {seconds['total']:.1f} s "
+            + ", ".join(f"{stage} {seconds[stage]:.1f} s" for stage in STAGES)
+            + f"; {summary['escalations']} buffer escalations over "
+            f"{summary['pois_escalated']} POIs, peak RSS "
+            f"{summary['peak_rss_mb'] or 0:.0f} MB."
+        )
+        for poi in summary["slowest"]:
+            logger.info(
+                f"  slow POI {poi.get('poi', poi['row'])}: {poi['total_s']:.2f} s "
+                f"(subgraph {poi['subgraph_s']:.2f}, components "
+                f"{poi['components_s']:.2f}, sssp {poi['sssp_s']:.2f}), "
+                f"radius {poi['radius']:.0f}, {poi['nodes']} nodes, "
+                f"{poi['escalations']} escalations"
+            )
+
+    def save(self, path: Path, ids=None) -> Path:
+        """
+        Write the run report, Parquet with one row per POI or, for a ``.json``
+        path, the summary and every POI
+        """
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        if path.suffix == ".json":
+            report = self.summary(ids) | {
+                "per_poi": self.frame(ids).to_dict(orient="list")
+            }
+            path.write_text(json.dumps(report, indent=2, default=str))
+        else:
+            self.frame(ids).to_parquet(path, index=False)
+        return path
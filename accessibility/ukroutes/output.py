@@ -0,0 +1,204 @@
+from __future__ import annotations
+
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from ukroutes.common.logger import logger
+
+# partition of rows without a value; Hive's __HIVE_DEFAULT_PARTITION__ is read
+# back as a null that pd.read_parquet cannot combine with the other values
+NULL_PARTITION = "unknown"
+
+
+def to_table(df: pd.DataFrame, ids: tuple[str, ...] = ()) -> pa.Table:
+    """
+    Arrow table of routing results in their compact storage types
+
+    Distances are stored as float32, which keeps well under a second or a
+    metre for any route in Great Britain, and the ``ids`` columns (e.g. TOIDs)
+    are dictionary encoded.
+    """
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    for i, field in enumerate(table.schema):
+        column = table.column(i)
+        if field.name in ids and not pa.types.is_dictionary(field.type):
+            column = pc.dictionary_encode(column)
+        elif pa.types.is_float64(field.type):
+            column = column.cast(pa.float32())
+        else:
+            continue
+        table = table.set_column(i, field.name, column)
+    return table.replace_schema_metadata(None)
+
+
+class PartitionedWriter:
+    """
+    Parquet files partitioned by the value of one column
+
+    Tables are split by ``partition_by`` and appended to
+    ``root / "{partition_by}={value}" / "part-0.parquet"``, one open writer per
+    value, so a dataset can be written a batch at a time. The layout is the
+    Hive style read by ``pd.read_parquet(root)``, Arrow, DuckDB and R's
+    ``arrow::open_dataset``, e.g. one folder per local authority. Without
+    ``partition_by`` everything goes to ``root / "part-0.parquet"``.
+    """
+
+    def __init__(self, root: Path, partition_by: str | None = None):
+        self.root: Path = Path(root)
+        self.partition_by: str | None = partition_by
+        self.rows: int = 0
+        self._writers: dict[str, pq.ParquetWriter] = {}
+
+    def _writer(self, value: str | None, schema: pa.Schema) -> pq.ParquetWriter:
+        if value not in self._writers:
+            folder = self.root
+            if value is not None:
+                folder = folder / f"{self.partition_by}={value}"
+            folder.mkdir(parents=True, exist_ok=True)
+            self._writers[value] = pq.ParquetWriter(
+                folder / "part-0.parquet", schema, compression="zstd"
+            )
+        return self._writers[value]
+
+    def write(self, table: pa.Table) -> None:
+        self.rows += table.num_rows
+        if self.partition_by is None:
+            self._writer(None, table.schema).write_table(table)
+            return
+
+        values = pc.fill_null(
+            table.column(self.partition_by).cast(pa.string()), NULL_PARTITION
+        )
+        table = table.drop_columns([self.partition_by])
+        # one sort by partition value, then a slice per value
+        encoded = pc.dictionary_encode(values).combine_chunks()
+        codes = encoded.indices.to_numpy()
+        order = np.argsort(codes, kind="stable")
+        table = table.take(order)
+        bounds = np.concatenate([[0], np.cumsum(np.bincount(codes))])
+        for code, value in enumerate(encoded.dictionary.to_pylist()):
+            part = table.slice(bounds[code], bounds[code + 1] - bounds[code])
+            self._writer(value, table.schema).write_table(part)
+
+    def close(self) -> None:
+        for writer in self._writers.values():
+            writer.close()
+        self._writers.clear()
+
+    def __enter__(self) -> PartitionedWriter:
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def write_results(
+    df: pd.DataFrame,
+    root: Path,
+    partition_by: str | None = "lad22cd",
+    lookup: pd.DataFrame | None = None,
+    household_id: str = "TOID",
+) -> Path:
+    """
+    Write per-household routing results as partitioned Parquet
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+        Results with ``household_id``, e.g. from ``route_tiers``
+    root : Path
+        Output folder
+    partition_by : str, optional
+        Column to partition by, e.g. the local authority code. Taken from
+        ``lookup`` when not in ``df``
+    lookup : pd.DataFrame, optional
+        ``household_id`` to ``partition_by`` lookup
+
+    Returns
+    -------
+    Path:
+        The output folder
+    """
+    df = df.to_pandas() if hasattr(df, "to_pandas") else df
+    if partition_by is not None and partition_by not in df.columns:
+        df = df.merge(
+            lookup[[household_id, partition_by]].drop_duplicates(household_id),
+            on=household_id,
+            how="left",
+        )
+    with PartitionedWriter(root, partition_by) as writer:
+        writer.write(to_table(df, ids=(household_id,)))
+    logger.info(f"{len(df)} results written to {root}")
+    return Path(root)
+
+
+def fan_out(
+    df: pd.DataFrame,
+    lookup: Path,
+    root: Path,
+    household_id: str = "TOID",
+    address_id: str = "UPRN",
+    partition_by: str | None = "lad22cd",
+    batch_size: int = 1_000_000,
+) -> Path:
+    """
+    Write routing results for every address of each household
+
+    The results are sorted by ``household_id`` once, and the address lookup,
+    the much larger side, is streamed from Parquet ``batch_size`` rows at a
+    time and matched to them by binary search. Memory use is set by the
+    results and one batch, however large the lookup. Addresses whose household
+    has no result are kept, with missing values, as in a left join.
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+        Per-household results with ``household_id``
+    lookup : Path
+        Parquet file with ``household_id`` and ``address_id`` columns, e.g. the
+        TOID to UPRN lookup
+    root : Path
+        Output folder, partitioned as in ``write_results``
+    partition_by : str, optional
+        Column of ``df`` (or else of ``lookup``) to partition by
+
+    Returns
+    -------
+    Path:
+        The output folder
+    """
+    df = df.to_pandas() if hasattr(df, "to_pandas") else df
+    lookup_file = pq.ParquetFile(lookup)
+    columns = [household_id, address_id]
+    if partition_by not in df.columns:
+        if partition_by in lookup_file.schema_arrow.names:
+            columns.append(partition_by)
+        else:
+            partition_by = None
+
+    df = df.sort_values(household_id, kind="stable", ignore_index=True)
+    keys = df[household_id].to_numpy()
+    results = to_table(df, ids=(household_id,)).drop_columns([household_id])
+
+    with PartitionedWriter(root, partition_by) as writer:
+        for batch in lookup_file.iter_batches(batch_size=batch_size, columns=columns):
+            ids = batch.column(household_id).to_numpy(zero_copy_only=False)
+            pos = np.searchsorted(keys, ids)
+            pos[pos == len(keys)] = 0
+            found = (keys[pos] == ids) if len(keys) else np.zeros(len(ids), bool)
+            rows = results.take(pa.array(pos, mask=~found))
+            out = pa.Table.from_batches([batch]).select(columns)
+            out = out.replace_schema_metadata(None)
+            out = out.set_column(
+                0, household_id, pc.dictionary_encode(out.column(household_id))
+            )
+            for name in rows.column_names:
+                out = out.append_column(name, rows.column(name))
+            writer.write(out)
+    logger.info(f"{writer.rows} addresses written to {root}")
+    return Path(root)
@@ -1,39 +1,88 @@
-import cudf
-from scipy.spatial import distance_matrix
+from __future__ import annotations
+
+import argparse
+import shutil
+import time
+from collections.abc import Iterable
+from pathlib import Path
+
+import numpy as np
 import pandas as pd
-import cugraph
 import geopandas as gpd
 import polars as pl
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+import shapely
+from pyogrio.raw import open_arrow
 from scipy.spatial import KDTree
+from shapely.geometry.base import BaseGeometry
+
+from ukroutes.common.cache import StageCache
+from ukroutes.common.logger import logger, setup_logging
+from ukroutes.common.utils import Paths
+from ukroutes.connectivity import join_components, largest_component
+from ukroutes.graph import CSRGraph
+from ukroutes.process_routing import _connector_time, snap_lines
+
+# stages of process_os, in order
+STAGES = ("nodes", "edges", "ferries", "remap", "combine", "graph")
+# bump to invalidate cached stages when their code changes
+CACHE_VERSION = 2
 
-from ukroutes.common.logger import logger
-from ukroutes.common.utils import Paths #, filter_deadends
-from ukroutes.process_routing import add_to_graph
 
 def filter_deadends(nodes, edges):
-    G = cugraph.Graph()
-    G.from_cudf_edgelist(
-        edges, source="start_node", destination="end_node", edge_attr="time_weighted"
-    )
-    components = cugraph.connected_components(G)
-    component_counts = components["labels"].value_counts().reset_index()
-    component_counts.columns = ["labels", "count"]
-
-    largest_component_label = component_counts[
-        component_counts["count"] == component_counts["count"].max()
-    ]["labels"][0]
-
-    largest_component_nodes = components[
-        components["labels"] == largest_component_label
-    ]["vertex"]
-    filtered_edges = edges[
-        edges["start_node"].isin(largest_component_nodes)
-        & edges["end_node"].isin(largest_component_nodes)
-    ]
-    filtered_nodes = nodes[nodes["node_id"].isin(largest_component_nodes)]
+    """Nodes and edges of the largest connected component only"""
+    start = edges["start_node"].to_numpy()
+    end = edges["end_node"].to_numpy()
+    n_nodes = int(max(start.max(), end.max(), nodes["node_id"].max())) + 1
+    keep = largest_component(start, end, n_nodes)
+    filtered_edges = edges[keep[start] & keep[end]]
+    filtered_nodes = nodes[keep[nodes["node_id"].to_numpy()]]
     return filtered_nodes, filtered_edges
 
-def process_road_edges() -> pl.DataFrame:
+
+def _speed_estimate() -> pl.Expr:
+    """Speed estimate (mph) by road classification and form of way"""
+    a_roads = ["A Road", "A Road Primary"]
+    b_roads = ["B Road", "B Road Primary"]
+    return (
+        pl.when(pl.col("road_classification") == "Motorway")
+        .then(67)
+        .when(
+            (
+                pl.col("form_of_way").is_in(
+                    ["Dual Carriageway", "Collapsed Dual Carriageway"]
+                )
+            )
+            & (pl.col("road_classification").is_in(a_roads))
+        )
+        .then(57)
+        .when(
+            (
+                pl.col("form_of_way").is_in(
+                    ["Dual Carriageway", "Collapsed Dual Carriageway"]
+                )
+            )
+            & (pl.col("road_classification").is_in(b_roads))
+        )
+        .then(45)
+        .when(
+            (pl.col("form_of_way") == "Single Carriageway")
+            & (pl.col("road_classification").is_in(a_roads + b_roads))
+        )
+        .then(25)
+        .when(pl.col("road_classification").is_in(["Unclassified"]))
+        .then(24)
+        .when(pl.col("form_of_way").is_in(["Roundabout"]))
+        .then(10)
+        .when(pl.col("form_of_way").is_in(["Track", "Layby"]))
+        .then(5)
+        .otherwise(10)
+        .alias("speed_estimate")
+    )
+
+
+def classify_speeds(road_edges: pl.DataFrame) -> pl.DataFrame:
     """
     Create time estimates for road edges based on OS documentation
 
@@ -42,198 +91,452 @@ def process_road_edges() -> pl.DataFrame:
 
     Parameters
     ----------
-    edges : pd.DataFrame
-        OS highways df containing edges, and other metadata
+    road_edges : pl.DataFrame
+        OS road links with ``road_classification``, ``form_of_way``, ``length``
+        and their start and end nodes
 
     Returns
     -------
-    pd.DataFrame:
-        OS highways df with time weighted estimates
+    pl.DataFrame:
+        Start and end nodes with time weighted estimates and lengths
     """
-
-    a_roads = ["A Road", "A Road Primary"]
-    b_roads = ["B Road", "B Road Primary"]
-
-    road_edges: pl.DataFrame = pl.from_pandas(
-        gpd.read_file(
-            Paths.OPROAD,
-            layer="road_link",
-            ignore_geometry=True,
-            engine="pyogrio",  # much faster
-        )
-    )
-
-    road_edges = (
-        road_edges.with_columns(
-            pl.when(pl.col("road_classification") == "Motorway")
-            .then(67)
-            .when(
-                (
-                    pl.col("form_of_way").is_in(
-                        ["Dual Carriageway", "Collapsed Dual Carriageway"]
-                    )
-                )
-                & (pl.col("road_classification").is_in(a_roads))
-            )
-            .then(57)
-            .when(
-                (
-                    pl.col("form_of_way").is_in(
-                        ["Dual Carriageway", "Collapsed Dual Carriageway"]
-                    )
-                )
-                & (pl.col("road_classification").is_in(b_roads))
-            )
-            .then(45)
-            .when(
-                (pl.col("form_of_way") == "Single Carriageway")
-                & (pl.col("road_classification").is_in(a_roads + b_roads))
-            )
-            .then(25)
-            .when(pl.col("road_classification").is_in(["Unclassified"]))
-            .then(24)
-            .when(pl.col("form_of_way").is_in(["Roundabout"]))
-            .then(10)
-            .when(pl.col("form_of_way").is_in(["Track", "Layby"]))
-            .then(5)
-            .otherwise(10)
-            .alias("speed_estimate")
-        )
+    return (
+        road_edges.with_columns(_speed_estimate())
         .with_columns(pl.col("speed_estimate") * 1.609344)
         .with_columns(
             (((pl.col("length") / 1000) / pl.col("speed_estimate")) * 60).alias(
                 "time_weighted"
             ),
         )
+        .select(["start_node", "end_node", "time_weighted", "length"])
     )
-    return road_edges.select(["start_node", "end_node", "time_weighted", "length"])
 
 
-def process_road_nodes() -> pl.DataFrame:
-    road_nodes = gpd.read_file(Paths.OPROAD, layer="road_node", engine="pyogrio")
-    road_nodes["easting"], road_nodes["northing"] = (
-        road_nodes.geometry.x,
-        road_nodes.geometry.y,
+def _search_area(
+    bbox: tuple[float, float, float, float] | None,
+    region: BaseGeometry | None,
+    buffer: float,
+) -> dict:
+    """``bbox`` or ``mask`` argument for pyogrio, grown by ``buffer`` metres"""
+    if region is not None:
+        return {"mask": region.buffer(buffer) if buffer else region}
+    if bbox is not None:
+        xmin, ymin, xmax, ymax = bbox
+        return {"bbox": (xmin - buffer, ymin - buffer, xmax + buffer, ymax + buffer)}
+    return {}
+
+
+def _stream_layer(
+    layer: str,
+    out_file: Path,
+    transform,
+    columns: list[str],
+    read_geometry: bool,
+    area: dict,
+    batch_size: int,
+) -> int:
+    """
+    Stream an OS Open Roads layer through ``transform`` into a parquet file
+
+    Features are read as Arrow record batches of ``batch_size`` and each is
+    transformed and appended to ``out_file`` before the next is read, so memory
+    is bounded by the batch size rather than the layer.
+
+    Returns
+    -------
+    int:
+        Number of rows written
+    """
+    out_file.parent.mkdir(parents=True, exist_ok=True)
+    rows = 0
+    with open_arrow(
+        Paths.OPROAD,
+        layer=layer,
+        columns=columns,
+        read_geometry=read_geometry,
+        batch_size=batch_size,
+        use_pyarrow=True,
+        **area,
+    ) as (meta, reader):
+        geometry = meta["geometry_name"] or "wkb_geometry"
+        writer = None
+        try:
+            for batch in reader:
+                table = transform(batch, geometry).to_arrow()
+                if writer is None:
+                    writer = pq.ParquetWriter(out_file, table.schema)
+                writer.write_table(table)
+                rows += table.num_rows
+            if writer is None:
+                # nothing in the area, still write the schema
+                table = transform(reader.schema.empty_table(), geometry).to_arrow()
+                pq.write_table(table, out_file)
+        finally:
+            if writer is not None:
+                writer.close()
+    logger.debug(f"{rows} {layer} features written to {out_file}")
+    return rows
+
+
+def process_road_edges(
+    bbox: tuple[float, float, float, float] | None = None,
+    region: BaseGeometry | None = None,
+    buffer: float = 0.0,
+    node_ids: pl.Series | None = None,
+    batch_size: int = 65_536,
+    out_file: Path = Paths.OS_LINKS,
+) -> Path:
+    """
+    Stream OS road links with time estimates, optionally within an area
+
+    Links are read in batches, classified with ``classify_speeds`` and written
+    to ``out_file`` as they arrive, so only one batch is ever in memory.
+
+    Parameters
+    ----------
+    bbox : tuple[float, float, float, float], optional
+        ``(xmin, ymin, xmax, ymax)`` in British National Grid metres
+    region : BaseGeometry, optional
+        Polygon to keep links intersecting, used instead of ``bbox``
+    buffer : float
+        Metres to grow ``bbox`` or ``region`` by
+    node_ids : pl.Series, optional
+        Keep only links with both ends in these nodes, e.g. those of the area
+    batch_size : int
+        Features read at a time
+    out_file : Path
+        Parquet file written
+
+    Returns
+    -------
+    Path:
+        ``out_file``, holding start and end nodes with time weighted estimates
+        and lengths; read it with ``pl.scan_parquet`` or ``pl.read_parquet``
+    """
+    keep = None if node_ids is None else node_ids.to_arrow()
+
+    def transform(batch, geometry):
+        if keep is not None:
+            batch = batch.filter(
+                pc.and_(
+                    pc.is_in(batch["start_node"], value_set=keep),
+                    pc.is_in(batch["end_node"], value_set=keep),
+                )
+            )
+        return classify_speeds(pl.from_arrow(batch))
+
+    _stream_layer(
+        "road_link",
+        out_file,
+        transform,
+        ["road_classification", "form_of_way", "length", "start_node", "end_node"],
+        False,
+        _search_area(bbox, region, buffer),
+        batch_size,
     )
-    return pl.from_pandas(road_nodes[["id", "easting", "northing"]]).rename(
-        {"id": "node_id"}
+    return out_file
+
+
+def process_road_nodes(
+    bbox: tuple[float, float, float, float] | None = None,
+    region: BaseGeometry | None = None,
+    buffer: float = 0.0,
+    batch_size: int = 65_536,
+    out_file: Path = Paths.OS_NODES,
+) -> Path:
+    """
+    Stream OS road node coordinates to ``out_file``, optionally within an area
+
+    Takes the same area arguments as ``process_road_edges`` and likewise
+    returns ``out_file``.
+    """
+
+    def transform(batch, geometry):
+        points = shapely.from_wkb(batch[geometry].to_numpy(zero_copy_only=False))
+        return pl.DataFrame(
+            {
+                "node_id": pl.from_arrow(batch["id"]),
+                "easting": shapely.get_x(points),
+                "northing": shapely.get_y(points),
+            }
+        )
+
+    _stream_layer(
+        "road_node",
+        out_file,
+        transform,
+        ["id"],
+        True,
+        _search_area(bbox, region, buffer),
+        batch_size,
     )
+    return out_file
 
 
-def ferry_routes(road_nodes: pl.DataFrame) -> tuple[pl.DataFrame, pl.DataFrame]:
+def ferry_routes(
+    road_nodes: pl.DataFrame, area: BaseGeometry | None = None
+) -> tuple[pl.DataFrame, pl.DataFrame]:
     # http://overpass-turbo.eu/?q=LyoKVGhpcyBoYcSGYmVlbiBnxI1lcmF0ZWQgYnkgdGhlIG92xJJwxIlzLXR1cmJvIHdpemFyZC7EgsSdxJ9yaWdpbmFsIHNlxLBjaMSsxIk6CsOiwoDCnHJvdcSVPWbEknJ5xYjCnQoqLwpbxYx0Ompzb25dW3RpbWXFmzoyNV07Ci8vxI_ElMSdciByZXN1bHRzCigKICDFryBxdcSSxJrEo3J0IGZvcjogxYjFisWbZcWPxZHFk8KAxZXGgG5vZGVbIsWLxY1lIj0ixZByxZIiXSh7e2LEqnh9fSnFrcaAd2F5xp_GocSVxqTGpsaWxqrGrMauxrDGssa0xb_FtWVsxJRpxaDGusaTxr3Gp8apxqvGrcavb8axxrPFrceFxoJwxLduxorFtsW4xbrFvMWbxJjGnHnFrT7Frcejc2vHiMaDdDs&c=BH1aTWQmgG
 
-    ferries = gpd.read_file(Paths.RAW / "oproad" / "ferries.geojson")[
+    ferries = gpd.read_file(Paths.FERRIES)[
         ["id", "geometry"]
     ].to_crs("EPSG:27700")
-    ferry_nodes = (
-        ferries[ferries["id"].str.startswith("node")].copy().reset_index(drop=True)
+    if area is not None:
+        ferries = ferries[ferries.intersects(area)]
+    ferry_nodes = ferries[ferries["id"].str.startswith("node")]
+    road_nodes = road_nodes.to_pandas()
+    xy = shapely.get_coordinates(ferry_nodes.geometry.to_numpy())
+    _, indices = KDTree(road_nodes[["easting", "northing"]].to_numpy()).query(xy)
+    ferry_nodes = pd.DataFrame(
+        {
+            "node_id": road_nodes["node_id"].to_numpy()[indices],
+            "easting": xy[:, 0],
+            "northing": xy[:, 1],
+        }
     )
-    ferry_nodes["easting"], ferry_nodes["northing"] = (
-        ferry_nodes.geometry.x,
-        ferry_nodes.geometry.y,
+    ferry_edges = snap_lines(
+        ferries[ferries["id"].str.startswith("relation")].geometry, road_nodes
     )
-    ferry_edges = (
-        ferries[ferries["id"].str.startswith("relation")]
-        .explode(index_parts=False)
-        .copy()
-        .reset_index(drop=True)
+    return (
+        pl.from_pandas(ferry_nodes),
+        pl.from_pandas(
+            ferry_edges[["start_node", "end_node", "time_weighted", "length"]]
+        ),
     )
-    road_nodes = road_nodes.to_pandas().copy()
 
-    nodes_tree = KDTree(road_nodes[["easting", "northing"]].values)
-    distances, indices = nodes_tree.query(ferry_nodes[["easting", "northing"]].values)
-    ferry_nodes["node_id"] = road_nodes.iloc[indices]["node_id"].reset_index(drop=True)
 
-    ferry_edges["length"] = ferry_edges["geometry"].apply(lambda x: x.length)
-    ferry_edges = ferry_edges.assign(
-        time_weighted=(ferry_edges["length"].astype(float) / 1000) / 25 * 1.609344 * 60
-    )
+def combine_subgraphs(nodes, edges):
+    """
+    Link every island of the road network to the main component
 
-    ferry_edges["start_node"] = ferry_edges["geometry"].apply(lambda x: x.coords[0])
-    ferry_edges["easting"], ferry_edges["northing"] = (
-        ferry_edges["start_node"].apply(lambda x: x[0]),
-        ferry_edges["start_node"].apply(lambda x: x[1]),
-    )
-    distances, indices = nodes_tree.query(ferry_edges[["easting", "northing"]])
-    ferry_edges["start_node"] = road_nodes.iloc[indices]["node_id"].reset_index(
-        drop=True
+    Each island, e.g. a private estate or a ferry terminal whose OS links do not
+    reach the public network, is joined by a single connector edge between its
+    node nearest the main component and that nearest main node (see
+    ``join_components``). Island roads are kept, so routes can still use them.
+    Nodes on no edge are dropped.
+    """
+    start = edges["start_node"].to_numpy()
+    end = edges["end_node"].to_numpy()
+    n_nodes = int(max(start.max(), end.max(), nodes["node_id"].max())) + 1
+    easting = np.full(n_nodes, np.nan)
+    northing = np.full(n_nodes, np.nan)
+    easting[nodes["node_id"].to_numpy()] = nodes["easting"].to_numpy()
+    northing[nodes["node_id"].to_numpy()] = nodes["northing"].to_numpy()
+
+    island_node, main_node, length, _ = join_components(start, end, easting, northing)
+    length = length + 0.01
+    connectors = pd.DataFrame(
+        {
+            "start_node": island_node,
+            "end_node": main_node,
+            "time_weighted": _connector_time(length),
+            "length": length,
+        }
     )
+    on_edge = np.zeros(n_nodes, dtype=bool)
+    on_edge[start] = on_edge[end] = True
+    nodes = nodes[on_edge[nodes["node_id"].to_numpy()]]
+    edges = pd.concat([edges, connectors], ignore_index=True)
+    return nodes, edges
+
+
+def _write(df, file: Path) -> None:
+    df = df.to_pandas() if hasattr(df, "to_pandas") else df
+    df.to_parquet(file, index=False)
+
+
+def process_os(
+    bbox: tuple[float, float, float, float] | None = None,
+    region: BaseGeometry | None = None,
+    buffer: float = 0.0,
+    batch_size: int = 65_536,
+    force: Iterable[str] = (),
+):
+    """
+    Build the routing graph from OS Open Roads and the ferry routes
+
+    The road layers are streamed in batches of ``batch_size``. Give a ``bbox``
+    or ``region`` (British National Grid), grown by ``buffer`` metres, to build
+    the graph for an area rather than all of Great Britain; links are kept when
+    both their ends are in the area.
+
+    Each of the ``STAGES`` is cached in ``Paths.OS_CACHE`` under a hash of the
+    files it reads, its settings and the outputs of the stages before it, so a
+    rerun only recomputes stages whose inputs changed, e.g. only the ferries and
+    what follows them after editing the ferry routes. Stages named in ``force``
+    are recomputed regardless. The final graph is copied to ``Paths.OS_GRAPH``.
+    """
+    logger.info("Starting OS highways processing...")
+    t1 = time.time()
+    cache = StageCache(Paths.OS_CACHE, force=force)
+    area = _search_area(bbox, region, buffer)
+    params = {
+        "bbox": bbox,
+        "region": None if region is None else region.wkb_hex,
+        "buffer": buffer,
+        "version": CACHE_VERSION,
+    }
 
-    ferry_edges["end_node"] = ferry_edges["geometry"].apply(lambda x: x.coords[-1])
-    ferry_edges["easting"], ferry_edges["northing"] = (
-        ferry_edges["end_node"].apply(lambda x: x[0]),
-        ferry_edges["end_node"].apply(lambda x: x[1]),
+    nodes_dir = cache.run(
+        "nodes",
+        lambda out: process_road_nodes(
+            bbox, region, buffer, batch_size, out_file=out / "nodes.parquet"
+        ),
+        files=[Paths.OPROAD],
+        params=params,
     )
-    distances, indices = nodes_tree.query(ferry_edges[["easting", "northing"]])
-    ferry_edges["end_node"] = road_nodes.iloc[indices]["node_id"].reset_index(drop=True)
-    return (
-        pl.from_pandas(ferry_nodes[["node_id", "easting", "northing"]]),
-        pl.from_pandas(
-            ferry_edges[["start_node", "end_node", "time_weighted", "length"]]
+    edges_dir = cache.run(
+        "edges",
+        lambda out: process_road_edges(
+            bbox,
+            region,
+            buffer,
+            node_ids=(
+                pl.read_parquet(nodes_dir / "nodes.parquet", columns=["node_id"])[
+                    "node_id"
+                ]
+                if area
+                else None
+            ),
+            batch_size=batch_size,
+            out_file=out / "edges.parquet",
         ),
+        files=[Paths.OPROAD],
+        params=params,
+        upstream=[nodes_dir] if area else [],
     )
 
+    def ferries(out: Path) -> None:
+        mask = shapely.box(*area["bbox"]) if "bbox" in area else area.get("mask")
+        ferry_nodes, ferry_edges = ferry_routes(
+            pl.read_parquet(nodes_dir / "nodes.parquet"), mask
+        )
+        ferry_nodes.write_parquet(out / "nodes.parquet")
+        ferry_edges.write_parquet(out / "edges.parquet")
 
-def combine_subgraphs(nodes, edges):
-    graph = cugraph.Graph()
-    graph.from_cudf_edgelist(
-        cudf.from_pandas(edges), source="start_node", destination="end_node"
-    )
-    components = cugraph.connected_components(graph)
-    component_counts = components["labels"].value_counts().reset_index()
-
-    largest_component_label = component_counts[
-        component_counts["count"] == component_counts["count"].max()
-    ]["labels"][0]
-    largest_component = components[components["labels"] == largest_component_label]
-    largest_cn = nodes[nodes["node_id"].isin(largest_component["vertex"].to_pandas())]
-    largest_ce = edges[
-        edges["start_node"].isin(largest_component["vertex"].to_pandas())
-        | edges["end_node"].isin(largest_component["vertex"].to_pandas())
-    ]
-
-    subgraph_component_labels = component_counts[
-        component_counts["labels"] != largest_component_label
-    ]["labels"]
-    subgraph_component = components[
-        components["labels"].isin(subgraph_component_labels)
-    ]
-    sub_cn = nodes[nodes["node_id"].isin(subgraph_component["vertex"].to_pandas())]
-
-    _, nodes, edges = add_to_graph(
-        sub_cn,
-        cudf.from_pandas(largest_cn),
-        cudf.from_pandas(largest_ce),
+    ferries_dir = cache.run(
+        "ferries", ferries, files=[Paths.FERRIES], params=params, upstream=[nodes_dir]
     )
-    return nodes, edges
 
+    def remap(out: Path) -> None:
+        nodes = pl.concat(
+            [
+                pl.read_parquet(nodes_dir / "nodes.parquet"),
+                pl.read_parquet(ferries_dir / "nodes.parquet"),
+            ]
+        ).to_pandas()
+        edges = pl.concat(
+            [
+                pl.read_parquet(edges_dir / "edges.parquet"),
+                pl.read_parquet(ferries_dir / "edges.parquet"),
+            ]
+        ).to_pandas()
+
+        unique_node_ids = nodes["node_id"].unique()
+        node_id_mapping = {
+            node_id: new_id for new_id, node_id in enumerate(unique_node_ids)
+        }
+        nodes["node_id"] = nodes["node_id"].map(node_id_mapping)
+        edges["start_node"] = edges["start_node"].map(node_id_mapping)
+        edges["end_node"] = edges["end_node"].map(node_id_mapping)
+
+        _write(nodes, out / "nodes.parquet")
+        _write(edges, out / "edges.parquet")
+        # the OS ids behind each node_id
+        _write(
+            pd.DataFrame(
+                {"node_id": np.arange(len(unique_node_ids)), "os_id": unique_node_ids}
+            ),
+            out / "node_ids.parquet",
+        )
 
-def process_os():
-    logger.info("Starting OS highways processing...")
-    edges = process_road_edges()
-    nodes = process_road_nodes()
+    remap_dir = cache.run(
+        "remap",
+        remap,
+        params={"version": CACHE_VERSION},
+        upstream=[nodes_dir, edges_dir, ferries_dir],
+    )
 
-    ferry_nodes, ferry_edges = ferry_routes(nodes)
-    nodes = pl.concat([nodes, ferry_nodes]).to_pandas()
-    edges = pl.concat([edges, ferry_edges]).to_pandas()
+    def combine(out: Path) -> None:
+        nodes, edges = combine_subgraphs(
+            pd.read_parquet(remap_dir / "nodes.parquet"),
+            pd.read_parquet(remap_dir / "edges.parquet"),
+        )
+        _write(nodes, out / "nodes.parquet")
+        _write(edges, out / "edges.parquet")
 
-    unique_node_ids = nodes["node_id"].unique()
-    node_id_mapping = {
-        node_id: new_id for new_id, node_id in enumerate(unique_node_ids)
-    }
-    nodes["node_id"] = nodes["node_id"].map(node_id_mapping)
-    edges["start_node"] = edges["start_node"].map(node_id_mapping)
-    edges["end_node"] = edges["end_node"].map(node_id_mapping)
+    combine_dir = cache.run(
+        "combine", combine, params={"version": CACHE_VERSION}, upstream=[remap_dir]
+    )
+
+    def graph(out: Path) -> None:
+        nodes = pd.read_parquet(combine_dir / "nodes.parquet")
+        edges = pd.read_parquet(combine_dir / "edges.parquet")
+        # memory mappable CSR copy of the graph, with the OS ids behind each node_id
+        node_ids = pd.read_parquet(remap_dir / "node_ids.parquet")
+        node_ids = node_ids[node_ids["node_id"].isin(nodes["node_id"].to_numpy())]
+        CSRGraph.from_frames(edges, nodes).save(out / "csr", node_ids=node_ids)
+
+    graph_dir = cache.run(
+        "graph",
+        graph,
+        params={"version": CACHE_VERSION},
+        upstream=[remap_dir, combine_dir],
+    )
+
+    Paths.OS_GRAPH.mkdir(parents=True, exist_ok=True)
+    for name in ["nodes.parquet", "edges.parquet"]:
+        shutil.copyfile(combine_dir / name, Paths.OS_GRAPH / name)
+        logger.debug(f"{name} saved to {Paths.OS_GRAPH / name}")
+    shutil.rmtree(Paths.OS_GRAPH_STORE, ignore_errors=True)
+    shutil.copytree(graph_dir / "csr", Paths.OS_GRAPH_STORE)
+    logger.debug(f"Graph store saved to {Paths.OS_GRAPH_STORE}")
+
+    timings = ", ".join(f"{name} {tdiff:.1f}s" for name, tdiff in cache.timings.items())
+    logger.info(
+        f"OS highways processed in {time.time() - t1:.1f} seconds ({timings})."
+    )
 
-    # nodes, edges = filter_deadends(cudf.from_pandas(nodes), cudf.from_pandas(edges))
-    nodes, edges = combine_subgraphs(nodes, edges)
 
-    nodes.to_pandas().to_parquet(Paths.OS_GRAPH / "nodes.parquet", index=False)
-    logger.debug(f"Nodes saved to {Paths.OS_GRAPH / 'nodes.parquet'}")
-    edges.to_pandas().to_parquet(Paths.OS_GRAPH / "edges.parquet", index=False)
-    logger.debug(f"Edges saved to {Paths.OS_GRAPH / 'edges.parquet'}")
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Build the OS road routing graph")
+    parser.add_argument(
+        "--bbox",
+        type=float,
+        nargs=4,
+        metavar=("XMIN", "YMIN", "XMAX", "YMAX"),
+        help="British National Grid extent to build the graph for",
+    )
+    parser.add_argument(
+        "--region",
+        type=Path,
+        help="polygon file to build the graph for, instead of --bbox",
+    )
+    parser.add_argument("--buffer", type=float, default=0.0)
+    parser.add_argument("--batch-size", type=int, default=65_536)
+    parser.add_argument(
+        "--force",
+        choices=STAGES,
+        action="append",
+        default=[],
+        help="recompute a stage even if it is cached, repeatable",
+    )
+    args = parser.parse_args(argv)
+    setup_logging()
+
+    region = None
+    if args.region is not None:
+        region = shapely.union_all(
+            gpd.read_file(args.region).to_crs("EPSG:27700").geometry.values
+        )
+    process_os(
+        bbox=tuple(args.bbox) if args.bbox else None,
+        region=region,
+        buffer=args.buffer,
+        batch_size=args.batch_size,
+        force=args.force,
+    )
 
 
 if __name__ == "__main__":
-    process_os()
+    main()
@@ -1,12 +1,66 @@
-import cudf
-import cupy as cp
+from __future__ import annotations
+
+import importlib
+from typing import NamedTuple
+
 import numpy as np
 import pandas as pd
+import shapely
 from scipy.spatial import KDTree
 
+from ukroutes.graph import gather_rows
+
+# metres to which connector lengths are compared when deduplicating points, so
+# float noise does not keep points at the same place apart
+DEDUP_EPSILON = 1e-3
+
+
+def _xdf(df):
+    """The dataframe library (pandas or cudf) that ``df`` belongs to"""
+    return importlib.import_module(type(df).__module__.split(".")[0])
+
+
+def _connector_time(length):
+    """Minutes to cover a connector of ``length`` metres"""
+    return (length / 1000) / 25 * 1.609344 * 60
 
-def add_to_graph(df, nodes, edges, k=10):
-    nodes_tree = KDTree(nodes[["easting", "northing"]].values.get())
+
+def add_to_graph(df, nodes, edges, k=10, dedup=False, tolerance=0.0):
+    """
+    Link points to their ``k`` nearest road nodes with new connector edges
+
+    Each point becomes a node joined to its ``k`` nearest nodes by edges of the
+    straight line length (plus 1 cm), with a walking time.
+
+    With ``dedup`` points snapping to the same road nodes share one connector
+    node. Points are grouped when their distances to each of those road nodes,
+    less the distance to the nearest, are the same to within ``tolerance``
+    metres (``DEDUP_EPSILON`` for ``tolerance=0``), so they differ only by how
+    far they are from the road. The group's node and connectors are those of
+    its first point, and each point's ``offset_length`` (and
+    ``offset_time_weighted``) is how much further from the road it is than that
+    point. Route to the shared node and add a point's offset to get its own
+    distance. The graph grows by one node per group rather than per point,
+    e.g. a tower block adds one.
+
+    With ``k=1`` every point on a road node joins one group and the distances
+    are exact. With ``k>=2`` and ``tolerance=0`` only points at the same place
+    (to within ``DEDUP_EPSILON``) are grouped, which is also exact. With
+    ``k>=2`` and ``tolerance>0`` deduplication is lossy: besides an error of up
+    to ``tolerance`` per point, the connectors of grouped points are gone, and
+    routes that cut through them between two road nodes are lost, which can
+    change other points' distances by more than ``tolerance``.
+
+    Returns
+    -------
+    tuple:
+        ``df`` with its ``node_id`` (and offsets with ``dedup``), and the
+        extended ``nodes`` and ``edges``
+    """
+    if dedup:
+        return _add_to_graph_dedup(df, nodes, edges, k, tolerance)
+    xdf = _xdf(nodes)
+    nodes_tree = KDTree(nodes[["easting", "northing"]].to_numpy())
     distances, indices = nodes_tree.query(df[["easting", "northing"]].values, k=k)
 
     nearest_nodes_df = pd.DataFrame(
@@ -18,13 +72,12 @@ def add_to_graph(df, nodes, edges, k=10):
         }
     )
 
-    new_node_ids = cp.arange(len(nodes) + 1, len(nodes) + 1 + len(df))
-    df["node_id"] = new_node_ids.get()
+    new_node_ids = np.arange(len(nodes) + 1, len(nodes) + 1 + len(df))
+    df["node_id"] = new_node_ids
     new_nodes = df[["node_id", "easting", "northing"]]
-    nodes = cudf.concat([nodes, cudf.from_pandas(new_nodes)])
-    nodes
+    nodes = xdf.concat([nodes, xdf.DataFrame(new_nodes)])
 
-    new_edges = cudf.DataFrame(
+    new_edges = xdf.DataFrame(
         {
             "start_node": df.loc[np.repeat(df.index, k)].reset_index(drop=True)[
                 "node_id"
@@ -33,10 +86,8 @@ def add_to_graph(df, nodes, edges, k=10):
             "length": nearest_nodes_df["distance"],
         }
     )
-    new_edges["time_weighted"] = (
-        (new_edges["length"].astype(float) / 1000) / 25 * 1.609344 * 60
-    )
-    edges = cudf.concat([edges, new_edges])
+    new_edges["time_weighted"] = _connector_time(new_edges["length"].astype(float))
+    edges = xdf.concat([edges, new_edges])
 
     return (
         df.reset_index(drop=True),
@@ -45,42 +96,187 @@ def add_to_graph(df, nodes, edges, k=10):
     )
 
 
-def add_topk(input, output, k=10):
-    df_tree = KDTree(input[["easting", "northing"]].values)
-    distances, indices = df_tree.query(output[["easting", "northing"]].values, k=k)
-
-    indices = pd.DataFrame(indices)
-    input = (
-        pd.concat([output.reset_index(drop=True), indices], axis=1)[
-            ["node_id"] + indices.columns.tolist()
-        ]
-        .set_index("node_id")
-        .stack()
-        .rename("df_idx")
-        .reset_index()
-        .rename(columns={"node_id": "top_nodes"})
-        .drop("level_1", axis=1)
-        .dropna()
-        .groupby("df_idx")
-        .agg(list)
-        .join(input, how="right")
+def _add_to_graph_dedup(df, nodes, edges, k, tolerance):
+    xdf = _xdf(nodes)
+    nodes_tree = KDTree(nodes[["easting", "northing"]].to_numpy())
+    xy = df[["easting", "northing"]].to_numpy()
+    distances, indices = nodes_tree.query(xy, k=k)
+    distances = distances.reshape(len(df), k)
+    snapped = nodes["node_id"].to_numpy()[indices.reshape(len(df), k)]
+
+    # road nodes in id order so the same set always gives the same key
+    order = np.argsort(snapped, axis=1)
+    snapped = np.take_along_axis(snapped, order, axis=1)
+    distances = np.take_along_axis(distances, order, axis=1)
+    offset = distances.min(axis=1)
+    shape = distances - offset[:, None]
+    shape = np.round(shape / DEDUP_EPSILON) * DEDUP_EPSILON
+    if tolerance > 0:
+        shape = np.floor(shape / tolerance)
+    _, first, group = np.unique(
+        np.column_stack([snapped, shape]), axis=0, return_index=True, return_inverse=True
     )
-    input["top_nodes"] = input["top_nodes"].apply(
-        lambda row: list(set(row)) if isinstance(row, list) else row
+    group = group.ravel()
+
+    n_groups = len(first)
+    new_node_ids = np.arange(len(nodes) + 1, len(nodes) + 1 + n_groups)
+    new_nodes = xdf.DataFrame(
+        {
+            "node_id": new_node_ids,
+            "easting": xy[first, 0],
+            "northing": xy[first, 1],
+        }
     )
-    distances = pd.DataFrame(distances).stack().rename("buffer").reset_index()
-    indices = indices.stack().rename("node_id").reset_index()
-
-    buffers = (
-        pd.DataFrame(
-            {
-                "node_id": input.iloc[indices["node_id"].values]["node_id"],
-                "buffer": distances["buffer"].values,
-            }
-        )
-        .sort_values("buffer", ascending=False)
-        .drop_duplicates("node_id")
+    nodes = xdf.concat([nodes, new_nodes])
+
+    # connectors are the first point's, so routes can't cut through a group any
+    # more cheaply than through one of its points
+    length = distances[first].ravel() + 0.01
+    new_edges = xdf.DataFrame(
+        {
+            "start_node": np.repeat(new_node_ids, k),
+            "end_node": snapped[first].ravel(),
+            "length": length,
+            "time_weighted": _connector_time(length),
+        }
+    )
+    edges = xdf.concat([edges, new_edges])
+
+    df["node_id"] = new_node_ids[group]
+    df["offset_length"] = offset - offset[first][group]
+    df["offset_time_weighted"] = _connector_time(df["offset_length"])
+    return (
+        df.reset_index(drop=True),
+        nodes.reset_index(drop=True),
+        edges.reset_index(drop=True),
     )
-    input = input[input["top_nodes"].apply(lambda x: isinstance(x, list))]
 
-    return input.merge(buffers, on="node_id", how="left").dropna()
+
+def snap_lines(lines, nodes, travel_time=_connector_time) -> pd.DataFrame:
+    """
+    Edges for lines whose ends are snapped to their nearest graph nodes
+
+    Works on whole arrays with shapely 2: multi-part lines are split into their
+    parts, the first and last point and the length of every part are read in
+    one call each, and both ends are snapped with a single ``KDTree`` query.
+    Used for ferry routes, and suited to other linear features such as paths
+    and cycle routes.
+
+    Parameters
+    ----------
+    lines : array-like
+        (Multi)LineStrings in British National Grid, e.g. a GeoSeries
+    nodes : DataFrame
+        Graph nodes with ``node_id``, ``easting`` and ``northing``
+    travel_time : Callable
+        Minutes to cover an array of lengths in metres, by default the connector
+        speed also used for ferries
+
+    Returns
+    -------
+    pd.DataFrame:
+        One row per non-empty line part with the position of its ``line`` in
+        ``lines``, ``start_node``, ``end_node``, ``time_weighted``, ``length``
+        and the distance from each end to its node (``start_offset`` and
+        ``end_offset``)
+    """
+    parts, line = shapely.get_parts(np.asarray(lines, dtype=object), return_index=True)
+    keep = ~shapely.is_empty(parts)
+    parts, line = parts[keep], line[keep]
+    ends = shapely.get_coordinates(
+        np.concatenate([shapely.get_point(parts, 0), shapely.get_point(parts, -1)])
+    )
+    length = shapely.length(parts)
+
+    node_ids = np.asarray(nodes["node_id"])
+    tree = KDTree(np.column_stack([nodes["easting"], nodes["northing"]]))
+    offset, idx = tree.query(ends, workers=-1)
+    n = len(parts)
+    return pd.DataFrame(
+        {
+            "line": line,
+            "start_node": node_ids[idx[:n]],
+            "end_node": node_ids[idx[n:]],
+            "time_weighted": travel_time(length),
+            "length": length,
+            "start_offset": offset[:n],
+            "end_offset": offset[n:],
+        }
+    )
+
+
+class TopNodes(NamedTuple):
+    """
+    Output nodes each POI must reach, in CSR form
+
+    ``nodes[offsets[i]:offsets[i + 1]]`` are the nodes for row ``i`` of the POI
+    frame, so millions of POIs cost two flat integer arrays rather than a
+    column of Python lists.
+    """
+
+    offsets: np.ndarray
+    nodes: np.ndarray
+
+    def row(self, i: int) -> np.ndarray:
+        return self.nodes[self.offsets[i] : self.offsets[i + 1]]
+
+    def take(self, rows: np.ndarray) -> TopNodes:
+        """The top nodes of ``rows``, in that order"""
+        rows = np.asarray(rows, dtype=np.int64)
+        offsets = np.zeros(len(rows) + 1, dtype=np.int64)
+        np.cumsum(self.offsets[rows + 1] - self.offsets[rows], out=offsets[1:])
+        return TopNodes(offsets, self.nodes[gather_rows(self.offsets, rows)])
+
+    @classmethod
+    def from_lists(cls, lists) -> TopNodes:
+        """From a sequence of node lists, e.g. an old ``top_nodes`` column"""
+        lists = [np.asarray(nodes, dtype=np.int64).ravel() for nodes in lists]
+        offsets = np.zeros(len(lists) + 1, dtype=np.int64)
+        np.cumsum([len(nodes) for nodes in lists], out=offsets[1:])
+        nodes = np.concatenate(lists) if lists else np.empty(0, dtype=np.int64)
+        return cls(offsets, nodes)
+
+
+def add_topk(input, output, k=10):
+    """
+    Link each POI to the outputs it is one of the ``k`` nearest POIs for
+
+    Each output is matched to its ``k`` nearest POIs with a ``KDTree``. A POI's
+    ``buffer`` is its distance to the furthest output matched to it (the largest
+    of any POI on the same node), and POIs matched to no output are dropped.
+
+    Returns
+    -------
+    tuple[DataFrame, TopNodes]:
+        The kept POIs with a ``buffer`` column, and the node ids of the outputs
+        matched to each, one CSR row per POI row, to pass to ``Routing``
+    """
+    df_tree = KDTree(input[["easting", "northing"]].to_numpy())
+    distances, indices = df_tree.query(output[["easting", "northing"]].to_numpy(), k=k)
+    distances = distances.reshape(len(output), k).ravel()
+    indices = indices.reshape(len(output), k).ravel()
+    households = np.repeat(output["node_id"].to_numpy(), k)
+
+    # queries for more neighbours than there are POIs pad with len(input)
+    found = indices < len(input)
+    poi, households, distances = indices[found], households[found], distances[found]
+
+    buffer = np.full(len(input), np.nan)
+    np.fmax.at(buffer, poi, distances)
+    # POIs sharing a node share the largest buffer
+    buffer = pd.Series(buffer).groupby(input["node_id"].to_numpy()).transform("max")
+
+    order = np.lexsort((households, poi))
+    poi, households = poi[order], households[order]
+    first = np.ones(len(poi), dtype=bool)
+    first[1:] = (poi[1:] != poi[:-1]) | (households[1:] != households[:-1])
+    poi, households = poi[first], households[first]
+
+    counts = np.bincount(poi, minlength=len(input))
+    keep = np.flatnonzero(counts > 0)
+    offsets = np.zeros(len(keep) + 1, dtype=np.int64)
+    np.cumsum(counts[keep], out=offsets[1:])
+
+    input = input.iloc[keep].reset_index(drop=True)
+    input["buffer"] = buffer.to_numpy()[keep]
+    return input, TopNodes(offsets, households)
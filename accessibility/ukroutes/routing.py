@@ -1,154 +1,836 @@
 from __future__ import annotations
 
+import hashlib
+import multiprocessing
+import os
 import time
-import warnings
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
 from typing import NamedTuple
 
-import cudf
-import cugraph
-import cupy as cp
+import numpy as np
+import pandas as pd
 from rich.progress import track
+from scipy.spatial import KDTree
 
+from ukroutes.backends import get_backend
 from ukroutes.common.logger import logger
+from ukroutes.graph import tiles
+from ukroutes.metrics import RunMetrics
+from ukroutes.process_routing import TopNodes
+
+# set in the parent before forking so workers inherit the graph without pickling
+_WORKER_ROUTING: Routing | None = None
+
+
+def _route_chunk(rows: np.ndarray):
+    routing = _WORKER_ROUTING
+    routing.reset()
+    for row, item in zip(rows, routing.inputs.iloc[rows].itertuples()):
+        routing.get_shortest_dists(item, routing.targets(row), row=row)
+    return *routing._reached(), routing.metrics.take(rows)
+
+
+def _route_tile(rows: np.ndarray, halo: float):
+    return _WORKER_ROUTING._route_region(rows, halo)
+
+
+def _local_ids(ids: np.ndarray, values) -> np.ndarray:
+    """Positions of ``values`` in sorted ``ids``, -1 where missing"""
+    values = np.asarray(values, dtype=np.int64)
+    idx = np.searchsorted(ids, values).clip(max=max(len(ids) - 1, 0))
+    return np.where((len(ids) > 0) & (ids[idx] == values), idx, -1)
+
+
+def _to_host(array) -> np.ndarray:
+    return array.get() if hasattr(array, "get") else np.asarray(array)
+
+
+def _to_pandas(df) -> pd.DataFrame:
+    return df.to_pandas() if hasattr(df, "to_pandas") else df
+
+
+def _id_columns(input_id: str) -> list[str]:
+    # input_id may be node_id itself
+    return list(dict.fromkeys([input_id, "node_id"]))
+
+
+def diff_inputs(
+    old, new, input_id: str = "node_id"
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Inputs added to and removed from a POI set, for ``Routing.fit_incremental``
+
+    Inputs are matched on ``input_id``. One whose road node changed, e.g. a
+    park with a new access point, is both removed and added.
+
+    Returns
+    -------
+    tuple[np.ndarray, np.ndarray]:
+        ``input_id`` values of ``new`` not in ``old`` (added) and of ``old``
+        not in ``new`` (removed)
+    """
+    old = _to_pandas(old)[_id_columns(input_id)].drop_duplicates()
+    new = _to_pandas(new)[_id_columns(input_id)].drop_duplicates()
+    both = old.merge(new, how="outer", indicator=True)
+    added = both.loc[both["_merge"] == "right_only", input_id].unique()
+    removed = both.loc[both["_merge"] == "left_only", input_id].unique()
+    return np.asarray(added), np.asarray(removed)
 
 
 class Routing:
     def __init__(
         self,
         name: str,
-        edges: cudf.DataFrame,
-        nodes: cudf.DataFrame,
-        outputs: cudf.DataFrame,
-        inputs: cudf.DataFrame,
+        edges,
+        nodes,
+        outputs,
+        inputs,
         weights: str = "time_weighted",
         min_buffer: int = 5_000,
         max_buffer: int = 1_000_000,
         cutoff: int | None = None,
+        backend: str | object = "cugraph",
+        n_jobs: int | None = None,
+        input_id: str = "node_id",
+        checkpoint_dir: Path | None = None,
+        checkpoint_every: int = 1_000,
+        secondary: tuple[str, ...] = (),
+        search: str = "buffer",
+        top_nodes: TopNodes | None = None,
+        report: Path | None = None,
     ):
+        """
+        Parameters
+        ----------
+        backend : str
+            ``"cugraph"`` to route on the GPU with RAPIDS, or ``"cpu"`` to use
+            NumPy/SciPy. Frames should be cudf for the former and pandas for the latter.
+            An already built backend for the same graph and ``weights`` can be
+            passed instead, so several POI sets can share one graph; ``edges``
+            and ``nodes`` may then be ``None``, e.g. for a CPU backend over a
+            graph store opened with ``CSRGraph.load``.
+        n_jobs : int, optional
+            Worker processes for backends that support them, defaults to all cores
+        input_id : str
+            Column of ``inputs`` reported as the ``source`` of each distance
+        checkpoint_dir : Path, optional
+            Folder for ``fit`` checkpoints, none are written if not given
+        checkpoint_every : int
+            Number of POIs routed between checkpoints
+        secondary : tuple[str, ...]
+            Other edge columns summed along each shortest ``weights`` path, e.g.
+            ``("length",)`` to get the distance of the quickest route in the same
+            pass. Each is added to ``distances`` as a column of the same name.
+        search : str
+            How ``fit`` limits each POI's search. ``"buffer"`` routes within a
+            subgraph around the POI, doubling its buffer from ``min_buffer`` to
+            ``max_buffer`` until the POI and its ``top_nodes`` are connected.
+            ``"bounded"`` searches the full graph and stops once all
+            ``top_nodes`` are reached or ``cutoff`` is hit, so no subgraphs
+            are built and the distances are exact; the buffers are unused.
+        top_nodes : TopNodes, optional
+            Output nodes each row of ``inputs`` must reach, as returned by
+            ``add_topk``. Read from a ``top_nodes`` list column of ``inputs``
+            if not given.
+        report : Path, optional
+            File for the run report written at the end of ``fit`` and
+            ``fit_partitioned``: per-POI timings and sizes (see ``RunMetrics``)
+            as Parquet, or with a summary as JSON for a ``.json`` path. A summary
+            with the slowest POIs is logged either way.
+        """
+        if search not in ("buffer", "bounded"):
+            raise ValueError(f"Unknown search {search!r}, use 'buffer' or 'bounded'")
         self.name: str = name
-        self.outputs: cudf.DataFrame = outputs
-        self.inputs: cudf.DataFrame = inputs
+        self.outputs = outputs
+        self.inputs = inputs
 
-        self.road_edges: cudf.DataFrame = edges
-        self.road_nodes: cudf.GeoDataFrame = nodes
+        self.road_edges = edges
+        self.road_nodes = nodes
         self.weights: str = weights
         self.min_buffer: int = min_buffer
         self.max_buffer: int = max_buffer
         self.cutoff: int = cutoff
+        self.input_id: str = input_id
+        self.checkpoint_dir: Path | None = (
+            Path(checkpoint_dir) if checkpoint_dir is not None else None
+        )
+        self.checkpoint_every: int = checkpoint_every
+        self.secondary: tuple[str, ...] = tuple(secondary)
+        self.search: str = search
+        if top_nodes is None and "top_nodes" in inputs.columns:
+            lists = inputs["top_nodes"]
+            top_nodes = TopNodes.from_lists(
+                lists.to_pandas() if hasattr(lists, "to_pandas") else lists
+            )
+        self.top_nodes: TopNodes | None = top_nodes
+        self.report: Path | None = Path(report) if report is not None else None
+        self._key: str | None = None
+
+        self.backend = (
+            get_backend(backend)(edges=edges, nodes=nodes, weights=weights)
+            if isinstance(backend, str)
+            else backend
+        )
+        self.n_jobs: int = (n_jobs or os.cpu_count() or 1) if self.backend.processes else 1
+
+        # minimum distance to each output node and the POI node it came from, in
+        # dense arrays with one slot per output node so memory stays flat
+        xp = self.backend.xp
+        self.output_nodes = xp.asarray(np.unique(self.outputs["node_id"].to_numpy()))
+        self._slot = xp.full(
+            max(self.backend.n_nodes, int(self.output_nodes.max()) + 1),
+            -1,
+            dtype=np.int64,
+        )
+        self._slot[self.output_nodes] = xp.arange(len(self.output_nodes))
+        self.reset()
+
+    def reset(self) -> None:
+        """Clear all routed distances and run metrics"""
+        self.metrics: RunMetrics = RunMetrics(len(self.inputs))
+        xp = self.backend.xp
+        self._dist = xp.full(len(self.output_nodes), np.inf)
+        self._source = xp.full(len(self.output_nodes), -1, dtype=np.int64)
+        self._extra = {
+            name: xp.full(len(self.output_nodes), np.nan) for name in self.secondary
+        }
+
+    @property
+    def distances(self):
+        """
+        Minimum distance to each reached output node
+
+        Built from the accumulator arrays each time it is read.
+
+        Returns
+        -------
+        DataFrame:
+            ``vertex``, ``distance``, the ``source`` POI (as ``input_id``) and
+            a column per ``secondary`` attribute
+        """
+        slot, distance, source, extra = self._reached()
+        dist = self.backend.xdf.DataFrame(
+            {
+                "vertex": self.output_nodes[slot],
+                "distance": distance,
+                "source": source,
+                **extra,
+            }
+        )
+        if self.input_id != "node_id":
+            ids = self.backend.xdf.DataFrame(
+                self.inputs[["node_id", self.input_id]]
+                .drop_duplicates("node_id")
+                .rename(columns={"node_id": "source", self.input_id: "source_id"})
+            )
+            dist = (
+                dist.merge(ids, on="source", how="left")
+                .drop(columns="source")
+                .rename(columns={"source_id": "source"})
+            )
+        return dist[["vertex", "distance", "source", *self.secondary]]
+
+    def targets(self, row: int) -> np.ndarray:
+        """Output nodes that row ``row`` of ``inputs`` must reach"""
+        if self.top_nodes is None:
+            return np.empty(0, dtype=np.int64)
+        return self.top_nodes.row(row)
+
+    def _reached(self):
+        slot = self.backend.xp.flatnonzero(self.backend.xp.isfinite(self._dist))
+        return (
+            slot,
+            self._dist[slot],
+            self._source[slot],
+            {name: extra[slot] for name, extra in self._extra.items()},
+        )
+
+    def _update(self, slot, distance, source, extra=None) -> None:
+        """Scatter-min into the accumulator, ``slot`` must not repeat"""
+        better = distance < self._dist[slot]
+        slot = slot[better]
+        self._dist[slot] = distance[better]
+        self._source[slot] = source if np.ndim(source) == 0 else source[better]
+        for name, values in (extra or {}).items():
+            self._extra[name][slot] = values[better]
+
+    def _record(self, vertex, distance, source, extra=None) -> int:
+        """Merge distances to any nodes into the accumulator, returns outputs reached"""
+        slot = self._slot[vertex]
+        keep = slot >= 0
+        self._update(
+            slot[keep],
+            distance[keep],
+            source if np.ndim(source) == 0 else source[keep],
+            {name: values[keep] for name, values in (extra or {}).items()},
+        )
+        return int(keep.sum())
 
-        with warnings.catch_warnings():
-            warnings.simplefilter(action="ignore", category=FutureWarning)
-            self.graph = cugraph.Graph()
-            self.graph.from_cudf_edgelist(
-                self.road_edges,
-                source="start_node",
-                destination="end_node",
-                edge_attr=self.weights,
-                renumber=False,
+    @property
+    def checkpoint_key(self) -> str:
+        """
+        Hash of the graph, inputs, outputs and routing settings
+
+        Checkpoints are stored under this key, so one written for a different
+        network or POI set is never picked up on resume.
+        """
+        if self._key is None:
+            sha = hashlib.sha256()
+            if self.road_edges is not None:
+                columns = [
+                    self.road_edges[col].to_numpy()
+                    for col in ["start_node", "end_node", self.weights]
+                ]
+            else:
+                graph = self.backend.graph
+                columns = [graph.indptr, graph.indices, graph.weights[self.weights]]
+            columns += [
+                self.inputs[col].to_numpy()
+                for col in ["node_id", "easting", "northing", "buffer"]
+            ]
+            columns.append(self.outputs["node_id"].to_numpy())
+            if self.top_nodes is not None:
+                columns += [self.top_nodes.offsets, self.top_nodes.nodes]
+            for column in columns:
+                sha.update(np.ascontiguousarray(column).tobytes())
+            sha.update(
+                repr(
+                    (
+                        self.weights,
+                        self.cutoff,
+                        self.min_buffer,
+                        self.max_buffer,
+                        self.secondary,
+                        self.search,
+                    )
+                ).encode()
             )
+            self._key = sha.hexdigest()[:16]
+        return self._key
+
+    @property
+    def checkpoint_path(self) -> Path | None:
+        if self.checkpoint_dir is None:
+            return None
+        return self.checkpoint_dir / f"{self.name}_{self.checkpoint_key}"
+
+    def save_checkpoint(self, done: np.ndarray) -> None:
+        """
+        Write completed POIs and the current per-output minima
+
+        ``done`` flags the rows of ``inputs`` already routed. Each array is written
+        to a temporary file and moved into place, with ``done`` last, so an
+        interrupted write can only cause some POIs to be routed again.
+        """
+        path = self.checkpoint_path
+        path.mkdir(parents=True, exist_ok=True)
+        arrays = {
+            "distance": _to_host(self._dist),
+            "source": _to_host(self._source),
+            **{f"extra_{name}": _to_host(extra) for name, extra in self._extra.items()},
+            "done": np.packbits(done),
+        }
+        for name, array in arrays.items():
+            with open(path / f"{name}.npy.tmp", "wb") as f:
+                np.save(f, array)
+            os.replace(path / f"{name}.npy.tmp", path / f"{name}.npy")
+        logger.debug(f"Checkpoint saved to {path} ({done.sum()}/{len(done)} POIs)")
+
+    def load_checkpoint(self) -> np.ndarray:
+        """
+        Restore the per-output minima from the checkpoint for this key
+
+        Returns
+        -------
+        np.ndarray:
+            Flags for the rows of ``inputs`` already routed, all ``False`` if no
+            checkpoint exists
+        """
+        path = self.checkpoint_path
+        done = np.zeros(len(self.inputs), dtype=bool)
+        if path is None or not (path / "done.npy").exists():
+            logger.info(f"No checkpoint found for {self.name}, starting from scratch.")
+            return done
 
-        self.distances: cudf.DataFrame = cudf.DataFrame()
+        xp = self.backend.xp
+        done = np.unpackbits(np.load(path / "done.npy"), count=len(done)).astype(bool)
+        self._dist = xp.asarray(np.load(path / "distance.npy"))
+        self._source = xp.asarray(np.load(path / "source.npy"))
+        self._extra = {
+            name: xp.asarray(np.load(path / f"extra_{name}.npy"))
+            for name in self.secondary
+        }
+        logger.info(f"Resuming {self.name} with {done.sum()}/{len(done)} POIs done.")
+        return done
 
-    def fit(self) -> None:
+    def fit(self, resume: bool = False) -> None:
         """
         Iterate and apply routing to each POI
 
-        This function primarily allows for the intermediate steps in routing to be
-        logged. This means that if the routing is stopped midway it can be restarted.
+        If ``checkpoint_dir`` is set, the POIs done so far and the current
+        distances are saved every ``checkpoint_every`` POIs and when routing
+        finishes. With ``resume`` a stopped run restarts from its last
+        checkpoint, skipping the POIs it had already routed.
         """
         t1 = time.time()
-        for item in track(
-            self.inputs.itertuples(),
-            description=f"Processing {self.name}...",
-            total=len(self.inputs),
-        ):
-            self.get_shortest_dists(item)
+        done = (
+            self.load_checkpoint()
+            if resume
+            else np.zeros(len(self.inputs), dtype=bool)
+        )
+        if self.n_jobs > 1:
+            self._fit_parallel(done)
+        else:
+            todo = np.flatnonzero(~done)
+            since_checkpoint = 0
+            for row, item in track(
+                zip(todo, self.inputs.iloc[todo].itertuples()),
+                description=f"Processing {self.name}...",
+                total=len(todo),
+            ):
+                self.get_shortest_dists(item, self.targets(row), row=row)
+                done[row] = True
+                since_checkpoint += 1
+                if self.checkpoint_dir and since_checkpoint >= self.checkpoint_every:
+                    self.save_checkpoint(done)
+                    since_checkpoint = 0
+        if self.checkpoint_dir:
+            self.save_checkpoint(done)
         t2 = time.time()
         tdiff = t2 - t1
         logger.debug(f"Routing complete for {self.name} in {tdiff / 60:.2f} minutes.")
+        self._report()
 
-    def create_sub_graph(self, item) -> cugraph.Graph:
-        buffer = max(self.min_buffer, item.buffer)
-        while True:
-            nodes_subset = self.road_nodes.copy()
-            nodes_subset["distance"] = cp.sqrt(
-                (nodes_subset["easting"] - item.easting) ** 2
-                + (nodes_subset["northing"] - item.northing) ** 2
+    def fit_nearest(self) -> None:
+        """
+        Route from every POI at once, keeping the nearest one for each output
+
+        All input nodes are seeded at distance zero in a single multi-source
+        shortest path pass over the full graph, replacing the per-POI loop of
+        ``fit``. There is no buffer heuristic, so the distances are the exact
+        minima that ``fit`` gives when its buffers hold the shortest paths, with
+        or without ``cutoff``.
+        """
+        t1 = time.time()
+        self.reset()
+        self._record(
+            *self.backend.nearest(
+                self.inputs["node_id"].to_numpy(),
+                cutoff=self.cutoff,
+                secondary=self.secondary,
             )
-            nodes_subset = (
-                nodes_subset[nodes_subset["distance"] <= buffer]["node_id"]
-                .unique()
-                .to_pandas()
-                .tolist()
+        )
+        t2 = time.time()
+        tdiff = t2 - t1
+        logger.debug(
+            f"Nearest routing complete for {self.name} in {tdiff / 60:.2f} minutes."
+        )
+
+    def fit_incremental(self, previous, added=(), removed=()) -> None:
+        """
+        Update the distances of an earlier ``fit_nearest`` run after a POI change
+
+        ``inputs`` is the new POI set and ``previous`` the ``distances`` of the
+        earlier run (or a Parquet file of them), on the same graph, outputs and
+        settings. Outputs whose nearest POI was removed are routed again from
+        the remaining POIs, with searches bounded to the distance they need,
+        then a single search from the added POIs, bounded by the furthest
+        output they could bring nearer, updates the outputs they improve.
+        Everything else keeps its previous distance and ``source``. The result
+        matches ``fit_nearest`` on the new POI set, as both are exact (up to
+        which POI is reported for equally near ones).
+
+        Parameters
+        ----------
+        previous : DataFrame or Path
+            ``vertex``, ``distance``, ``source`` (as ``input_id``) and any
+            ``secondary`` columns of the earlier run
+        added : array-like
+            ``input_id`` of the rows of ``inputs`` that are new, see ``diff_inputs``
+        removed : array-like
+            ``input_id`` of the POIs of the earlier run that are gone
+        """
+        t1 = time.time()
+        if isinstance(previous, (str, Path)):
+            previous = pd.read_parquet(previous)
+        previous = _to_pandas(previous)
+        missing = {"vertex", "distance", "source", *self.secondary} - set(
+            previous.columns
+        )
+        if missing:
+            raise ValueError(f"Previous distances have no {sorted(missing)} columns")
+        inputs = _to_pandas(self.inputs)[_id_columns(self.input_id)]
+        is_added = inputs[self.input_id].isin(np.asarray(added)).to_numpy()
+
+        self.reset()
+        previous = previous[_to_host(self._slot)[previous["vertex"].to_numpy()] >= 0]
+        lost = previous["source"].isin(np.asarray(removed)).to_numpy()
+        self._load(previous[~lost], inputs)
+        self._reroute(
+            previous["vertex"].to_numpy()[lost],
+            inputs["node_id"].to_numpy()[~is_added],
+            start=float(previous["distance"].to_numpy()[lost].max(initial=0)),
+        )
+        self._add_sources(inputs["node_id"].to_numpy()[is_added])
+        t2 = time.time()
+        tdiff = t2 - t1
+        logger.debug(
+            f"Incremental routing for {self.name} ({is_added.sum()} POIs added, "
+            f"{len(np.unique(removed))} removed, {lost.sum()} outputs rerouted) "
+            f"complete in {tdiff / 60:.2f} minutes."
+        )
+
+    def _load(self, previous: pd.DataFrame, inputs: pd.DataFrame) -> None:
+        """Fill the accumulator from earlier distances of output nodes"""
+        xp = self.backend.xp
+        # sources are reported as input ids but held as their nodes
+        inputs = inputs.drop_duplicates(self.input_id)
+        node = pd.Series(
+            inputs["node_id"].to_numpy(), index=inputs[self.input_id].to_numpy()
+        )
+        source = node.reindex(previous["source"].to_numpy()).to_numpy()
+        if np.isnan(source).any():
+            raise ValueError(
+                "Previous distances come from POIs neither in inputs nor removed"
             )
-            edges_subset = self.road_edges.copy()
-            edges_subset = edges_subset[
-                edges_subset["start_node"].isin(nodes_subset)
-                | edges_subset["end_node"].isin(nodes_subset)
-            ]
+        slot = self._slot[xp.asarray(previous["vertex"].to_numpy())]
+        self._dist[slot] = xp.asarray(previous["distance"].to_numpy())
+        self._source[slot] = xp.asarray(source.astype(np.int64))
+        for name in self.secondary:
+            self._extra[name][slot] = xp.asarray(previous[name].to_numpy())
 
-            with warnings.catch_warnings():
-                warnings.simplefilter(action="ignore", category=FutureWarning)
-                sub_graph = cugraph.Graph()
-                sub_graph.from_cudf_edgelist(
-                    edges_subset,
-                    source="start_node",
-                    destination="end_node",
-                    edge_attr=self.weights,
+    def _reroute(self, outputs: np.ndarray, sources: np.ndarray, start: float) -> None:
+        """
+        Route ``outputs`` from the nearest of ``sources``
+
+        Each round is a multi-source search bounded at ``limit`` from the
+        sources that may be within ``limit`` of an output given the lowest
+        weight per metre of straight line, which settles exactly the outputs
+        whose nearest source is within it; the limit doubles for the rest.
+        """
+        xp = self.backend.xp
+        cutoff = np.inf if self.cutoff is None else self.cutoff
+        components = self.backend.components
+        # outputs in a part of the network without sources stay unreached
+        outputs = outputs[np.isin(components[outputs], components[sources])]
+        easting, northing = self.backend.easting, self.backend.northing
+        limit = max(start, self.backend.min_weight)
+        while len(outputs):
+            limit = min(limit, cutoff)
+            radius = (
+                limit / self.backend.per_metre if self.backend.per_metre > 0 else np.inf
+            )
+            line, _ = KDTree(np.c_[easting[outputs], northing[outputs]]).query(
+                np.c_[easting[sources], northing[sources]]
+            )
+            if (line <= radius).any():
+                self._record(
+                    *self.backend.nearest(
+                        sources[line <= radius],
+                        cutoff=None if np.isinf(limit) else limit,
+                        secondary=self.secondary,
+                    )
                 )
-                main_sub_graph = self._remove_partial_graphs(sub_graph, edges_subset)
+            slot = self._slot[xp.asarray(outputs)]
+            outputs = outputs[_to_host(xp.isinf(self._dist[slot]))]
+            if limit >= cutoff:
+                break
+            limit = limit * 2
+
+    def _add_sources(self, sources: np.ndarray) -> None:
+        """Merge in the outputs that ``sources`` are nearer to than their current POI"""
+        if len(sources) == 0:
+            return
+        cutoff = np.inf if self.cutoff is None else self.cutoff
+        outputs = _to_host(self.output_nodes)
+        distance = _to_host(self._dist)
+        easting, northing = self.backend.easting, self.backend.northing
+        line, _ = KDTree(np.c_[easting[sources], northing[sources]]).query(
+            np.c_[easting[outputs], northing[outputs]]
+        )
+        components = self.backend.components
+        # no route from a new source can be shorter than this lower bound
+        nearer = (self.backend.per_metre * line < distance) & np.isin(
+            components[outputs], components[sources]
+        )
+        if not nearer.any():
+            return
+        limit = min(distance[nearer].max(), cutoff)
+        self._record(
+            *self.backend.nearest(
+                sources,
+                cutoff=None if np.isinf(limit) else limit,
+                secondary=self.secondary,
+            )
+        )
 
-            if main_sub_graph is None:
-                if buffer >= self.max_buffer:
-                    return sub_graph
-                buffer = buffer * 2
-                print(f"Missing graph, Buffer increased to {buffer}")
-                continue
+    def _fit_parallel(self, done: np.ndarray) -> None:
+        global _WORKER_ROUTING
+        _WORKER_ROUTING = self
+        # several chunks per worker so a few slow rural POIs don't hold up the pool,
+        # and no larger than the checkpoint interval
+        todo = np.flatnonzero(~done)
+        n_chunks = max(self.n_jobs * 8, -(-len(todo) // self.checkpoint_every))
+        chunks = [rows for rows in np.array_split(todo, n_chunks) if len(rows)]
+        since_checkpoint = 0
+        try:
+            with ProcessPoolExecutor(
+                max_workers=self.n_jobs,
+                mp_context=multiprocessing.get_context("fork"),
+            ) as pool:
+                futures = {pool.submit(_route_chunk, rows): rows for rows in chunks}
+                for future in track(
+                    as_completed(futures),
+                    description=f"Processing {self.name} on {self.n_jobs} cores...",
+                    total=len(futures),
+                ):
+                    *reached, metrics = future.result()
+                    self._update(*reached)
+                    self.metrics.put(futures[future], metrics)
+                    done[futures[future]] = True
+                    since_checkpoint += len(futures[future])
+                    if self.checkpoint_dir and since_checkpoint >= self.checkpoint_every:
+                        self.save_checkpoint(done)
+                        since_checkpoint = 0
+        finally:
+            _WORKER_ROUTING = None
 
-            ntarget_nds = cudf.Series(item.top_nodes).isin(main_sub_graph.nodes()).sum()
-            df_node = item.node_id in main_sub_graph.nodes().to_arrow().to_pylist()
+    def fit_partitioned(
+        self,
+        tile_size: float = 50_000,
+        halo: float | None = None,
+        resume: bool = False,
+    ) -> None:
+        """
+        Route POIs tile by tile in worker processes, for national scale runs
 
-            if (
-                df_node & (ntarget_nds == len(item.top_nodes))
-                or buffer >= self.max_buffer
-            ):
+        POIs are split by a fixed grid of ``tile_size`` metre squares over the
+        British National Grid. Each tile is routed in one of ``n_jobs`` workers
+        on its own small graph, the edges within ``halo`` metres of the tile's
+        POIs, and the per-output minima of all tiles are merged in tile order,
+        so a run always splits and merges the same way. Checkpoints work as for
+        ``fit``, one tile at a time.
+
+        The distances match ``fit`` when ``halo`` covers every POI's search.
+        By default it is the largest subgraph buffer of the tile's POIs for
+        ``search="buffer"``, which always does. For ``search="bounded"`` it is
+        the furthest a route within ``cutoff`` can go given the lowest weight
+        per metre of the network, or ``max_buffer`` if there is no cutoff, when
+        routes to ``top_nodes`` must stay within it. Only backends that route in
+        processes over a ``CSRGraph`` (``"cpu"``) are supported.
+        """
+        if not self.backend.processes:
+            raise ValueError(
+                f"Partitioned routing needs a process based backend, not {self.backend.name}"
+            )
+        t1 = time.time()
+        done = (
+            self.load_checkpoint()
+            if resume
+            else np.zeros(len(self.inputs), dtype=bool)
+        )
+        tile = tiles(
+            self.inputs["easting"].to_numpy(),
+            self.inputs["northing"].to_numpy(),
+            tile_size,
+        )
+        todo = np.flatnonzero(~done)
+        order = todo[np.argsort(tile[todo], kind="stable")]
+        groups = np.split(order, np.flatnonzero(np.diff(tile[order])) + 1)
+        groups = [rows for rows in groups if len(rows)]
+
+        global _WORKER_ROUTING
+        _WORKER_ROUTING = self
+        since_checkpoint = 0
+        try:
+            with ProcessPoolExecutor(
+                max_workers=self.n_jobs,
+                mp_context=multiprocessing.get_context("fork"),
+            ) as pool:
+                futures = [
+                    (rows, pool.submit(_route_tile, rows, self._halo(rows, halo)))
+                    for rows in groups
+                ]
+                # merged in submission order so ties resolve the same every run
+                for rows, future in track(
+                    futures,
+                    description=f"Processing {self.name} in {len(groups)} tiles...",
+                ):
+                    *reached, metrics = future.result()
+                    self._record(*reached)
+                    self.metrics.put(rows, metrics)
+                    done[rows] = True
+                    since_checkpoint += len(rows)
+                    if self.checkpoint_dir and since_checkpoint >= self.checkpoint_every:
+                        self.save_checkpoint(done)
+                        since_checkpoint = 0
+        finally:
+            _WORKER_ROUTING = None
+        if self.checkpoint_dir:
+            self.save_checkpoint(done)
+        t2 = time.time()
+        tdiff = t2 - t1
+        logger.debug(
+            f"Partitioned routing complete for {self.name} in {tdiff / 60:.2f} minutes."
+        )
+        self._report()
+
+    def _report(self) -> None:
+        """Log the run summary and write the report, if asked for"""
+        ids = self.inputs[self.input_id].to_numpy()
+        self.metrics.log_summary(self.name, ids)
+        if self.report is not None:
+            path = self.metrics.save(self.report, ids)
+            logger.info(f"Run report for {self.name} saved to {path}")
+
+    def _halo(self, rows: np.ndarray, halo: float | None) -> float:
+        """Distance around a tile's POIs that their searches can reach"""
+        if halo is not None:
+            return halo
+        if self.search == "bounded":
+            if self.cutoff is not None and self.backend.per_metre > 0:
+                return self.cutoff / self.backend.per_metre
+            return self.max_buffer
+        # buffers double from their start until they pass max_buffer
+        buffer = np.maximum(self.inputs["buffer"].to_numpy()[rows], self.min_buffer)
+        grow = np.ceil(np.log2(np.maximum(self.max_buffer / buffer, 1)))
+        return float((buffer * 2**grow).max())
+
+    def _route_region(self, rows: np.ndarray, halo: float):
+        """Route ``rows`` of ``inputs`` on the graph within ``halo`` of them"""
+        inputs = self.inputs.iloc[rows].copy()
+        easting = inputs["easting"].to_numpy()
+        northing = inputs["northing"].to_numpy()
+        region = self.backend.index.query_box(
+            easting.min() - halo,
+            northing.min() - halo,
+            easting.max() + halo,
+            northing.max() + halo,
+        )
+        graph, ids = self.backend.graph.subgraph(region)
+        outputs = _local_ids(ids, _to_host(self.output_nodes))
+        outputs = outputs[outputs >= 0]
+        empty = (np.empty(0, dtype=np.int64), np.empty(0), np.empty(0, dtype=np.int64))
+        if len(outputs) == 0:
+            return (
+                *empty,
+                {name: np.empty(0) for name in self.secondary},
+                RunMetrics(len(rows)).take(slice(None)),
+            )
+
+        backend = type(self.backend)(weights=self.weights, graph=graph)
+        # bounded searches must start, grow and skip targets as on the full graph
+        backend.components = self.backend.components[ids]
+        backend.per_metre = self.backend.per_metre
+        backend.min_weight = self.backend.min_weight
+
+        inputs["node_id"] = _local_ids(ids, inputs["node_id"].to_numpy())
+        top_nodes = None
+        if self.top_nodes is not None:
+            top_nodes = self.top_nodes.take(rows)
+            top_nodes = TopNodes(top_nodes.offsets, _local_ids(ids, top_nodes.nodes))
+        routing = Routing(
+            name=self.name,
+            edges=None,
+            nodes=None,
+            outputs=pd.DataFrame({"node_id": outputs}),
+            inputs=inputs,
+            weights=self.weights,
+            min_buffer=self.min_buffer,
+            max_buffer=self.max_buffer,
+            cutoff=self.cutoff,
+            backend=backend,
+            n_jobs=1,
+            secondary=self.secondary,
+            search=self.search,
+            top_nodes=top_nodes,
+        )
+        for row, item in enumerate(inputs.itertuples()):
+            routing.get_shortest_dists(item, routing.targets(row), row=row)
+        slot, distance, source, extra = routing._reached()
+        return (
+            ids[routing.output_nodes[slot]],
+            distance,
+            ids[source],
+            extra,
+            routing.metrics.take(slice(None)),
+        )
+
+    def create_sub_graph(self, item, top_nodes: np.ndarray, row: int | None = None):
+        buffer = max(self.min_buffer, item.buffer)
+        sub_graph = None
+        while True:
+            t1 = time.perf_counter()
+            # growing the buffer extends the last subgraph rather than starting over
+            sub_graph = self.backend.sub_graph(
+                item.easting, item.northing, buffer, previous=sub_graph
+            )
+            t2 = time.perf_counter()
+            connected = self.backend.in_main_component(
+                sub_graph, np.append(top_nodes, item.node_id)
+            )
+            if row is not None:
+                self.metrics.add(row, "subgraph_s", t2 - t1)
+                self.metrics.add(row, "components_s", time.perf_counter() - t2)
+            if connected or buffer >= self.max_buffer:
+                if row is not None:
+                    self.metrics.set(row, radius=buffer)
                 return sub_graph
             buffer = buffer * 2
-            print(f"Buffer increased to {buffer}")
-
-    def _remove_partial_graphs(self, sub_graph, edges_subset):
-        components = cugraph.connected_components(sub_graph)
-        largest_component_label = components["labels"].mode()[0]
-
-        largest_component_nodes = set(
-            components[components["labels"] == largest_component_label]["vertex"]
-            .to_pandas()
-            .to_list()
-        )
-        filtered_edges = edges_subset[
-            edges_subset["start_node"].isin(largest_component_nodes)
-            | edges_subset["end_node"].isin(largest_component_nodes)
-        ]
-        main_sub_graph = cugraph.Graph()
-        main_sub_graph.from_cudf_edgelist(
-            filtered_edges,
-            source="start_node",
-            destination="end_node",
-            edge_attr=self.weights,
-        )
-        return main_sub_graph
-
-    def get_shortest_dists(self, item: NamedTuple) -> None:
-        sub_graph = self.create_sub_graph(item=item)
+            if row is not None:
+                self.metrics.add(row, "escalations", 1)
+            logger.debug(f"Buffer increased to {buffer}")
+
+    def get_shortest_dists(
+        self, item: NamedTuple, top_nodes: np.ndarray, row: int | None = None
+    ) -> None:
+        """
+        Route one POI and merge its distances
+
+        ``row`` is the POI's position in ``inputs``, under which its timings
+        and sizes are recorded in ``metrics``; nothing is recorded without it.
+        """
+        t1 = time.perf_counter()
+        if self.search == "bounded":
+            vertex, distance, extra, escalations = self.backend.bounded_sssp(
+                item.node_id,
+                top_nodes,
+                cutoff=self.cutoff,
+                secondary=self.secondary,
+            )
+            t2 = time.perf_counter()
+            reached = self._record(vertex, distance, item.node_id, extra)
+            if row is not None:
+                self.metrics.set(
+                    row,
+                    sssp_s=t2 - t1,
+                    merge_s=time.perf_counter() - t2,
+                    escalations=escalations,
+                    radius=float(distance.max()) if len(distance) else 0.0,
+                    nodes=len(vertex),
+                    edges=-1,
+                    reached=reached,
+                )
+                self.metrics.finish(row)
+            return
+        sub_graph = self.create_sub_graph(item=item, top_nodes=top_nodes, row=row)
         if sub_graph is None:
             return
-        spaths: cudf.DataFrame = cugraph.filter_unreachable(
-            cugraph.sssp(sub_graph, source=item.node_id, cutoff=self.cutoff)
-        )
-        dist = spaths[spaths.vertex.isin(self.outputs["node_id"])]
-        self.distances = cudf.concat([self.distances, dist])
-        self.distances = (
-            self.distances.sort_values("distance")
-            .drop_duplicates("vertex")
-            .reset_index()[["vertex", "distance"]]
+        t1 = time.perf_counter()
+        vertex, distance, extra = self.backend.sssp(
+            sub_graph, source=item.node_id, cutoff=self.cutoff, secondary=self.secondary
         )
+        t2 = time.perf_counter()
+        reached = self._record(vertex, distance, item.node_id, extra)
+        if row is not None:
+            nodes, edges = self.backend.size(sub_graph)
+            self.metrics.set(
+                row,
+                sssp_s=t2 - t1,
+                merge_s=time.perf_counter() - t2,
+                nodes=nodes,
+                edges=edges,
+                reached=reached,
+            )
+            self.metrics.finish(row)
@@ -0,0 +1,498 @@
+"""
+Mean Sentinel-2 vegetation and water indices around every household
+
+    python -m ukroutes.zonal --raster data/raw/sentinel2/sentinel2_2024.tif \
+        --points data/raw/os_toids/toids_cm_osgb.parquet --radius 300
+
+A local replacement for the Earth Engine step of
+``satellites/green_space_sentinel2.ipynb``. The composite exported from Earth
+Engine (with ``crs="EPSG:27700"``) is read once, a window of rows at a time,
+into memory mapped NDVI, EVI and NDWI arrays (see ``IndexRaster``). The mean of
+each index within ``--radius`` metres of every point is then summed from
+per-row prefix sums of one tile of the raster at a time, in parallel, and
+written as Parquet with a row per TOID, to be joined to the UPRN lookup as in
+``satellites/check_toids.R``.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from numpy.lib.format import open_memmap
+from rich.progress import track
+
+from ukroutes.common.logger import logger, setup_logging
+from ukroutes.common.utils import Paths, file_stamps
+
+INDICES = ("NDVI", "EVI", "NDWI")
+# Sentinel-2 band of each reflectance the indices use
+BANDS = {"blue": "B2", "green": "B3", "red": "B4", "nir": "B8"}
+# bump when the layout of a saved raster changes
+ZONAL_STORE_VERSION = 1
+
+# set in the parent before forking so workers share the memory mapped raster
+_WORKER_RASTER: IndexRaster | None = None
+
+
+def spectral_indices(blue, green, red, nir) -> dict[str, np.ndarray]:
+    """
+    NDVI, EVI and NDWI from surface reflectance, as in the notebook
+
+    Pixels that are masked (``NaN``) in a band used, or where an index is
+    undefined, are ``NaN``.
+    """
+    with np.errstate(divide="ignore", invalid="ignore"):
+        indices = {
+            "NDVI": (nir - red) / (nir + red),
+            "EVI": 2.5 * (nir - red) / (nir + 6 * red - 7.5 * blue + 1),
+            "NDWI": (green - nir) / (green + nir),
+        }
+    return {
+        name: np.where(np.isfinite(index), index, np.nan).astype(np.float32)
+        for name, index in indices.items()
+    }
+
+
+def _disc_sums(
+    prefix: np.ndarray,
+    window: tuple[int, int],
+    fx: np.ndarray,
+    fy: np.ndarray,
+    radius: float,
+) -> np.ndarray:
+    """
+    Sums of the pixels whose centres are within ``radius`` pixels of each point
+
+    ``prefix`` holds, for each of a stack of layers, the running sum along each
+    row of a window of the raster starting at pixel ``window``, with a leading
+    zero column, so each row of a disc is one difference. ``fx``/``fy`` is the
+    position of each point in pixels. The columns each row of the disc covers
+    are found once and looked up in every layer.
+    """
+    layers, rows, columns = prefix.shape
+    flat = prefix.reshape(layers, -1)
+    total = np.zeros((layers, len(fx)))
+    row = np.floor(fy).astype(np.int64)
+    reach = int(np.ceil(radius)) + 1
+    for offset in range(-reach, reach + 1):
+        i = row + offset
+        dy = i + 0.5 - fy
+        half = np.sqrt(np.maximum(radius**2 - dy**2, 0))
+        low = np.maximum(np.ceil(fx - half - 0.5).astype(np.int64) - window[1], 0)
+        high = np.minimum(
+            np.floor(fx + half - 0.5).astype(np.int64) - window[1] + 1, columns - 1
+        )
+        i = i - window[0]
+        keep = np.flatnonzero(
+            (np.abs(dy) <= radius) & (i >= 0) & (i < rows) & (high > low)
+        )
+        start = i[keep] * columns
+        total[:, keep] += flat[:, start + high[keep]] - flat[:, start + low[keep]]
+    return total
+
+
+class IndexRaster:
+    """
+    Index bands of a raster on the British National Grid
+
+    ``arrays`` holds one 2D array per index, ``NaN`` where there is no data,
+    with pixel ``(0, 0)`` at the north west corner ``origin`` and square
+    pixels of ``pixel`` metres. Saved arrays are plain ``.npy`` files opened
+    memory mapped, so the raster is read from disk a tile at a time and shared
+    by worker processes.
+    """
+
+    def __init__(
+        self,
+        arrays: dict[str, np.ndarray],
+        origin: tuple[float, float],
+        pixel: float,
+    ):
+        self.arrays: dict[str, np.ndarray] = arrays
+        self.origin: tuple[float, float] = origin
+        self.pixel: float = pixel
+        self.shape: tuple[int, int] = next(iter(arrays.values())).shape
+
+    @classmethod
+    def from_geotiff(
+        cls,
+        path: Path,
+        store: Path,
+        scale: float | None = None,
+        bands: dict[str, int] | None = None,
+        block_rows: int = 512,
+    ) -> IndexRaster:
+        """
+        Compute the index bands of a GeoTIFF into ``store``, once
+
+        Bands are found by their descriptions: the indices themselves if the
+        composite already has them, as the notebook exports, or else the
+        Sentinel-2 reflectance bands in ``BANDS``. The raster is read
+        ``block_rows`` rows at a time into memory mapped arrays, so it never
+        has to fit in memory. The store is reused while the file is unchanged.
+
+        Parameters
+        ----------
+        scale : float, optional
+            Factor from pixel values to reflectance, by default 1e-4 for
+            integer rasters (Sentinel-2 digital numbers) and 1 otherwise
+        bands : dict[str, int], optional
+            Band number (from 1) of each of ``BANDS``, for rasters without
+            band descriptions
+        """
+        try:
+            import rasterio
+            from rasterio.windows import Window
+        except ImportError:
+            raise ImportError(
+                "Reading GeoTIFFs needs rasterio, install the zonal extra with "
+                "pip install 'ukroutes[zonal]' (or pip install -e '.[zonal]' from a "
+                "checkout)"
+            ) from None
+
+        store = Path(store)
+        sources = {"files": file_stamps([path]), "scale": scale, "bands": bands}
+        if (raster := cls.load(store, sources)) is not None:
+            logger.info(f"Index bands loaded from {store}.")
+            return raster
+
+        t1 = time.time()
+        with rasterio.open(path) as src:
+            if src.crs is None or src.crs.to_epsg() != 27700:
+                raise ValueError(
+                    f"{path} is in {src.crs}, export it with crs='EPSG:27700' or "
+                    "reproject it to the British National Grid first"
+                )
+            transform = src.transform
+            if transform.b != 0 or transform.d != 0 or transform.a != -transform.e:
+                raise ValueError(f"{path} must be north up with square pixels")
+            names = {name: i + 1 for i, name in enumerate(src.descriptions) if name}
+            if all(index in names for index in INDICES):
+                read = {index: names[index] for index in INDICES}
+            elif bands is not None or all(band in names for band in BANDS.values()):
+                read = bands or {key: names[band] for key, band in BANDS.items()}
+            else:
+                raise ValueError(
+                    f"{path} has bands {src.descriptions}, expected {INDICES} or "
+                    f"{tuple(BANDS.values())}; pass their numbers as bands"
+                )
+            if scale is None:
+                scale = 1e-4 if np.dtype(src.dtypes[0]).kind in "iu" else 1.0
+
+            store.mkdir(parents=True, exist_ok=True)
+            arrays = {
+                index: open_memmap(
+                    store / f"{index}.npy",
+                    mode="w+",
+                    dtype=np.float32,
+                    shape=(src.height, src.width),
+                )
+                for index in INDICES
+            }
+            for start in range(0, src.height, block_rows):
+                height = min(block_rows, src.height - start)
+                window = Window(0, start, src.width, height)
+                block = {
+                    name: src.read(band, window=window, masked=True)
+                    .astype(np.float64)
+                    .filled(np.nan)
+                    for name, band in read.items()
+                }
+                if set(read) != set(INDICES):
+                    block = spectral_indices(
+                        **{name: values * scale for name, values in block.items()}
+                    )
+                for index in INDICES:
+                    arrays[index][start : start + height] = block[index]
+            for array in arrays.values():
+                array.flush()
+
+        raster = cls(arrays, (transform.c, transform.f), transform.a)
+        raster.save(store, sources)
+        logger.info(
+            f"Index bands of {path} ({raster.shape[1]}x{raster.shape[0]} pixels) "
+            f"computed in {time.time() - t1:.1f} seconds."
+        )
+        return cls.load(store)
+
+    def save(self, path: Path, sources: dict | None = None) -> None:
+        """Write the arrays, if not already there, and the manifest"""
+        path = Path(path)
+        path.mkdir(parents=True, exist_ok=True)
+        for name, array in self.arrays.items():
+            file = path / f"{name}.npy"
+            if not (isinstance(array, np.memmap) and Path(array.filename) == file):
+                np.save(file, np.ascontiguousarray(array, dtype=np.float32))
+        manifest = {
+            "version": ZONAL_STORE_VERSION,
+            "origin": list(self.origin),
+            "pixel": self.pixel,
+            "bands": list(self.arrays),
+            "sources": sources or {},
+        }
+        with open(path / "manifest.json", "w") as f:
+            json.dump(manifest, f, indent=2)
+
+    @classmethod
+    def load(
+        cls, path: Path, sources: dict | None = None, mmap_mode: str | None = "r"
+    ) -> IndexRaster | None:
+        """
+        Open a raster written by ``save``
+
+        Returns ``None`` if there is none, it is of another version or, when
+        ``sources`` are given, it was built from different ones.
+        """
+        path = Path(path)
+        if not (path / "manifest.json").exists():
+            return None
+        with open(path / "manifest.json") as f:
+            manifest = json.load(f)
+        if manifest["version"] != ZONAL_STORE_VERSION or (
+            sources is not None and manifest["sources"] != sources
+        ):
+            return None
+        return cls(
+            {
+                name: np.load(path / f"{name}.npy", mmap_mode=mmap_mode)
+                for name in manifest["bands"]
+            },
+            tuple(manifest["origin"]),
+            manifest["pixel"],
+        )
+
+    def _tile_means(
+        self,
+        fx: np.ndarray,
+        fy: np.ndarray,
+        radius: float,
+        tile: tuple[int, int, int, int],
+    ) -> dict[str, np.ndarray]:
+        """Buffer means of points in one tile, given in pixels"""
+        reach = int(np.ceil(radius)) + 1
+        top, left, bottom, right = tile
+        top, left = max(top - reach, 0), max(left - reach, 0)
+        bottom = min(bottom + reach, self.shape[0])
+        right = min(right + reach, self.shape[1])
+        # values then pixels with data of each band, summed along each row
+        window = np.stack(
+            [
+                np.asarray(array[top:bottom, left:right], dtype=np.float64)
+                for array in self.arrays.values()
+            ]
+        )
+        present = ~np.isnan(window)
+        prefix = np.zeros((2 * len(window), bottom - top, right - left + 1))
+        n = len(window)
+        np.cumsum(np.where(present, window, 0.0), axis=2, out=prefix[:n, :, 1:])
+        np.cumsum(present, axis=2, out=prefix[n:, :, 1:])
+        sums = _disc_sums(prefix, (top, left), fx, fy, radius)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            means = sums[:n] / sums[n:]
+        return dict(zip(self.arrays, means))
+
+    def buffer_means(
+        self,
+        easting,
+        northing,
+        radius: float = 300.0,
+        tile_size: int = 1024,
+        n_jobs: int | None = None,
+    ) -> dict[str, np.ndarray]:
+        """
+        Mean of each band within ``radius`` metres of every point
+
+        A pixel counts if its centre is within ``radius`` of the point, and
+        ``NaN`` pixels (no data, clouds) are left out. Points are grouped by
+        tile of ``tile_size`` pixels and each tile is read with a margin of the
+        radius, turned into per-row prefix sums of the values and of the pixels
+        with data, and every point's disc summed from them a row at a time, so
+        the work per point is about two lookups per row of the disc, whatever
+        the radius. Tiles are spread over ``n_jobs`` worker processes.
+
+        Returns
+        -------
+        dict[str, np.ndarray]:
+            Mean of each band per point, ``NaN`` where its disc has no data
+        """
+        fx = (np.asarray(easting, dtype=np.float64) - self.origin[0]) / self.pixel
+        fy = (self.origin[1] - np.asarray(northing, dtype=np.float64)) / self.pixel
+        radius = radius / self.pixel
+        means = {name: np.full(len(fx), np.nan) for name in self.arrays}
+        # points whose disc misses the raster keep NaN
+        reach = radius + 1
+        valid = np.flatnonzero(
+            (fx > -reach)
+            & (fx < self.shape[1] + reach)
+            & (fy > -reach)
+            & (fy < self.shape[0] + reach)
+        )
+        tile_row = np.floor(fy[valid] / tile_size).astype(np.int64)
+        tile_col = np.floor(fx[valid] / tile_size).astype(np.int64)
+        order = np.lexsort((tile_col, tile_row))
+        valid, tile_row, tile_col = valid[order], tile_row[order], tile_col[order]
+        splits = np.flatnonzero(np.diff(tile_row) | np.diff(tile_col)) + 1
+        groups = [
+            (
+                points,
+                (
+                    r * tile_size,
+                    c * tile_size,
+                    (r + 1) * tile_size,
+                    (c + 1) * tile_size,
+                ),
+            )
+            for points, r, c in zip(
+                np.split(valid, splits),
+                tile_row[np.r_[0, splits]] if len(valid) else [],
+                tile_col[np.r_[0, splits]] if len(valid) else [],
+            )
+        ]
+
+        n_jobs = min(n_jobs or os.cpu_count() or 1, max(len(groups), 1))
+        if n_jobs == 1:
+            for points, tile in track(groups, description="Buffer means..."):
+                result = self._tile_means(fx[points], fy[points], radius, tile)
+                for name, values in result.items():
+                    means[name][points] = values
+            return means
+
+        global _WORKER_RASTER
+        _WORKER_RASTER = self
+        try:
+            with ProcessPoolExecutor(
+                max_workers=n_jobs,
+                mp_context=multiprocessing.get_context("fork"),
+            ) as pool:
+                futures = {
+                    pool.submit(
+                        _tile_means, fx[points], fy[points], radius, tile
+                    ): points
+                    for points, tile in groups
+                }
+                for future in track(
+                    as_completed(futures),
+                    description=f"Buffer means on {n_jobs} cores...",
+                    total=len(futures),
+                ):
+                    for name, values in future.result().items():
+                        means[name][futures[future]] = values
+        finally:
+            _WORKER_RASTER = None
+        return means
+
+
+def _tile_means(fx, fy, radius, tile):
+    return _WORKER_RASTER._tile_means(fx, fy, radius, tile)
+
+
+def zonal_means(
+    raster: IndexRaster,
+    points: pd.DataFrame,
+    id_column: str = "TOID",
+    easting: str = "EASTING",
+    northing: str = "NORTHING",
+    radius: float = 300.0,
+    tile_size: int = 1024,
+    n_jobs: int | None = None,
+) -> pd.DataFrame:
+    """
+    Buffer means of every index for each point
+
+    Returns
+    -------
+    pd.DataFrame:
+        ``id_column`` and a float32 column per band of ``raster``, e.g.
+        ``NDVI``, ``EVI`` and ``NDWI``
+    """
+    t1 = time.time()
+    means = raster.buffer_means(
+        points[easting].to_numpy(),
+        points[northing].to_numpy(),
+        radius=radius,
+        tile_size=tile_size,
+        n_jobs=n_jobs,
+    )
+    logger.info(
+        f"Means within {radius:g} m of {len(points)} points in "
+        f"{time.time() - t1:.1f} seconds."
+    )
+    return pd.DataFrame(
+        {
+            id_column: points[id_column].to_numpy(),
+            **{name: values.astype(np.float32) for name, values in means.items()},
+        }
+    )
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--raster", type=Path, default=Paths.SENTINEL2)
+    parser.add_argument(
+        "--points",
+        type=Path,
+        default=Paths.TOIDS,
+        help="parquet or csv of points on the British National Grid",
+    )
+    parser.add_argument("--id-column", default="TOID")
+    parser.add_argument("--easting", default="EASTING")
+    parser.add_argument("--northing", default="NORTHING")
+    parser.add_argument("--radius", type=float, default=300.0)
+    parser.add_argument(
+        "--scale",
+        type=float,
+        help="pixel value to reflectance factor (default 1e-4 for integer rasters)",
+    )
+    parser.add_argument(
+        "--bands",
+        type=int,
+        nargs=4,
+        metavar=("BLUE", "GREEN", "RED", "NIR"),
+        help="band numbers of B2, B3, B4 and B8 if the raster has no descriptions",
+    )
+    parser.add_argument("--tile-size", type=int, default=1024)
+    parser.add_argument("--n-jobs", type=int)
+    parser.add_argument("--store", type=Path, default=Paths.SENTINEL2_STORE)
+    parser.add_argument(
+        "--output", type=Path, default=Paths.OUT_DATA / "toid_sentinel2.parquet"
+    )
+    args = parser.parse_args(argv)
+    setup_logging()
+
+    raster = IndexRaster.from_geotiff(
+        args.raster,
+        args.store,
+        scale=args.scale,
+        bands=dict(zip(BANDS, args.bands)) if args.bands else None,
+    )
+    columns = [args.id_column, args.easting, args.northing]
+    points = (
+        pd.read_csv(args.points, usecols=columns)
+        if args.points.suffix == ".csv"
+        else pd.read_parquet(args.points, columns=columns)
+    )
+    out = zonal_means(
+        raster,
+        points,
+        id_column=args.id_column,
+        easting=args.easting,
+        northing=args.northing,
+        radius=args.radius,
+        tile_size=args.tile_size,
+        n_jobs=args.n_jobs,
+    )
+    args.output.parent.mkdir(parents=True, exist_ok=True)
+    out.to_parquet(args.output, index=False)
+    logger.info(f"Index means for {len(out)} points saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()